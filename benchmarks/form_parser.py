@@ -0,0 +1,66 @@
+"""
+Benchmark ``application/x-www-form-urlencoded`` decoding, comparing
+`fugue.interceptors.http.body_params.form_parser` with the previous
+`urlparse.parse_qs` based implementation.
+
+Run with ``python benchmarks/form_parser.py``.
+"""
+import timeit
+import urllib
+from io import BytesIO
+from urlparse import parse_qs
+
+from pyrsistent import freeze, m
+
+from fugue.interceptors.http.body_params import form_parser
+
+
+def parse_qs_form_parser(request):
+    """
+    The ``parse_qs`` based form parser this benchmark is measured against.
+    """
+    encoding = request.get('character_encoding') or 'utf-8'
+    _decode = lambda x: x.decode(encoding)
+    _maybe_one = lambda x: x if len(x) > 1 else x[0] or True
+    body = request['body'].read()
+    data = {_decode(k): _maybe_one(map(_decode, v)) for k, v
+            in parse_qs(body, True).items()}
+    return request.set('form_params', freeze(data))
+
+
+def bulk_edit_form(rows, columns=5):
+    """
+    Encode a form resembling a bulk edit screen: ``rows`` rows of
+    ``columns`` fields, a few with values that need unquoting, and a repeated
+    selection field.
+    """
+    fields = []
+    for row in range(rows):
+        for column in range(columns):
+            fields.append(
+                (b'row-{}-col-{}'.format(row, column),
+                 b'value {} & {}'.format(row, column) if column == 0 else
+                 b'{}'.format(row * column)))
+        fields.append((b'selected', b'{}'.format(row)))
+    return urllib.urlencode(fields)
+
+
+def bench(name, parser, body, number):
+    def _run():
+        parser(m(body=BytesIO(body)))
+    best = min(timeit.repeat(_run, repeat=5, number=number))
+    print '  {:<12} {:8.2f} ms'.format(name, best / number * 1000)
+
+
+def main():
+    for rows in [100, 1000, 5000]:
+        body = bulk_edit_form(rows)
+        number = max(1, 2000 // rows)
+        print '{} rows ({} fields, {} bytes):'.format(
+            rows, rows * 6, len(body))
+        bench('parse_qs', parse_qs_form_parser, body, number)
+        bench('form_parser', form_parser(), body, number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark the available `fugue.json_backend` backends, decoding and encoding
+a document resembling a typical API payload.
+
+Run with ``python benchmarks/json_backend.py`` on each interpreter of
+interest.
+"""
+import platform
+import timeit
+
+from pyrsistent import freeze, PMap, PVector
+
+from fugue.json_backend import BACKENDS, DEFAULT_BACKEND
+
+
+def api_payload(rows):
+    """
+    Construct a document of ``rows`` records.
+    """
+    return {
+        u'count': rows,
+        u'results': [
+            {u'id': i,
+             u'name': u'Item \N{SNOWMAN} {}'.format(i),
+             u'price': i * 1.25,
+             u'tags': [u'a', u'b', u'c'],
+             u'active': i % 2 == 0,
+             u'parent': None}
+            for i in range(rows)]}
+
+
+def thaw_default(obj):
+    """
+    ``default`` hook for encoding `pyrsistent` structures.
+    """
+    if isinstance(obj, PMap):
+        return dict(obj)
+    elif isinstance(obj, PVector):
+        return list(obj)
+    raise TypeError(obj)
+
+
+def bench(f, number):
+    return min(timeit.repeat(f, repeat=5, number=number)) / number * 1000
+
+
+def main():
+    print '{} {}, default backend: {}'.format(
+        platform.python_implementation(), platform.python_version(),
+        DEFAULT_BACKEND.name)
+    payload = api_payload(5000)
+    frozen = freeze(payload)
+    number = 20
+    print '  {:<12} {:>10} {:>10} {:>14}'.format(
+        'backend', 'loads', 'dumps', 'dumps frozen')
+    for name, factory in sorted(BACKENDS.items()):
+        try:
+            backend = factory()
+        except ImportError:
+            print '  {:<12} unavailable'.format(name)
+            continue
+        data = backend.dumps(payload)
+        print '  {:<12} {:7.2f} ms {:7.2f} ms {:11.2f} ms'.format(
+            name,
+            bench(lambda: backend.loads(data), number),
+            bench(lambda: backend.dumps(payload), number),
+            bench(lambda: backend.dumps(frozen, thaw_default), number))
+
+
+if __name__ == '__main__':
+    main()
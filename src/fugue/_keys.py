@@ -11,3 +11,5 @@ STACK = _ns('stack')
 ERROR = _ns('error')
 SUPPRESSED = _ns('suppressed')
 TERMINATORS = _ns('terminators')
+DEADLINE = _ns('deadline')
+DISCONNECTED = _ns('disconnected')
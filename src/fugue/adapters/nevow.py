@@ -1,8 +1,9 @@
 from __future__ import absolute_import
 
-from pyrsistent import pmap, v
+from pyrsistent import m, pmap, v
 
-from fugue.chain import execute
+from fugue.adapters.twisted import _execute_request
+from fugue.chain import enqueue
 from fugue.interceptors.nevow import nevow, NEVOW_REQUEST
 
 
@@ -29,31 +30,38 @@ def _import_nevow():
 
     @implementer(IResource)
     class _NevowAdapterResource(object):
-        def __init__(self, interceptors):
-            self._interceptors = interceptors
+        def __init__(self, interceptors, base_context=m()):
+            # The chain is the same for every request, only the request
+            # differs.
+            self._context = enqueue(
+                pmap(base_context), v(nevow()) + v(*interceptors))
 
         def locateChild(self, ctx, segments):
             return self, ()
 
         def renderHTTP(self, nevow_ctx):
-            context = pmap({
-                NEVOW_REQUEST: IRequest(nevow_ctx),
-            })
-            d = execute(context, v(nevow()) + self._interceptors)
+            request = IRequest(nevow_ctx)
+            d = _execute_request(
+                request, self._context.set(NEVOW_REQUEST, request))
             d.addCallback(lambda _: b'')
             return d
 
 
-def nevow_adapter_resource(interceptors=v()):
+def nevow_adapter_resource(interceptors=v(), base_context=m()):
     """
     Create a Nevow ``IResource`` that executes a context and avoids as much
     Nevow machinery as possible.
 
     A ~`fugue.interceptors.nevow.nevow` interceptor will be attached to the
     front of the queue to facilitate the interaction with Nevow.
+
+    :type interceptors: ``Iterable[Interceptor]``
+    :param interceptors: Interceptors to execute for every request.
+    :param base_context: Map of values that every request's context starts
+    with, such as shared services or configuration.
     """
     _import_nevow()
-    return _NevowAdapterResource(interceptors)
+    return _NevowAdapterResource(interceptors, base_context)
 
 
 __all__ = ['nevow_adapter_resource']
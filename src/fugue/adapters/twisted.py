@@ -1,24 +1,59 @@
 from __future__ import absolute_import
 
-from pyrsistent import pmap, v
+from pyrsistent import m, pmap, v
+from twisted.internet.defer import CancelledError
 from twisted.web.resource import IResource
 from twisted.web.server import NOT_DONE_YET
 from zope.interface import implementer
 
-from fugue.chain import execute
+from fugue._keys import DISCONNECTED
+from fugue.chain import enqueue, execute
 from fugue.interceptors.twisted import twisted, TWISTED_REQUEST
 
 
+def _execute_request(request, context):
+    """
+    Execute a request's context, cancelling the execution if the client
+    disconnects before the response is finished.
+
+    Cancelling propagates to whichever stage the execution is waiting on,
+    which fails with `CancelledError`, so the remaining "enter" stages are
+    skipped while the "error" stages still run. Stages can find out whether
+    the client has disconnected by calling the function at `DISCONNECTED` in
+    the context.
+
+    :param request: Twisted request.
+    :param context: Context.
+    :rtype: Deferred
+    :return: Resulting context, or ``None`` if the execution was cancelled.
+    """
+    def _cancelled(f):
+        f.trap(CancelledError)
+
+    def _lost(_):
+        lost.append(True)
+        d.cancel()
+    lost = []
+    # Registered first, so that it is also notified if the response is
+    # finished during execution.
+    finished = request.notifyFinish()
+    d = execute(context.set(DISCONNECTED, lambda: bool(lost)))
+    finished.addErrback(_lost)
+    return d.addErrback(_cancelled)
+
+
 @implementer(IResource)
 class _TwistedAdapterResource(object):
     isLeaf = True
 
-    def __init__(self, interceptors):
-        self._interceptors = interceptors
+    def __init__(self, interceptors, base_context=m()):
+        # The chain is the same for every request, only the request differs.
+        self._context = enqueue(
+            pmap(base_context), v(twisted()) + v(*interceptors))
 
     def render(self, request):
-        context = pmap({TWISTED_REQUEST: request})
-        execute(context, v(twisted()) + self._interceptors)
+        _execute_request(
+            request, self._context.set(TWISTED_REQUEST, request))
         return NOT_DONE_YET
 
     def putChild(self, path, child):
@@ -31,15 +66,20 @@ class _TwistedAdapterResource(object):
         return self
 
 
-def twisted_adapter_resource(interceptors=v()):
+def twisted_adapter_resource(interceptors=v(), base_context=m()):
     """
     Create a Twisted ``IResource`` that executes a context and avoids as much
     Twisted machinery as possible.
 
     A ~`fugue.interceptors.twisted.twisted` interceptor will be attached to the
     front of the queue to facilitate the interaction with Twisted.
+
+    :type interceptors: ``Iterable[Interceptor]``
+    :param interceptors: Interceptors to execute for every request.
+    :param base_context: Map of values that every request's context starts
+    with, such as shared services or configuration.
     """
-    return _TwistedAdapterResource(interceptors)
+    return _TwistedAdapterResource(interceptors, base_context)
 
 
 __all__ = ['twisted_adapter_resource']
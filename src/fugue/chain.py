@@ -1,9 +1,12 @@
 import uuid
 
 from pyrsistent import dq, field, PRecord, v
-from twisted.internet.defer import maybeDeferred, succeed
+from twisted.internet.defer import (
+    CancelledError, fail, maybeDeferred, succeed)
+from twisted.python.failure import Failure
 
-from fugue._keys import ERROR, EXECUTION_ID, QUEUE, STACK, SUPPRESSED, TERMINATORS
+from fugue._keys import (
+    DEADLINE, ERROR, EXECUTION_ID, QUEUE, STACK, SUPPRESSED, TERMINATORS)
 
 
 class Error(PRecord):
@@ -16,6 +19,28 @@ class Error(PRecord):
     stage = field(mandatory=True, type=(str, unicode))
 
 
+class DeadlineExceeded(Exception):
+    """
+    The deadline of a context's execution passed before an "enter" stage
+    completed.
+    """
+
+
+class Deadline(PRecord):
+    """
+    The time by which the "enter" stages of a context's execution must
+    complete, see `DEADLINE`.
+    """
+    expires = field(mandatory=True)
+    clock = field(mandatory=True)
+
+    def remaining(self):
+        """
+        Number of seconds left until the deadline, which may be negative.
+        """
+        return self.expires - self.clock.seconds()
+
+
 def enqueue(context, interceptors):
     """
     Add interceptors to the end of a context's execution queue.
@@ -80,11 +105,57 @@ def _try_f(context, interceptor, stage):
     fn = getattr(interceptor, stage)
     if fn is None:
         return succeed(context)
-    d = maybeDeferred(fn, context)
+    deadline = context.get(DEADLINE) if stage == 'enter' else None
+    if deadline is None:
+        d = maybeDeferred(fn, context)
+    else:
+        d = _call_with_deadline(deadline, fn, context)
     d.addErrback(_eb, context)
     return d
 
 
+def _deadline_exceeded(result, timeout):
+    """
+    Translate the cancellation of a stage that timed out into
+    `DeadlineExceeded`.
+    """
+    if isinstance(result, Failure):
+        result.trap(CancelledError)
+        raise DeadlineExceeded(
+            'Stage did not complete within {} seconds'.format(timeout))
+    return result
+
+
+def _call_with_deadline(deadline, fn, context):
+    """
+    Call a stage function, if the deadline has not passed, cancelling its
+    asynchronous result if the deadline passes before it completes.
+
+    :rtype: Deferred
+    """
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        return fail(DeadlineExceeded('Deadline passed'))
+    d = maybeDeferred(fn, context)
+    if d.called:
+        return d
+    timed_out = []
+
+    def _time_out():
+        timed_out.append(True)
+        d.cancel()
+
+    def _done(result):
+        if call.active():
+            call.cancel()
+        if timed_out:
+            return _deadline_exceeded(result, remaining)
+        return result
+    # Not `Deferred.addTimeout`, which needs a newer Twisted than we support.
+    call = deadline.clock.callLater(remaining, _time_out)
+    return d.addBoth(_done)
+
+
 def _try_error(context, interceptor):
     """
     Invoke an interceptor has an error stage, if it exists, on a context and
@@ -239,6 +310,11 @@ def execute(context, interceptors=None):
     asynchronous result and execution of the context will be paused until the
     result is delivered.
 
+    If the context has a `Deadline`, at `DEADLINE`, an "enter" stage that
+    begins after it has passed fails with `DeadlineExceeded` and one whose
+    asynchronous result is not delivered by then is cancelled, and fails the
+    same way.
+
     :param context: Context.
     :type interceptors: ``Iterable[Interceptor]``
     :param interceptors: Interceptors to optionally enqueue.
@@ -260,4 +336,6 @@ def execute(context, interceptors=None):
     return d
 
 
-__all__ = ['enqueue', 'terminate', 'terminate_when', 'execute']
+__all__ = [
+    'enqueue', 'terminate', 'terminate_when', 'execute', 'Deadline',
+    'DeadlineExceeded']
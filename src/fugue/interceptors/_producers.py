@@ -0,0 +1,187 @@
+"""
+Writing response bodies to a Twisted consumer, such as a request, with flow
+control.
+"""
+from __future__ import absolute_import
+
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.error import ConnectionLost
+from twisted.internet.interfaces import IPushProducer
+from twisted.protocols.basic import FileSender
+from twisted.python.failure import Failure
+from twisted.web.iweb import IBodyProducer
+from zope.interface import implementer
+
+from fugue.interceptors.http.files import FileBody
+
+
+def _close(obj):
+    """
+    Close an object, if it can be closed.
+    """
+    close = getattr(obj, 'close', None)
+    if close is not None:
+        close()
+
+
+@implementer(IPushProducer)
+class _IteratorProducer(object):
+    """
+    Push producer that writes the chunks of an iterable to a consumer, for as
+    long as the consumer has not paused it.
+
+    Chunks that are not yet available can be given as a `Deferred`, the next
+    chunk is only requested once it has fired.
+    """
+    def __init__(self, iterable, consumer):
+        """
+        :param iterable: Iterable of `bytes` chunks, or `Deferred`s that fire
+        with them.
+        :param consumer: `IConsumer` provider.
+        """
+        self._iterator = iter(iterable)
+        self._consumer = consumer
+        self._paused = False
+        self._producing = False
+        self._waiting = None
+        self._deferred = Deferred(lambda _: self.stopProducing())
+
+    def start(self):
+        """
+        Register with the consumer and begin producing.
+
+        :rtype: Deferred
+        :return: Fires when the iterable is exhausted, or fails if iterating
+        fails or production is stopped.
+        """
+        self._consumer.registerProducer(self, True)
+        self.resumeProducing()
+        return self._deferred
+
+    def _finish(self, result, unregister=True):
+        """
+        Stop iterating and deliver the result.
+        """
+        iterator, self._iterator = self._iterator, None
+        if iterator is None:
+            return
+        waiting, self._waiting = self._waiting, None
+        if waiting is not None:
+            waiting.cancel()
+        _close(iterator)
+        if unregister:
+            self._consumer.unregisterProducer()
+        self._deferred.callback(result)
+
+    def _produce(self):
+        """
+        Write chunks until the producer is paused, a chunk is not yet
+        available or the iterable is exhausted.
+        """
+        # Writing can synchronously pause and resume the producer.
+        if self._producing:
+            return
+        self._producing = True
+        try:
+            while (not self._paused and self._waiting is None and
+                   self._iterator is not None):
+                try:
+                    chunk = next(self._iterator)
+                except StopIteration:
+                    self._finish(None)
+                except Exception:
+                    self._finish(Failure())
+                else:
+                    if isinstance(chunk, Deferred):
+                        self._wait(chunk)
+                    elif chunk:
+                        self._consumer.write(chunk)
+        finally:
+            self._producing = False
+
+    def _wait(self, d):
+        """
+        Wait for a chunk that is not yet available.
+        """
+        def _available(chunk):
+            if self._waiting is d:
+                self._waiting = None
+                if chunk:
+                    self._consumer.write(chunk)
+                self._produce()
+
+        def _failed(f):
+            if self._waiting is d:
+                self._waiting = None
+                self._finish(f)
+        self._waiting = d
+        d.addCallbacks(_available, _failed)
+
+    def resumeProducing(self):
+        self._paused = False
+        self._produce()
+
+    def pauseProducing(self):
+        self._paused = True
+
+    def stopProducing(self):
+        # The consumer is going away, there is nothing left to unregister from.
+        self._finish(
+            Failure(ConnectionLost('Response body stopped')),
+            unregister=False)
+
+
+def _produce(producer, consumer):
+    """
+    Write the output of an `IBodyProducer` to a consumer.
+    """
+    def _unregister(_):
+        consumer.unregisterProducer()
+    consumer.registerProducer(producer, True)
+    return producer.startProducing(consumer).addCallback(_unregister)
+
+
+def _send_file(fileobj, consumer):
+    """
+    Write the contents of a file-like object to a consumer.
+    """
+    def _closed(result):
+        _close(fileobj)
+        return result
+    d = FileSender().beginFileTransfer(fileobj, consumer)
+    return d.addBoth(_closed).addCallback(lambda _: None)
+
+
+def write_body(consumer, body):
+    """
+    Write a response body to a consumer, honouring its flow control.
+
+    :param consumer: `IConsumer` provider, usually a Twisted request.
+    :param body: ``None``, `bytes`, a `FileBody`, an `IBodyProducer`
+    provider, a file-like object or an iterable of `bytes` chunks or
+    `Deferred`s that fire with them. File-like objects and iterables are
+    closed once written, if possible.
+    :raise TypeError: If the body is none of the supported types.
+    :rtype: Deferred
+    :return: Fires once the body has been written, or fails if producing it
+    fails part of the way through.
+    """
+    if body is None:
+        return succeed(None)
+    if isinstance(body, bytes):
+        if body:
+            consumer.write(body)
+        return succeed(None)
+    if isinstance(body, FileBody):
+        return _send_file(body.open(), consumer)
+    if IBodyProducer.providedBy(body):
+        return _produce(body, consumer)
+    if callable(getattr(body, 'read', None)):
+        return _send_file(body, consumer)
+    if isinstance(body, unicode) or not hasattr(body, '__iter__'):
+        raise TypeError(
+            'Unsupported response body type: {!r}'.format(type(body)))
+    return _IteratorProducer(body, consumer).start()
+
+
+__all__ = ['write_body']
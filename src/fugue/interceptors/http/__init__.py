@@ -1,4 +1,15 @@
 from .body_params import body_params
+from .cache import response_cache
+from .coalesce import coalesce
+from .conditional import conditional
+from .content_encoding import compress_response, decompress_body
+from .deadline import deadline
+from .files import file_response
+from .json_response import json_response
+from .sse import event_stream_response
 
 
-__all__ = ['body_params']
+__all__ = [
+    'body_params', 'coalesce', 'conditional', 'compress_response',
+    'deadline', 'decompress_body', 'event_stream_response', 'file_response',
+    'json_response', 'response_cache']
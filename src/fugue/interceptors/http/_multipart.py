@@ -0,0 +1,259 @@
+"""
+Incremental ``multipart/form-data`` reading.
+
+`multipart.MultipartParser` buffers every part in full before producing it,
+with little control over where. `MultipartReader` produces parts as soon as
+their headers have been read and reads their bodies directly from the
+underlying stream, leaving it to the caller to decide what to do with them.
+"""
+import tempfile
+from io import BytesIO
+
+from multipart import MultipartError, parse_options_header
+from pyrsistent import m, pmap
+
+
+_CRLF = b'\r\n'
+
+
+class MultipartReader(object):
+    """
+    Incremental reader for a ``multipart/form-data`` body.
+
+    At most about ``buffer_size`` bytes of the body are buffered at a time,
+    regardless of the size of the parts.
+    """
+    def __init__(self, fileobj, boundary, buffer_size=2 ** 16,
+                 max_header_size=2 ** 14):
+        """
+        :param fileobj: File-like object to read from.
+        :param bytes boundary: Multipart boundary.
+        :param int buffer_size: Number of bytes to read at a time.
+        :param int max_header_size: Maximum size of a part's headers.
+        """
+        self._read = fileobj.read
+        self._delimiter = _CRLF + b'--' + boundary
+        self._buffer_size = max(buffer_size, len(self._delimiter))
+        self._max_header_size = max_header_size
+        # A leading CRLF gives the first boundary the same form as the others,
+        # any preamble is discarded.
+        self._buf = _CRLF
+
+    def _fill(self):
+        """
+        Read more of the stream into the buffer.
+
+        :raise MultipartError: If the end of the stream has been reached.
+        """
+        data = self._read(self._buffer_size)
+        if not data:
+            raise MultipartError('Unexpected end of multipart stream.')
+        self._buf += data
+
+    def _find(self, s, limit):
+        """
+        Find the index of ``s`` in the buffer, reading more if necessary.
+        """
+        while True:
+            i = self._buf.find(s)
+            if i >= 0:
+                return i
+            if len(self._buf) > limit:
+                raise MultipartError('Multipart headers too large.')
+            self._fill()
+
+    def read_body(self, size=-1):
+        """
+        Read up to ``size`` bytes of the current part's body, or whatever is
+        available if ``size`` is negative.
+
+        :rtype: bytes
+        :return: Body data, which is only empty at the end of the part.
+        """
+        delimiter = self._delimiter
+        while True:
+            buf = self._buf
+            i = buf.find(delimiter)
+            if i >= 0:
+                available = i
+            else:
+                # Keep enough back to recognise a delimiter split across reads.
+                available = len(buf) - len(delimiter) + 1
+            if i >= 0 or available > 0:
+                n = available if size < 0 else min(available, size)
+                self._buf = buf[n:]
+                return buf[:n]
+            self._fill()
+
+    def _read_headers(self):
+        """
+        Read a part's header block.
+
+        :rtype: List[Tuple[unicode, unicode]]
+        """
+        while len(self._buf) < 2:
+            self._fill()
+        if self._buf[:2] == _CRLF:
+            block, self._buf = b'', self._buf[2:]
+        else:
+            i = self._find(_CRLF * 2, self._max_header_size)
+            block, self._buf = self._buf[:i], self._buf[i + 4:]
+        headers = []
+        for line in block.decode('latin1').split(u'\r\n'):
+            if not line:
+                continue
+            if line[0] in u' \t' and headers:
+                name, value = headers.pop()
+                headers.append((name, value + line.strip()))
+            elif u':' not in line:
+                raise MultipartError('Syntax error in header: No colon.')
+            else:
+                name, value = line.split(u':', 1)
+                headers.append((name.strip(), value.strip()))
+        return headers
+
+    def parts(self):
+        """
+        Iterate the parts of the body, as pairs of a header list and a
+        file-like object for reading that part's body.
+
+        Each part's body is only readable until the next part is produced,
+        any of it that was not read is skipped.
+
+        :rtype: Iterator[Tuple[List[Tuple[unicode, unicode]], _PartBody]]
+        """
+        while self.read_body(self._buffer_size):
+            pass
+        while True:
+            self._buf = self._buf[len(self._delimiter):]
+            while len(self._buf) < 2:
+                self._fill()
+            if self._buf[:2] == b'--':
+                return
+            # Skip any transport padding after the boundary.
+            i = self._find(_CRLF, self._max_header_size)
+            self._buf = self._buf[i + 2:]
+            body = _PartBody(self)
+            yield self._read_headers(), body
+            body.close()
+            while self.read_body(self._buffer_size):
+                pass
+
+
+class _PartBody(object):
+    """
+    File-like object for reading the body of a single part from a
+    `MultipartReader`.
+    """
+    def __init__(self, reader):
+        self._reader = reader
+        self.closed = False
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError('Part body is no longer readable')
+        if size == 0:
+            return b''
+        if size is not None and size > 0:
+            return self._reader.read_body(size)
+        return b''.join(iter(self._reader.read_body, b''))
+
+    def close(self):
+        self.closed = True
+
+
+def part_info(headers, charset='latin1'):
+    """
+    Interpret a part's headers.
+
+    :param headers: List of header name and value pairs.
+    :param charset: Default character encoding.
+    :rtype: pmap
+    :return: Map of ``disposition``, ``name``, ``filename``, ``content_type``,
+    ``character_encoding`` and ``headers``.
+    """
+    lookup = {name.lower(): value for name, value in headers}
+    disposition = lookup.get(u'content-disposition')
+    if not disposition:
+        raise MultipartError('Content-Disposition header is missing.')
+    disposition, options = parse_options_header(disposition)
+    content_type, type_options = parse_options_header(
+        lookup.get(u'content-type', u''))
+    return m(
+        disposition=disposition,
+        name=options.get('name'),
+        filename=options.get('filename'),
+        content_type=content_type or None,
+        character_encoding=type_options.get('charset') or charset,
+        headers=pmap(headers))
+
+
+class MemoryBudget(object):
+    """
+    Number of bytes that may still be held in memory.
+    """
+    def __init__(self, limit):
+        self.remaining = limit
+
+    def take(self, n):
+        """
+        Take ``n`` bytes from the budget, if there are enough left.
+
+        :rtype: bool
+        """
+        if n > self.remaining:
+            return False
+        self.remaining -= n
+        return True
+
+    def give(self, n):
+        """
+        Return ``n`` bytes to the budget.
+        """
+        self.remaining += n
+
+
+def spool(body, budget, memfile_limit, spool_dir=None, buffer_size=2 ** 16):
+    """
+    Copy a part's body into memory, or a temporary file once it exceeds
+    ``memfile_limit`` or the memory budget runs out.
+
+    :param body: File-like part body.
+    :param MemoryBudget budget: Memory budget shared by all parts of a request.
+    :param int memfile_limit: Maximum size of a part kept in memory.
+    :param spool_dir: Directory to create temporary files in, ``None`` for
+    the system default.
+    :param int buffer_size: Number of bytes to copy at a time.
+    :rtype: Tuple[file, int]
+    :return: File-like object positioned at the start, and its size.
+    """
+    f = BytesIO()
+    in_memory = True
+    size = 0
+    while True:
+        chunk = body.read(buffer_size)
+        if not chunk:
+            break
+        if in_memory and (size + len(chunk) > memfile_limit or
+                          not budget.take(len(chunk))):
+            in_memory = False
+            budget.give(size)
+            f, old = tempfile.TemporaryFile(dir=spool_dir), f
+            f.write(old.getvalue())
+        f.write(chunk)
+        size += len(chunk)
+    f.seek(0)
+    return f, size
+
+
+def part_value(f, charset):
+    """
+    Decode the entire contents of a spooled part, without disturbing its
+    position.
+    """
+    pos = f.tell()
+    f.seek(0)
+    try:
+        return f.read().decode(charset)
+    finally:
+        f.seek(pos)
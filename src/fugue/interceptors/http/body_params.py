@@ -1,89 +1,717 @@
 import cgi
+import codecs
 import json
-from urlparse import parse_qs
+import re
+import sys
+from functools import partial
+from json.decoder import WHITESPACE
+from urllib import unquote
 
-import multipart
-from pyrsistent import freeze, m, pmap
+from pyrsistent import field, freeze, m, pmap, PRecord, pvector
 
+from fugue._keys import ERROR, REQUEST, RESPONSE
+from fugue.json_backend import get_backend
+from fugue.lazy import delay, lazy_freeze, LazyMap
 from fugue.util import identity, namespace
-from fugue.interceptors.basic import on_request
+from fugue.interceptors.basic import Interceptor
+from fugue.interceptors.http import _multipart
 
 
 _ns = namespace(__name__)
+_PARAMS_KEYS = (
+    'json_params', 'form_params', 'multipart_params', 'multipart_parts')
+#: Key of the list of files, that should be closed once the request has been
+#: handled, on the context and the request given to parsers.
+_SPOOLED = _ns('spooled')
 
 
-def _parser_for(parsers, content_type):
+class RequestTooLarge(Exception):
     """
-    Find a parser for a particular content type.
+    A request body exceeded one of its `BodyLimits`.
 
-    :param parsers: Mapping of content types to parsing functions.
-    :param bytes content_type: Content type.
-    :return: Callable to parse the content, falls back to the identity
-    function.
+    The arguments are the name of the exceeded limit and its value.
     """
-    for expr, parser in parsers.items():
-        # XXX: Pedestal uses regexps instead of strings to match, why?
-        if expr == content_type:
+
+
+class ParseError(ValueError):
+    """
+    A request body could not be parsed, for a reason a parser reported with
+    an exception that would otherwise be mistaken for something else, such
+    as `KeyError`.
+    """
+
+
+def _optional_int():
+    return field(initial=None, type=(int, long, type(None)))
+
+
+class BodyLimits(PRecord):
+    """
+    Limits on parsing a request body, ``None`` means unlimited.
+
+    Exceeding a limit raises `RequestTooLarge`, which `body_params` turns into
+    an HTTP 413 response.
+    """
+    #: Number of bytes read from the body, also checked against the request's
+    #: ``content_length`` before reading anything.
+    max_bytes = _optional_int()
+    #: Nesting depth of a JSON document.
+    max_depth = _optional_int()
+    #: Number of fields in a ``application/x-www-form-urlencoded`` body.
+    max_fields = _optional_int()
+    #: Length, in bytes, of an undecoded value in a
+    #: ``application/x-www-form-urlencoded`` body.
+    max_value_length = _optional_int()
+    #: Number of parts in a ``multipart/form-data`` body.
+    max_parts = _optional_int()
+
+
+def _check_limit(limits, name, value):
+    """
+    Raise `RequestTooLarge` if ``value`` exceeds the limit called ``name``.
+    """
+    limit = getattr(limits, name)
+    if limit is not None and value > limit:
+        raise RequestTooLarge(name, limit)
+
+
+class _LimitedReader(object):
+    """
+    File-like wrapper that raises `RequestTooLarge` as soon as more than a
+    certain number of bytes are read from it.
+    """
+    def __init__(self, fileobj, limit):
+        self._fileobj = fileobj
+        self._limit = limit
+        self._remaining = limit
+
+    def __getattr__(self, name):
+        return getattr(self._fileobj, name)
+
+    def _limited(self, f, size):
+        """
+        Read at most one byte beyond the limit with ``f``.
+        """
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining + 1
+        data = f(size)
+        self._remaining -= len(data)
+        if self._remaining < 0:
+            raise RequestTooLarge('max_bytes', self._limit)
+        return data
+
+    def read(self, size=-1):
+        return self._limited(self._fileobj.read, size)
+
+    def readline(self, size=-1):
+        return self._limited(self._fileobj.readline, size)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+def _content_length(request):
+    """
+    The request's ``content_length`` as an integer, or ``None`` if it is
+    missing or malformed.
+    """
+    try:
+        return int(request.get('content_length'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _limit_body(request, limits):
+    """
+    Enforce the ``max_bytes`` limit on a request body, the request's
+    ``content_length`` is checked up front and the body is wrapped so that the
+    limit is also enforced while reading.
+
+    :param request: Request map.
+    :param BodyLimits limits: Limits to enforce, or ``None``.
+    :return: Updated request.
+    """
+    if limits is None or limits.max_bytes is None:
+        return request
+    content_length = _content_length(request)
+    if content_length is not None:
+        _check_limit(limits, 'max_bytes', content_length)
+    return request.set(
+        'body', _LimitedReader(request['body'], limits.max_bytes))
+
+
+def _bounded_cache(f, size=256):
+    """
+    Memoize a single-argument function, the cache is discarded once it grows
+    beyond ``size`` entries.
+
+    This is intended for values that have only a handful of distinct values in
+    practice, such as request headers, while still bounding the memory a
+    hostile client can make us spend.
+    """
+    cache = {}
+
+    def _bounded_cache_inner(arg):
+        try:
+            return cache[arg]
+        except KeyError:
+            if len(cache) >= size:
+                cache.clear()
+            result = cache[arg] = f(arg)
+            return result
+    return _bounded_cache_inner
+
+
+@_bounded_cache
+def _parse_header(value):
+    """
+    Parse a ``Content-Type``-like header value into a lowercased media type and
+    a map of its parameters.
+
+    :param bytes value: Header value.
+    :rtype: Tuple[bytes, pmap]
+    """
+    media_type, options = cgi.parse_header(value or b'')
+    return media_type.lower(), pmap(options)
+
+
+class _ParserTable(object):
+    """
+    Precompiled mapping of media types to parsers.
+
+    Exact media types (``application/json``) are resolved with a dictionary
+    lookup, structured suffix wildcards (``application/*+json``, ``*/*+xml``)
+    and media ranges (``text/*``, ``*/*``) are considered, in that order, only
+    when there is no exact match. Resolutions are cached per distinct
+    ``Content-Type`` header value.
+    """
+    def __init__(self, parsers):
+        """
+        :param parsers: Mapping of media types to parsing functions.
+        """
+        self._exact = {}
+        self._suffixes = {}
+        self._ranges = {}
+        for expr, parser in parsers.items():
+            media_type, _ = _parse_header(expr)
+            main, _, sub = media_type.partition(b'/')
+            if sub.startswith(b'*+'):
+                self._suffixes[main, sub[2:]] = parser
+            elif sub == b'*':
+                self._ranges[main] = parser
+            else:
+                self._exact[media_type] = parser
+        self.parser_for = _bounded_cache(self._resolve)
+
+    def _resolve(self, content_type):
+        """
+        Find a parser for a particular ``Content-Type`` header value.
+
+        :param bytes content_type: Content type.
+        :return: Callable to parse the content, falls back to the identity
+        function.
+        """
+        media_type, _ = _parse_header(content_type)
+        parser = self._exact.get(media_type)
+        if parser is not None:
             return parser
-    return identity
+        main, _, sub = media_type.partition(b'/')
+        if b'+' in sub:
+            suffix = sub.rsplit(b'+', 1)[1]
+            parser = (self._suffixes.get((main, suffix)) or
+                      self._suffixes.get((b'*', suffix)))
+            if parser is not None:
+                return parser
+        return self._ranges.get(main) or self._ranges.get(b'*') or identity
+
+
+def _parser_request(request, limits, spooled):
+    """
+    Prepare a request to be given to a parser.
 
+    :param request: Request map.
+    :param BodyLimits limits: Limits to enforce, or ``None``.
+    :type spooled: List[file]
+    :param spooled: List to add files that should be closed to, or ``None``.
+    """
+    request = _limit_body(request, limits)
+    if spooled is not None:
+        request = request.set(_SPOOLED, spooled)
+    return request
 
-def _parse_content_type(parsers, request):
+
+def _parse_content_type(table, limits, request, spooled=None):
     """
     Parse the content of a request with the most suitable parser.
 
-    :param parsers: Mapping of content types to parsing functions.
+    :param _ParserTable table: Content type parsers.
+    :param BodyLimits limits: Limits to enforce, or ``None``.
     :param request: Request map.
+    :type spooled: List[file]
+    :param spooled: List to add files that should be closed to, or ``None``.
     :return: Updated request.
     """
-    content_type, _ = cgi.parse_header(request['content_type'])
-    return _parser_for(parsers, content_type)(request)
+    parser = table.parser_for(request.get('content_type'))
+    if parser is identity:
+        return request
+    return parser(_parser_request(request, limits, spooled)).discard(_SPOOLED)
+
+
+def _defer_parse_content_type(table, limits, request, spooled=None,
+                              keys=_PARAMS_KEYS):
+    """
+    Defer parsing the content of a request, with the most suitable parser,
+    until one of the parameter keys is accessed.
+
+    The ``content_length`` of the request is checked against ``limits``
+    immediately.
+
+    :param _ParserTable table: Content type parsers.
+    :param BodyLimits limits: Limits to enforce, or ``None``.
+    :param request: Request map.
+    :type spooled: List[file]
+    :param spooled: List to add files that should be closed to, or ``None``.
+    :type keys: Iterable[unicode]
+    :param keys: Request keys that trigger parsing when accessed.
+    :rtype: `LazyMap`
+    :return: Updated request.
+    """
+    parser = table.parser_for(request.get('content_type'))
+    if parser is identity:
+        return request
+    limited = _parser_request(request, limits, spooled)
+
+    def _parse():
+        try:
+            return parser(limited)
+        except KeyError:
+            # `LazyMap` takes a `KeyError` to mean the key is absent, rather
+            # than parsing having failed.
+            exc_type, exc_value, tb = sys.exc_info()
+            raise ParseError, ParseError(*exc_value.args), tb
+    parsed = delay(_parse)
+    if not isinstance(request, LazyMap):
+        request = LazyMap(request)
+    for key in keys:
+        request = request.set_lazy(key, lambda key=key: parsed()[key])
+    return request
+
+
+#: Characters that affect the nesting of a JSON document, or whether the
+#: brackets that follow are inside a string.
+_JSON_STRUCTURE = re.compile(br'[][{}"\\]')
+_JSON_STRUCTURE_TEXT = re.compile(ur'[][{}"\\]')
+
+
+class _DepthCounter(object):
+    """
+    Count the nesting of an undecoded JSON document, as it is fed in, raising
+    `RequestTooLarge` once it is nested more deeply than ``max_depth``.
+
+    Brackets outside of strings are counted without decoding anything, so
+    that a document is rejected before decoding it can exhaust the stack.
+    """
+    def __init__(self, max_depth):
+        self._max_depth = max_depth
+        self._depth = 0
+        self._in_string = False
+        # Position, relative to the next data fed in, up to which characters
+        # are escaped.
+        self._escaped_until = 0
+
+    def feed(self, data):
+        """
+        Count the nesting of the next part of a document.
+
+        :param data: ASCII-compatible `bytes` or `unicode`.
+        """
+        if isinstance(data, unicode):
+            pattern = _JSON_STRUCTURE_TEXT
+        else:
+            pattern = _JSON_STRUCTURE
+        depth = self._depth
+        in_string = self._in_string
+        escaped_until = self._escaped_until
+        for match in pattern.finditer(data):
+            start = match.start()
+            if start < escaped_until:
+                continue
+            c = match.group()
+            if in_string:
+                if c == b'\\':
+                    escaped_until = start + 2
+                elif c == b'"':
+                    in_string = False
+            elif c == b'"':
+                in_string = True
+            elif c in b'[{':
+                depth += 1
+                if depth > self._max_depth:
+                    raise RequestTooLarge('max_depth', self._max_depth)
+            elif c in b']}':
+                depth -= 1
+        self._depth = depth
+        self._in_string = in_string
+        self._escaped_until = escaped_until - len(data)
+
+
+def _depth_counter(limits):
+    """
+    Create a `_DepthCounter` for ``limits``, or ``None`` if the depth is not
+    limited.
+    """
+    if limits is None or limits.max_depth is None:
+        return None
+    return _DepthCounter(limits.max_depth)
+
+
+def _ascii_compatible(encoding):
+    """
+    Is JSON in a character encoding compatible with ASCII, as far as its
+    structural characters are concerned?
+    """
+    return encoding is None or not codecs.lookup(encoding).name.startswith(
+        ('utf-16', 'utf-32'))
 
 
-def json_parser(**kw):
+def json_parser(lazy=False, limits=None, backend=None, **kw):
     """
     Create a JSON parsing request processor.
 
     The parsed result will placed into a ``json_params`` key on the request.
 
-    :param **kw: Additional keyword arguments to pass to `json.load`.
+    :param bool lazy: Expose the parsed result via `fugue.lazy.lazy_freeze`,
+    which only freezes the parts of the document that are accessed, instead of
+    freezing the entire document up front. The result then has the interface,
+    but is not an instance, of the `pyrsistent` structures.
+    :param BodyLimits limits: Limits on ``max_bytes`` and ``max_depth``.
+    :param backend: JSON backend, or its name, to decode with, see
+    `fugue.json_backend.get_backend`.
+    :param **kw: Additional keyword arguments to pass to `json.load`, the
+    standard library backend is always used when these are given.
     :return: Request processor.
     """
+    _freeze = lazy_freeze if lazy else freeze
+    if kw:
+        def _loads(data, encoding=None):
+            return json.loads(data, encoding=encoding, **kw)
+    else:
+        _loads = get_backend(backend).loads
+
     def _json_parser(request):
+        request = _limit_body(request, limits)
         encoding = request.get('character_encoding')
-        return request.set(
-            'json_params',
-            freeze(json.load(
-                request.body,
-                encoding=encoding,
-                **kw)))
+        data = request['body'].read()
+        depth = _depth_counter(limits)
+        if depth is not None:
+            depth.feed(
+                data if _ascii_compatible(encoding) else data.decode(encoding))
+        result = _loads(data, encoding)
+        return request.set('json_params', _freeze(result))
     return _json_parser
 
 
-def form_parser():
+class _JSONStream(object):
+    """
+    Incremental JSON reader over a file-like object.
+
+    Only the structure of the top-level value is scanned here, its members are
+    decoded one at a time with `json.JSONDecoder.raw_decode`, which means only
+    the member currently being decoded (and not the entire document) needs to
+    be buffered.
+    """
+    def __init__(self, fileobj, decoder, encoding=None, chunk_size=2 ** 16,
+                 limits=None):
+        """
+        :param fileobj: File-like object to read bytes from.
+        :param json.JSONDecoder decoder: Decoder for individual values.
+        :param bytes encoding: Character encoding of the bytes, defaults to
+        UTF-8.
+        :param int chunk_size: Minimum number of bytes to read at a time.
+        :param BodyLimits limits: Limit on ``max_depth``, or ``None``.
+        """
+        self._read = fileobj.read
+        self._decode_text = codecs.getincrementaldecoder(
+            encoding or 'utf-8')().decode
+        self._raw_decode = decoder.raw_decode
+        self._chunk_size = chunk_size
+        self._depth = _depth_counter(limits)
+        self._buf = u''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size):
+        """
+        Read and decode at least ``size`` more bytes, discarding text that has
+        already been consumed.
+
+        :rtype: bool
+        :return: ``False`` if the end of the stream had already been reached.
+        """
+        if self._eof:
+            return False
+        data = self._read(size)
+        self._eof = not data
+        text = self._decode_text(data, self._eof)
+        if self._depth is not None:
+            self._depth.feed(text)
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """
+        Skip whitespace and return the next character, or an empty string at
+        the end of the stream.
+        """
+        while True:
+            self._pos = WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill(self._chunk_size):
+                return u''
+
+    def _expect(self, chars):
+        """
+        Consume the next non-whitespace character, which must be one of
+        ``chars``.
+        """
+        c = self._peek()
+        if not c or c not in chars:
+            raise ValueError(
+                'Expecting one of {!r}'.format(chars), c or 'end of stream')
+        self._pos += 1
+        return c
+
+    def _value(self):
+        """
+        Decode the next complete JSON value.
+
+        Reads grow geometrically while the value is incomplete, to avoid
+        decoding a large value over and over again.
+        """
+        self._peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = self._raw_decode(self._buf, self._pos)
+            except ValueError:
+                if not self._fill(size):
+                    raise
+            else:
+                # A number may continue beyond what has been read so far.
+                if end < len(self._buf) or not self._fill(size):
+                    self._pos = end
+                    return value
+            size *= 2
+
+    def _end(self):
+        """
+        Ensure nothing but whitespace remains in the stream.
+        """
+        if self._peek():
+            raise ValueError('Extra data after JSON document')
+
+    def items(self):
+        """
+        Lazily decode the items of a top-level array.
+
+        The opening bracket is consumed immediately, so a document that is not
+        an array fails early.
+
+        :rtype: Iterator[Any]
+        """
+        def _items():
+            if self._peek() == u']':
+                self._pos += 1
+            else:
+                while True:
+                    yield self._value()
+                    if self._expect(u',]') == u']':
+                        break
+            self._end()
+        self._expect(u'[')
+        return _items()
+
+    def members(self):
+        """
+        Lazily decode the key-value pairs of a top-level object.
+
+        :rtype: Iterator[Tuple[unicode, Any]]
+        """
+        def _members():
+            if self._peek() == u'}':
+                self._pos += 1
+            else:
+                while True:
+                    if self._peek() != u'"':
+                        raise ValueError('Expecting property name')
+                    key = self._value()
+                    self._expect(u':')
+                    yield key, self._value()
+                    if self._expect(u',}') == u'}':
+                        break
+            self._end()
+        self._expect(u'{')
+        return _members()
+
+    def frozen(self):
+        """
+        Decode the entire document into a frozen structure, freezing each
+        member of the top-level value as soon as it has been decoded.
+        """
+        c = self._peek()
+        if c == u'[':
+            return pvector(freeze(x) for x in self.items())
+        elif c == u'{':
+            e = m().evolver()
+            for k, v in self.members():
+                e[k] = freeze(v)
+            return e.persistent()
+        value = freeze(self._value())
+        self._end()
+        return value
+
+
+def json_stream_parser(items=False, chunk_size=2 ** 16, limits=None, **kw):
+    """
+    Create a streaming JSON parsing request processor.
+
+    The request body is read in chunks and each member of the top-level value
+    is frozen as soon as it is decoded, bounding peak memory to roughly the
+    size of the largest member rather than several copies of the document.
+
+    The parsed result will placed into a ``json_params`` key on the request.
+
+    :param bool items: Instead of a frozen structure, place a lazy iterator
+    over the frozen items of a top-level array into ``json_params``. The body is
+    only read as the iterator is consumed, which may only happen once, and
+    any parsing errors are raised during iteration.
+    :param int chunk_size: Number of bytes to read from the body at a time.
+    :param BodyLimits limits: Limits on ``max_bytes`` and ``max_depth``.
+    :param **kw: Additional keyword arguments to pass to `json.JSONDecoder`.
+    :return: Request processor.
+    """
+    decoder = json.JSONDecoder(**kw)
+
+    def _json_stream_parser(request):
+        request = _limit_body(request, limits)
+        stream = _JSONStream(
+            request['body'],
+            decoder,
+            request.get('character_encoding'),
+            chunk_size,
+            limits)
+        if items:
+            result = (freeze(x) for x in stream.items())
+        else:
+            result = stream.frozen()
+        return request.set('json_params', result)
+    return _json_stream_parser
+
+
+def _unquote_plus(s):
+    """
+    `urllib.unquote_plus` that avoids work for values that need no unquoting.
+    """
+    if b'+' in s:
+        s = s.replace(b'+', b' ')
+    if b'%' in s:
+        s = unquote(s)
+    return s
+
+
+def _decode_form(body, encoding, limits=None):
+    """
+    Decode an ``application/x-www-form-urlencoded`` body, in a single pass,
+    into a frozen map.
+
+    Keys with a single value map to that value, or ``True`` if the value is
+    empty, and keys with several values map to a vector of them. Fields are
+    separated by ``&`` or ``;``.
+
+    :param bytes body: Encoded form.
+    :param encoding: Character encoding of the form.
+    :param BodyLimits limits: Limits on ``max_fields`` and
+    ``max_value_length``.
+    :rtype: pmap
+    """
+    max_fields = limits and limits.max_fields
+    max_value_length = limits and limits.max_value_length
+    decode = codecs.getdecoder(encoding)
+    if b';' in body:
+        body = body.replace(b';', b'&')
+    data = {}
+    repeated = []
+    count = 0
+    for field in body.split(b'&'):
+        if not field:
+            continue
+        count += 1
+        if max_fields is not None and count > max_fields:
+            raise RequestTooLarge('max_fields', max_fields)
+        key, _, value = field.partition(b'=')
+        if max_value_length is not None and len(value) > max_value_length:
+            raise RequestTooLarge('max_value_length', max_value_length)
+        key = decode(_unquote_plus(key))[0]
+        value = decode(_unquote_plus(value))[0] if value else True
+        existing = data.get(key)
+        if existing is None:
+            data[key] = value
+        elif type(existing) is list:
+            existing.append(value)
+        else:
+            data[key] = [existing, value]
+            repeated.append(key)
+    for key in repeated:
+        data[key] = pvector(v if v is not True else u'' for v in data[key])
+    return pmap(data)
+
+
+def form_parser(limits=None):
     """
     Create a form (``application/x-www-form-urlencoded``) parsing request
     processor.
 
     The parsed result will placed into a ``form_params`` key on the request.
 
-    :param encoding: Request body encoding override, ``None`` will use the
-    ``character_encoding`` value from the request and will fall back to UTF-8.
+    :param BodyLimits limits: Limits on ``max_bytes``, ``max_fields`` and
+    ``max_value_length``.
     :return: Request processor.
     """
     def _form_parser(request):
+        request = _limit_body(request, limits)
         encoding = request.get('character_encoding') or 'utf-8'
-        _decode = lambda x: x.decode(encoding)
-        _maybe_one = lambda x: x if len(x) > 1 else x[0] or True
-        data = {_decode(k): _maybe_one(map(_decode, v)) for k, v
-                in parse_qs(request.body.read(), True).items()}
         return request.set(
             'form_params',
-            freeze(data))
+            _decode_form(request['body'].read(), encoding, limits))
     return _form_parser
 
 
-def multipart_form_parser():
+def _iter_parts(request, limits, buffer_size):
+    """
+    Iterate the parts of a multipart request body, enforcing the
+    ``max_parts`` limit.
+
+    :rtype: Iterator[Tuple[pmap, file]]
+    :return: Pairs of part information, from `_multipart.part_info`, and a
+    file-like object for reading the part's body.
+    """
+    _, options = _parse_header(request['content_type'])
+    boundary = options.get('boundary')
+    if not boundary:
+        raise ParseError('Multipart body without a boundary')
+    reader = _multipart.MultipartReader(
+        request['body'], boundary, buffer_size)
+    for count, (headers, body) in enumerate(reader.parts(), 1):
+        if limits is not None:
+            _check_limit(limits, 'max_parts', count)
+        yield _multipart.part_info(headers), body
+
+
+def multipart_form_parser(limits=None, memfile_limit=2 ** 18,
+                          mem_limit=2 ** 20, spool_dir=None,
+                          buffer_size=2 ** 16):
     """
     Create a multipart form (``multipart/form-data``) parsing request
     processor.
@@ -91,46 +719,136 @@ def multipart_form_parser():
     The parsed result will placed into a ``multipart_params`` key on the request.
     Additionally, parts that are purely form data (``form-data`` disposition
     and no content type) will also be merged into a ``form_params`` key on the
-    request.
+    request, their values are only decoded when accessed.
+
+    Each part's body is spooled into memory, or into a temporary file once it
+    exceeds ``memfile_limit`` bytes or the parts of the request kept in memory
+    would exceed ``mem_limit`` bytes. When parsed by `body_params` these are
+    closed once the response has been produced, or the chain has failed.
 
+    :param BodyLimits limits: Limits on ``max_bytes`` and ``max_parts``.
+    :param int memfile_limit: Maximum size of a single part kept in memory.
+    :param int mem_limit: Maximum total size of the parts of a single request
+    kept in memory.
+    :param spool_dir: Directory in which to create temporary files, ``None``
+    for the system default.
+    :param int buffer_size: Number of bytes to read at a time.
     :return: Request processor.
     """
     def _multipart_form_parser(request):
-        _, options = cgi.parse_header(request['content_type'])
-        boundary = options['boundary']
-        parser = multipart.MultipartParser(request.body, boundary)
+        request = _limit_body(request, limits)
+        budget = _multipart.MemoryBudget(mem_limit)
         multipart_params = m().evolver()
-        form_params = m().evolver()
-        for part in parser.parts():
-            if part.disposition == 'form-data' and not part.content_type:
-                form_params[part.name] = part.value
-            multipart_params[part.name] = m(
-                content_type=part.content_type or None,
-                content_length=part.size,
-                headers=pmap(part.headerlist),
-                name=part.name,
-                filename=part.filename,
-                character_encoding=part.charset,
-                body=part.file)
-        request = request.transform(
-            ['form_params'],
-            lambda params: params.update(form_params.persistent()))
-        return request.set('multipart_params', multipart_params.persistent())
+        form_params = LazyMap(request.get('form_params') or m())
+        spooled = request.get(_SPOOLED)
+        for info, body in _iter_parts(request, limits, buffer_size):
+            f, size = _multipart.spool(
+                body, budget, memfile_limit, spool_dir, buffer_size)
+            if spooled is not None:
+                spooled.append(f)
+            if info.disposition == 'form-data' and not info.content_type:
+                form_params = form_params.set_lazy(
+                    info.name,
+                    partial(_multipart.part_value, f, info.character_encoding))
+            multipart_params[info.name] = info.discard('disposition').update(
+                m(content_length=size, body=f))
+        return request.update(m(
+            form_params=form_params,
+            multipart_params=multipart_params.persistent()))
     return _multipart_form_parser
 
 
-def default_parsers(json_options={}):
+def multipart_stream_parser(limits=None, buffer_size=2 ** 16):
+    """
+    Create a streaming multipart form (``multipart/form-data``) parsing request
+    processor.
+
+    A lazy iterator over the parts of the body will be placed into a
+    ``multipart_parts`` key on the request, parts are only read from the body
+    as the iterator is consumed, which may only happen once. Each part is a
+    map like those in ``multipart_params``, except for ``content_length``,
+    with a ``body`` that is read directly from the request body and is only
+    readable until the next part is requested; any of it that has not been
+    read is skipped.
+
+    Since parts are only read when asked for, a consumer that is slow to
+    accept data naturally applies backpressure. For example, a part can be
+    piped to an ``IConsumer`` with
+    `twisted.protocols.basic.FileSender.beginFileTransfer`, and the next part
+    requested once the returned ``Deferred`` fires.
+
+    :param BodyLimits limits: Limits on ``max_bytes`` and ``max_parts``,
+    ``max_parts`` is enforced during iteration.
+    :param int buffer_size: Number of bytes to read at a time.
+    :return: Request processor.
+    """
+    def _multipart_stream_parser(request):
+        request = _limit_body(request, limits)
+        parts = (info.discard('disposition').set('body', body)
+                 for info, body in _iter_parts(request, limits, buffer_size))
+        return request.set('multipart_parts', parts)
+    return _multipart_stream_parser
+
+
+def default_parsers(json_options={}, limits=None):
     """
     Default content type parsers.
+
+    :param json_options: Additional keyword arguments to pass to
+    `json_parser`.
+    :param BodyLimits limits: Limits to enforce in each parser.
     """
+    _json_parser = json_parser(limits=limits, **json_options)
     return {
-        b'application/json': json_parser(**json_options),
-        b'application/x-www-form-urlencoded': form_parser(),
-        b'multipart/form-data': multipart_form_parser(),
+        b'application/json': _json_parser,
+        b'application/*+json': _json_parser,
+        b'application/x-www-form-urlencoded': form_parser(limits=limits),
+        b'multipart/form-data': multipart_form_parser(limits=limits),
     }
 
 
-def body_params(parsers=None):
+_REQUEST_TOO_LARGE = m(
+    status=413,
+    headers=m(**{'Content-Type': b'text/plain'}),
+    body=b'Request entity too large')
+
+
+def _close_spooled(context):
+    """
+    Close the files that parsing the request body spooled parts into.
+    """
+    for f in context.get(_SPOOLED) or ():
+        f.close()
+    return context.discard(_SPOOLED)
+
+
+def _enter_body_params(table, limits, parse):
+    """
+    Enter stage factory for `body_params`.
+    """
+    def _enter_body_params_inner(context):
+        spooled = []
+        return context.set(_SPOOLED, spooled).transform(
+            [REQUEST],
+            lambda request: parse(table, limits, request, spooled))
+    return _enter_body_params_inner
+
+
+def _error_body_params(context, error):
+    """
+    Error stage for `body_params`.
+
+    Close any spooled files and turn `RequestTooLarge`, whether it was raised
+    while parsing eagerly or by accessing lazily parsed parameters, into an
+    HTTP 413 response.
+    """
+    context = _close_spooled(context)
+    if error.failure.check(RequestTooLarge):
+        return context.set(RESPONSE, _REQUEST_TOO_LARGE)
+    return context.set(ERROR, error)
+
+
+def body_params(parsers=None, lazy=False, limits=None):
     """
     An interceptor that attempts to parse parameters from a request body in the
     enter stage.
@@ -139,14 +857,42 @@ def body_params(parsers=None):
     which parser is used: ``json_params``, ``form_params``,
     ``multipart_params``, etc.
 
+    A request body exceeding any `BodyLimits` results in an HTTP 413 response.
+    Limits can be applied per parser, by passing them to the parser factory,
+    per interceptor or per route, by including a `body_params` interceptor
+    in a route; with ``lazy`` this takes the place of the pending parse of an
+    earlier `body_params`.
+
+    Files that multipart parts are spooled into are closed in the leave
+    stage, or the error stage, so part bodies must be read before then.
+
+    :param parsers: Mapping of media types to parsing functions, media types
+    may be wildcards such as ``text/*`` or ``application/*+json``. Defaults to
+    `default_parsers`.
+    :param bool lazy: Defer parsing until one of the ``json_params``,
+    ``form_params``, ``multipart_params`` or ``multipart_parts`` keys is first
+    accessed, the result is then remembered. Requests that are rejected
+    before their parameters are used never have their body parsed, parsing
+    errors are raised when the parameters are accessed. Testing whether a
+    parameter key is present, including with ``get``, parses the body and
+    so can raise too; a parser's `KeyError` is raised as `ParseError`.
+    :param BodyLimits limits: Limits to enforce, ``max_bytes`` is enforced
+    for any parser and the default parsers enforce all limits.
     :rtype: Interceptor.
     :return: Body-parsing interceptor.
     """
     if parsers is None:
-        parsers = default_parsers()
-    return on_request(
-        lambda request: _parse_content_type(parsers, request),
-        name=_ns('body_params'))
+        parsers = default_parsers(limits=limits)
+    table = _ParserTable(parsers)
+    parse = _defer_parse_content_type if lazy else _parse_content_type
+    return Interceptor(
+        name=_ns('body_params'),
+        enter=_enter_body_params(table, limits, parse),
+        leave=_close_spooled,
+        error=_error_body_params)
 
 
-__all__ = ['body_params', 'default_parsers', 'json_parser', 'form_parser']
+__all__ = [
+    'body_params', 'default_parsers', 'json_parser', 'json_stream_parser',
+    'form_parser', 'multipart_form_parser', 'multipart_stream_parser',
+    'BodyLimits', 'ParseError', 'RequestTooLarge']
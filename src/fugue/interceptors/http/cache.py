@@ -0,0 +1,327 @@
+"""
+In-process caching of complete responses.
+"""
+from collections import OrderedDict
+
+from pyrsistent import m, PRecord, field
+from twisted.python import log
+
+from fugue._keys import EXECUTION_ID, REQUEST, RESPONSE, STACK
+from fugue.chain import execute, terminate
+from fugue.interceptors.basic import Interceptor
+from fugue.interceptors.http.headers import (
+    _values, get_header, get_header_tokens, set_header)
+from fugue.util import namespace
+
+
+_ns = namespace(__name__)
+_CACHE_KEY = _ns('key')
+
+_SAFE_METHODS = frozenset([b'GET', b'HEAD'])
+_CACHEABLE_STATUSES = frozenset([200, 203, 204, 300, 301, 404, 405, 410])
+_UNCACHEABLE_DIRECTIVES = frozenset([b'no-store', b'no-cache', b'private'])
+#: Request headers identifying the client, whose responses are private to it.
+_CREDENTIAL_HEADERS = (b'authorization', b'cookie')
+
+
+def cache_key(headers=(), query=None, path_params=False):
+    """
+    Create a function that projects a request onto a cache key.
+
+    The request method and ``path_info`` are always part of the key. The
+    names of the request headers that are part of the key are available as
+    the ``headers`` attribute of the result, see `response_cache`.
+
+    :param headers: Names of request headers that are part of the key.
+    :param query: Names of query parameters that are part of the key, or
+    ``None`` for the entire query.
+    :param bool path_params: Are the request's ``path_params``, from routing,
+    part of the key?
+    :rtype: Callable[[pmap], Hashable]
+    """
+    headers = tuple(headers)
+    if query is not None:
+        query = tuple(query)
+
+    def _cache_key(request):
+        key = (request.get('request_method'), request.get('path_info'))
+        if headers:
+            request_headers = request.get('headers')
+            key += tuple(tuple(get_header(request_headers, name, ()))
+                         for name in headers)
+        uri = request.get('uri')
+        if query is None:
+            key += (tuple(uri.query) if uri is not None else (),)
+        elif query:
+            key += tuple(tuple(uri.get(name)) for name in query)
+        if path_params:
+            key += (request.get('path_params'),)
+        return key
+    _cache_key.headers = frozenset(name.lower() for name in headers)
+    return _cache_key
+
+
+def _response_size(response):
+    """
+    Approximate the memory, in bytes, used by a cached response.
+    """
+    size = 256 + len(response.get('body') or b'')
+    for name, values in (response.get('headers') or {}).items():
+        size += len(name) + sum(len(value) for value in _values(values))
+    return size
+
+
+def cacheable(response):
+    """
+    Can a response be cached?
+
+    Only responses with a complete ``bytes`` body, a cacheable status and
+    without ``Set-Cookie`` or ``Cache-Control`` directives that forbid it can
+    be.
+
+    :rtype: bool
+    """
+    headers = response.get('headers')
+    return (
+        isinstance(response.get('body', b''), bytes) and
+        response.get('status') in _CACHEABLE_STATUSES and
+        not get_header(headers, b'Set-Cookie') and
+        not _UNCACHEABLE_DIRECTIVES.intersection(
+            token.lower()
+            for token in get_header_tokens(headers, b'Cache-Control')))
+
+
+def _key_headers(key):
+    """
+    Names of the request headers that are part of a cache key, see
+    `cache_key`.
+    """
+    return getattr(key, 'headers', frozenset())
+
+
+def _private_request(request, key_headers):
+    """
+    Does a request carry credentials, in headers that are not part of its
+    cache key, making its response private to the client?
+    """
+    headers = request.get('headers')
+    return any(name not in key_headers and get_header(headers, name)
+               for name in _CREDENTIAL_HEADERS)
+
+
+def _varies_outside(response, key_headers):
+    """
+    Does a response vary, according to its ``Vary`` header, on anything other
+    than the request headers that are part of its cache key?
+    """
+    vary = [token.lower()
+            for token in get_header_tokens(response.get('headers'), b'Vary')]
+    return b'*' in vary or not key_headers.issuperset(vary)
+
+
+class _Entry(PRecord):
+    """
+    Cached response.
+    """
+    response = field(mandatory=True)
+    size = field(mandatory=True, type=int)
+    stored = field(mandatory=True)
+    expires = field(mandatory=True)
+    stale_until = field(mandatory=True)
+
+
+class ResponseCache(object):
+    """
+    Memory-bounded least recently used cache of responses, each with a limited
+    lifetime.
+    """
+    def __init__(self, max_bytes=2 ** 24, clock=None):
+        """
+        :param int max_bytes: Approximate maximum memory used by cached
+        responses, the least recently used are evicted beyond this.
+        :param clock: `IReactorTime` provider, the global reactor if
+        ``None``.
+        """
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.clock = clock
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._refreshing = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Look up an entry, that is either fresh or can still be served stale.
+
+        :rtype: `_Entry`
+        :return: Entry, or ``None`` if there is no usable entry.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        if entry.stale_until <= self.clock.seconds():
+            self.size -= entry.size
+            return None
+        self._entries[key] = entry
+        return entry
+
+    def put(self, key, response, ttl, stale_ttl=0):
+        """
+        Store a response, evicting the least recently used entries if
+        necessary.
+
+        :param response: Response map.
+        :param ttl: Number of seconds the response is fresh for.
+        :param stale_ttl: Number of seconds after expiring that the response
+        may still be served, while it is being refreshed.
+        """
+        self.discard(key)
+        size = _response_size(response)
+        if size > self.max_bytes:
+            return
+        now = self.clock.seconds()
+        self._entries[key] = _Entry(
+            response=response,
+            size=size,
+            stored=now,
+            expires=now + ttl,
+            stale_until=now + ttl + stale_ttl)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, entry = self._entries.popitem(last=False)
+            self.size -= entry.size
+
+    def discard(self, key):
+        """
+        Remove an entry, if it exists.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        self._entries.clear()
+        self.size = 0
+
+    def refresh(self, key, f):
+        """
+        Refresh an entry by calling ``f``, unless it is already being
+        refreshed.
+
+        :param f: Callable returning a `Deferred` that fires when the refresh
+        is complete.
+        """
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        d = f()
+        d.addErrback(log.err, 'Refreshing cached response failed')
+        d.addBoth(lambda _: self._refreshing.discard(key))
+
+
+def _cached_response(entry, now):
+    """
+    The response for a cache hit, with its ``Age``.
+    """
+    response = entry.response
+    return response.set(
+        'headers',
+        set_header(
+            response.get('headers') or m(),
+            b'Age',
+            bytes(max(0, int(now - entry.stored)))))
+
+
+def response_cache(key=None, ttl=60, stale_ttl=0, cache=None,
+                   cacheable=cacheable):
+    """
+    An interceptor that caches complete responses in memory.
+
+    In the enter stage the request is projected onto a cache key and, for
+    ``GET`` and ``HEAD`` requests, a cached response is served, terminating
+    the chain. Otherwise the response is cached in the leave stage, if it is
+    ``cacheable``; this interceptor should come before any that transform the
+    response body into ``bytes``, such as `json_response`, so that it sees the
+    final response.
+
+    Requests with ``Authorization`` or ``Cookie`` headers are neither served
+    from, nor stored in, the cache unless those headers are part of the cache
+    key. Responses that vary, according to their ``Vary`` header, on request
+    headers that are not part of the cache key are not cached; use
+    `cache_key` with ``headers`` to cache each variant, such as those created
+    by `compress_response`, separately.
+
+    A response that has expired can still be served for ``stale_ttl`` seconds
+    while it is refreshed, by executing the rest of the chain in the
+    background, a single refresh serves all requests for the key until it
+    completes.
+
+    :param key: Callable projecting a request onto a hashable cache key, see
+    `cache_key`. Its ``headers`` attribute, if any, names the request headers
+    that are part of the key.
+    :param ttl: Number of seconds a response is fresh for.
+    :param stale_ttl: Number of seconds after expiring that a response may be
+    served while it is refreshed.
+    :param ResponseCache cache: Cache to use, a new one with the default
+    limits if ``None``.
+    :param cacheable: Predicate taking a response map, indicating whether it
+    can be cached.
+    :rtype: Interceptor
+    """
+    if key is None:
+        key = cache_key()
+    if cache is None:
+        cache = ResponseCache()
+    key_headers = _key_headers(key)
+
+    def _store(context, cache_key):
+        response = context.get(RESPONSE)
+        if response is None:
+            return context
+        if (cacheable(response) and
+                not _varies_outside(response, key_headers)):
+            cache.put(cache_key, response, ttl, stale_ttl)
+        else:
+            cache.discard(cache_key)
+        return context
+
+    def _refresh(context, cache_key):
+        # The rest of the chain, after this interceptor, is executed as
+        # though it were a chain of its own.
+        context = context.discard(STACK).discard(EXECUTION_ID)
+        return execute(context).addCallback(_store, cache_key)
+
+    def _response_cache_enter(context):
+        request = context[REQUEST]
+        if (request.get('request_method') not in _SAFE_METHODS or
+                _private_request(request, key_headers)):
+            return context
+        cache_key = key(request)
+        entry = cache.get(cache_key)
+        if entry is None:
+            return context.set(_CACHE_KEY, cache_key)
+        now = cache.clock.seconds()
+        if entry.expires <= now:
+            cache.refresh(cache_key, lambda: _refresh(context, cache_key))
+        return terminate(
+            context.set(RESPONSE, _cached_response(entry, now)))
+
+    def _response_cache_leave(context):
+        cache_key = context.get(_CACHE_KEY)
+        if cache_key is None:
+            return context
+        return _store(context, cache_key)
+    return Interceptor(
+        name=_ns('response_cache'),
+        enter=_response_cache_enter,
+        leave=_response_cache_leave)
+
+
+__all__ = ['response_cache', 'ResponseCache', 'cache_key', 'cacheable']
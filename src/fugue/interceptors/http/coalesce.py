@@ -0,0 +1,114 @@
+"""
+Coalescing identical concurrent requests into a single execution.
+"""
+from twisted.internet.defer import CancelledError, Deferred
+
+from fugue._keys import ERROR, REQUEST, RESPONSE
+from fugue.chain import DeadlineExceeded, terminate
+from fugue.interceptors.basic import Interceptor
+from fugue.interceptors.http.cache import (
+    _key_headers, _private_request, cache_key)
+from fugue.interceptors.http.headers import get_header
+from fugue.util import namespace
+
+
+_ns = namespace(__name__)
+_LEADER = _ns('leader')
+
+_SAFE_METHODS = frozenset([b'GET', b'HEAD'])
+
+
+def shareable(response):
+    """
+    Can a response produced for one request be used for others?
+
+    Only responses with a complete ``bytes`` body, or none at all, and without
+    ``Set-Cookie`` or ``Vary`` can be.
+
+    :rtype: bool
+    """
+    body = response.get('body')
+    headers = response.get('headers')
+    return ((body is None or isinstance(body, bytes)) and
+            not get_header(headers, b'Set-Cookie') and
+            not get_header(headers, b'Vary'))
+
+
+def coalesce(key=None, shareable=shareable):
+    """
+    An interceptor that coalesces identical concurrent ``GET`` and ``HEAD``
+    requests, so that only one of them executes the rest of the chain.
+
+    The first request for a key, the leader, proceeds as usual while any
+    requests with the same key that arrive before it has completed, the
+    followers, wait for it in the enter stage. Once the leader's response is
+    produced the followers terminate their chains with it; if the response is
+    not ``shareable``, the followers instead proceed as though they were never
+    coalesced. If the leader fails, the followers fail with the same error,
+    unless the failure only concerns the leader, such as it being cancelled
+    or exceeding its deadline, in which case they also proceed.
+
+    Requests with ``Authorization`` or ``Cookie`` headers are never coalesced,
+    unless those headers are part of the key.
+
+    :param key: Callable projecting a request onto a hashable key, see
+    `fugue.interceptors.http.cache.cache_key`, which by default covers the
+    method, path and entire query.
+    :param shareable: Predicate taking a response map, indicating whether it
+    can be used for followers.
+    :rtype: Interceptor
+    """
+    if key is None:
+        key = cache_key()
+    key_headers = _key_headers(key)
+    in_flight = {}
+
+    def _follow(context, response):
+        if response is not None and shareable(response):
+            return terminate(context.set(RESPONSE, response))
+        return context
+
+    def _release(request_key):
+        return in_flight.pop(request_key, [])
+
+    def _coalesce_enter(context):
+        request = context[REQUEST]
+        if (request.get('request_method') not in _SAFE_METHODS or
+                _private_request(request, key_headers)):
+            return context
+        request_key = key(request)
+        followers = in_flight.get(request_key)
+        if followers is None:
+            in_flight[request_key] = []
+            return context.set(_LEADER, request_key)
+        d = Deferred()
+        followers.append(d)
+        return d.addCallback(lambda response: _follow(context, response))
+
+    def _coalesce_leave(context):
+        if _LEADER in context:
+            response = context.get(RESPONSE)
+            for d in _release(context[_LEADER]):
+                d.callback(response)
+        return context
+
+    def _coalesce_error(context, error):
+        if _LEADER in context:
+            failure = error.failure
+            # The leader's client going away, or running out of time, says
+            # nothing about the outcome for the followers.
+            own = failure.check(CancelledError, DeadlineExceeded)
+            for d in _release(context[_LEADER]):
+                if own:
+                    d.callback(None)
+                else:
+                    d.errback(failure)
+        return context.set(ERROR, error)
+    return Interceptor(
+        name=_ns('coalesce'),
+        enter=_coalesce_enter,
+        leave=_coalesce_leave,
+        error=_coalesce_error)
+
+
+__all__ = ['coalesce', 'shareable']
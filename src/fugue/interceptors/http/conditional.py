@@ -0,0 +1,185 @@
+"""
+Conditional requests, validated by entity tags and modification dates.
+"""
+import re
+
+from pyrsistent import m, pmap
+from twisted.internet.defer import Deferred
+from twisted.web.http import datetimeToString, stringToDatetime
+
+from fugue._keys import REQUEST, RESPONSE
+from fugue.chain import terminate
+from fugue.interceptors.basic import Interceptor
+from fugue.interceptors.http.headers import (
+    get_first_header, get_header, get_header_tokens, set_header)
+from fugue.util import namespace
+
+
+_ns = namespace(__name__)
+VALIDATORS = _ns('validators')
+
+_SAFE_METHODS = frozenset([b'GET', b'HEAD'])
+_ENTITY_TAG = re.compile(br'(?:W/)?"[^"]*"')
+
+
+def quote_etag(etag, weak=False):
+    """
+    Quote an entity tag, if it is not already quoted.
+
+    :param bytes etag: Entity tag.
+    :param bool weak: Mark an unquoted entity tag as weak.
+    :rtype: bytes
+    """
+    if etag.startswith(b'"') or etag.startswith(b'W/"'):
+        return etag
+    return (b'W/"' if weak else b'"') + etag + b'"'
+
+
+def _opaque_tag(etag):
+    """
+    The opaque part of an entity tag, for weak comparison.
+    """
+    return etag[2:] if etag.startswith(b'W/') else etag
+
+
+def _none_match(headers, etag, exists):
+    """
+    Does ``If-None-Match`` match ``etag``?
+
+    :param bool exists: Does the resource have a current representation,
+    which ``*`` matches?
+    :return: ``None`` if there is no ``If-None-Match``, otherwise whether it
+    matches.
+    """
+    values = get_header(headers, b'If-None-Match')
+    if not values:
+        return None
+    if b'*' in get_header_tokens(headers, b'If-None-Match'):
+        return exists
+    if etag is None:
+        return False
+    etag = _opaque_tag(etag)
+    return any(_opaque_tag(tag) == etag
+               for value in values
+               for tag in _ENTITY_TAG.findall(value))
+
+
+def _not_modified_since(headers, last_modified):
+    """
+    Has the resource not been modified since ``If-Modified-Since``?
+    """
+    if last_modified is None:
+        return False
+    since = get_first_header(headers, b'If-Modified-Since')
+    if since is None:
+        return False
+    try:
+        since = stringToDatetime(since)
+    except (ValueError, IndexError, KeyError):
+        return False
+    return int(last_modified) <= since
+
+
+def _validator_headers(validators):
+    """
+    Response headers for a set of validators.
+    """
+    headers = {}
+    if validators.get('etag') is not None:
+        headers[b'ETag'] = validators['etag']
+    if validators.get('last_modified') is not None:
+        headers[b'Last-Modified'] = datetimeToString(
+            validators['last_modified'])
+    return headers
+
+
+def _conditional_response(request, validators):
+    """
+    Evaluate the preconditions of a request against the current validators.
+
+    :return: A 304 or 412 response, if a precondition fails, otherwise
+    ``None``.
+    """
+    headers = request.get('headers') or m()
+    safe = request.get('request_method', b'GET') in _SAFE_METHODS
+    etag = validators.get('etag')
+    last_modified = validators.get('last_modified')
+    matched = _none_match(
+        headers, etag, etag is not None or last_modified is not None)
+    if matched is None and safe:
+        # If-Modified-Since is only considered without If-None-Match.
+        matched = _not_modified_since(headers, last_modified)
+    if not matched:
+        return None
+    if safe:
+        return m(status=304,
+                 headers=m(**_validator_headers(validators)),
+                 body=b'')
+    return m(status=412,
+             headers=m(**{b'Content-Type': b'text/plain'}),
+             body=b'Precondition failed')
+
+
+def _normalize_validators(validators):
+    """
+    Normalize the result of a validator function.
+    """
+    validators = pmap(validators or {})
+    etag = validators.get('etag')
+    if etag is not None:
+        validators = validators.set('etag', quote_etag(etag))
+    return validators
+
+
+def conditional(validator):
+    """
+    An interceptor that answers conditional requests without running the rest
+    of the chain.
+
+    In the enter stage ``validator`` is called with the request to determine
+    the current validators of the resource, cheaply and without rendering it.
+    If the request's ``If-None-Match``, or ``If-Modified-Since``, header
+    matches them, the chain is terminated with an HTTP 304 response, or an
+    HTTP 412 response for methods other than ``GET`` and ``HEAD``.
+
+    Otherwise the validators are stored in the context, at `VALIDATORS`, and
+    the ``ETag`` and ``Last-Modified`` headers are added to successful
+    responses, that do not already have them, in the leave stage.
+
+    :param validator: Callable taking a request map and returning a map, or
+    a `Deferred` that fires with one, with an ``etag`` (`bytes`, quoted or
+    not) and/or ``last_modified`` (seconds since the epoch) key, or ``None``
+    if the resource has no current representation, or no validators;
+    ``If-None-Match: *`` only matches a resource with validators.
+    :rtype: Interceptor
+    """
+    def _conditional_enter(context):
+        def _check(validators):
+            validators = _normalize_validators(validators)
+            response = _conditional_response(context[REQUEST], validators)
+            if response is not None:
+                return terminate(context.set(RESPONSE, response))
+            return context.set(VALIDATORS, validators)
+        validators = validator(context[REQUEST])
+        if isinstance(validators, Deferred):
+            return validators.addCallback(_check)
+        return _check(validators)
+
+    def _conditional_leave(context):
+        response = context.get(RESPONSE)
+        validators = context.get(VALIDATORS)
+        if (response is None or not validators or
+                not 200 <= response.get('status', 200) < 300):
+            return context
+        headers = response.get('headers') or m()
+        for name, value in _validator_headers(validators).items():
+            if not get_header(headers, name):
+                headers = set_header(headers, name, value)
+        return context.set(RESPONSE, response.set('headers', headers))
+    return Interceptor(
+        name=_ns('conditional'),
+        enter=_conditional_enter,
+        leave=_conditional_leave)
+
+
+__all__ = ['conditional', 'quote_etag', 'VALIDATORS']
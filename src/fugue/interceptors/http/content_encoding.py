@@ -0,0 +1,513 @@
+"""
+Content codings, as indicated by the ``Content-Encoding`` header, of request
+and response bodies.
+"""
+import zlib
+
+from pyrsistent import m, pmap
+from twisted.internet.defer import Deferred
+from twisted.web.iweb import IBodyProducer
+
+from fugue._keys import ERROR, REQUEST, RESPONSE
+from fugue.chain import terminate
+from fugue.interceptors.basic import Interceptor
+from fugue.interceptors.http.body_params import (
+    _parse_header, _REQUEST_TOO_LARGE, RequestTooLarge)
+from fugue.interceptors.http.headers import (
+    discard_header, get_first_header, get_header, get_header_tokens,
+    set_header)
+from fugue.util import namespace
+
+
+_ns = namespace(__name__)
+
+#: ``wbits`` for `zlib.decompressobj` by content coding.
+_DECODINGS = {
+    b'gzip': 16 + zlib.MAX_WBITS,
+    b'x-gzip': 16 + zlib.MAX_WBITS,
+    b'deflate': zlib.MAX_WBITS,
+}
+
+
+class ContentDecodingError(ValueError):
+    """
+    A request body could not be decoded according to its content coding.
+    """
+
+
+class _DecompressingReader(object):
+    """
+    File-like object that decompresses another as it is read from.
+
+    No more than about ``chunk_size`` bytes, or as many as are asked for, are
+    decompressed at a time, regardless of how well the data compresses.
+    """
+    def __init__(self, fileobj, wbits, max_size=None, chunk_size=2 ** 16):
+        """
+        :param fileobj: File-like object to read compressed data from.
+        :param int wbits: ``wbits`` for `zlib.decompressobj`.
+        :param int max_size: Maximum number of bytes to decompress, ``None``
+        for no limit.
+        :param int chunk_size: Number of bytes to read and decompress at a
+        time.
+        """
+        self._fileobj = fileobj
+        self._wbits = wbits
+        self._decompressor = zlib.decompressobj(wbits)
+        self._max_size = max_size
+        self._chunk_size = chunk_size
+        self._size = 0
+        self._buf = b''
+        self._eof = False
+
+    def _decompress(self, data, max_length):
+        try:
+            return self._decompressor.decompress(data, max_length)
+        except zlib.error as e:
+            # Some clients send raw deflate data, without the zlib wrapper,
+            # for ``deflate``.
+            if self._wbits == zlib.MAX_WBITS and self._size == 0:
+                self._wbits = -zlib.MAX_WBITS
+                self._decompressor = zlib.decompressobj(self._wbits)
+                return self._decompress(data, max_length)
+            raise ContentDecodingError(str(e))
+
+    def _ended(self):
+        """
+        Determine whether the end of the compressed stream has been reached.
+
+        `zlib` decompressors keep any data given to them after the end of the
+        stream as ``unused_data``, which is used to probe a copy of ours.
+        """
+        probe = self._decompressor.copy()
+        try:
+            probe.decompress(b'\0')
+        except zlib.error:
+            return False
+        return bool(probe.unused_data)
+
+    def _more(self, size):
+        """
+        Decompress up to ``size`` more bytes, or ``chunk_size`` if ``size`` is
+        negative.
+
+        :raise ContentDecodingError: If the data is malformed, is truncated
+        or continues past the end of the compressed stream.
+        :return: Decompressed data, which is only empty at the end of the
+        stream.
+        """
+        if size < 0:
+            size = self._chunk_size
+        while True:
+            data = self._decompressor.unconsumed_tail
+            if not data:
+                data = self._fileobj.read(self._chunk_size)
+                if not data:
+                    self._eof = True
+                    if not self._ended():
+                        raise ContentDecodingError(
+                            'Compressed data is truncated')
+                    try:
+                        result = self._decompressor.flush()
+                    except zlib.error as e:
+                        raise ContentDecodingError(str(e))
+                    break
+            result = self._decompress(data, size)
+            if self._decompressor.unused_data:
+                raise ContentDecodingError(
+                    'Data after the end of the compressed stream')
+            if result:
+                break
+        self._size += len(result)
+        if self._max_size is not None and self._size > self._max_size:
+            raise RequestTooLarge('max_size', self._max_size)
+        return result
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        chunks = [self._buf]
+        length = len(self._buf)
+        while (size < 0 or length < size) and not self._eof:
+            chunk = self._more(-1 if size < 0 else size - length)
+            chunks.append(chunk)
+            length += len(chunk)
+        data = b''.join(chunks)
+        if size < 0:
+            self._buf = b''
+            return data
+        self._buf = data[size:]
+        return data[:size]
+
+    def readline(self, size=-1):
+        if size is None:
+            size = -1
+        while b'\n' not in self._buf and not self._eof:
+            if size >= 0 and len(self._buf) >= size:
+                break
+            self._buf += self._more(-1)
+        i = self._buf.find(b'\n') + 1 or len(self._buf)
+        if size >= 0:
+            i = min(i, size)
+        data, self._buf = self._buf[:i], self._buf[i:]
+        return data
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def close(self):
+        close = getattr(self._fileobj, 'close', None)
+        if close is not None:
+            close()
+
+
+_UNSUPPORTED_MEDIA_TYPE = m(
+    status=415,
+    headers=m(**{'Content-Type': b'text/plain'}),
+    body=b'Unsupported content encoding')
+
+_BAD_REQUEST = m(
+    status=400,
+    headers=m(**{'Content-Type': b'text/plain'}),
+    body=b'Malformed request body')
+
+
+def _decompress_request(request, max_size, chunk_size):
+    """
+    Wrap a request body in decompressing readers for its content codings.
+
+    :return: Updated request, or ``None`` if a content coding is not
+    supported.
+    """
+    headers = request.get('headers') or m()
+    codings = [coding.lower()
+               for coding in get_header_tokens(headers, b'Content-Encoding')]
+    codings = [coding for coding in codings if coding != b'identity']
+    if not codings:
+        return request
+    if any(coding not in _DECODINGS for coding in codings):
+        return None
+    body = request['body']
+    # Content codings are listed in the order they were applied.
+    for coding in reversed(codings):
+        body = _DecompressingReader(
+            body, _DECODINGS[coding], max_size, chunk_size)
+    return request.update(
+        m(body=body,
+          content_length=None,
+          headers=discard_header(headers, b'Content-Encoding')))
+
+
+def _error_decompress_body(context, error):
+    """
+    Error stage for `decompress_body`.
+
+    Turn `RequestTooLarge` into an HTTP 413 response and
+    `ContentDecodingError` into an HTTP 400 response, whenever the body was
+    read.
+    """
+    if error.failure.check(RequestTooLarge):
+        return context.set(RESPONSE, _REQUEST_TOO_LARGE)
+    elif error.failure.check(ContentDecodingError):
+        return context.set(RESPONSE, _BAD_REQUEST)
+    return context.set(ERROR, error)
+
+
+def decompress_body(max_size=2 ** 24, chunk_size=2 ** 16):
+    """
+    An interceptor that transparently decompresses request bodies with a
+    ``gzip`` or ``deflate`` content coding in the enter stage.
+
+    The request body is decompressed as it is read, the ``content_length`` is
+    removed and so is the ``Content-Encoding`` header. Requests with any other
+    content coding result in an HTTP 415 response. This interceptor should
+    come before any, such as `body_params`, that read the body.
+
+    :param int max_size: Maximum number of bytes a body may decompress to,
+    beyond which `RequestTooLarge` is raised and results in an HTTP 413
+    response. ``None`` for no limit.
+    :param int chunk_size: Number of bytes to read and decompress at a time.
+    :rtype: Interceptor
+    """
+    def _decompress_body_enter(context):
+        request = _decompress_request(context[REQUEST], max_size, chunk_size)
+        if request is None:
+            return terminate(context.set(RESPONSE, _UNSUPPORTED_MEDIA_TYPE))
+        return context.set(REQUEST, request)
+    return Interceptor(
+        name=_ns('decompress_body'),
+        enter=_decompress_body_enter,
+        error=_error_decompress_body)
+
+
+#: ``wbits`` for `zlib.compressobj` by content coding.
+_ENCODINGS = {
+    b'gzip': 16 + zlib.MAX_WBITS,
+    b'deflate': zlib.MAX_WBITS,
+}
+
+#: Statuses whose responses have no body, or whose body must not be altered.
+_UNENCODED_STATUSES = frozenset([204, 206, 304])
+
+
+def _accepted_encodings(headers):
+    """
+    Parse ``Accept-Encoding`` into a map of content codings to their quality
+    values.
+    """
+    accepted = {}
+    for token in get_header_tokens(headers, b'Accept-Encoding'):
+        coding, _, params = token.partition(b';')
+        q = 1.0
+        params = params.strip()
+        if params[:2].lower() == b'q=':
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def negotiate_encoding(headers, encodings=(b'gzip', b'deflate')):
+    """
+    Choose a content coding for a response from a request's
+    ``Accept-Encoding`` header.
+
+    :param headers: Request header map.
+    :param encodings: Supported content codings, in order of preference
+    among equally acceptable ones.
+    :rtype: bytes
+    :return: The chosen content coding, or ``None`` if none of them are
+    acceptable.
+    """
+    accepted = _accepted_encodings(headers)
+    wildcard = accepted.get(b'*', 0.0)
+    best, best_q = None, 0.0
+    for coding in encodings:
+        q = accepted.get(coding, wildcard)
+        if coding == b'gzip':
+            q = max(q, accepted.get(b'x-gzip', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+_COMPRESSIBLE_SUFFIXES = (b'+json', b'+xml')
+_COMPRESSIBLE_TYPES = frozenset([
+    b'application/json',
+    b'application/javascript',
+    b'application/x-javascript',
+    b'application/xml',
+    b'application/x-www-form-urlencoded',
+    b'image/svg+xml',
+])
+
+
+def compressible_type(content_type):
+    """
+    Is a response with this ``Content-Type`` worth compressing?
+
+    Textual types are, whereas most other types are either already
+    compressed (images, audio, video, archives) or opaque.
+
+    :param bytes content_type: ``Content-Type`` header value, or ``None``.
+    :rtype: bool
+    """
+    if not content_type:
+        return False
+    media_type, _ = _parse_header(content_type)
+    return (media_type.startswith(b'text/') or
+            media_type in _COMPRESSIBLE_TYPES or
+            media_type.endswith(_COMPRESSIBLE_SUFFIXES))
+
+
+def _compress(data, coding, level):
+    """
+    Compress ``bytes`` in one go.
+    """
+    c = zlib.compressobj(level, zlib.DEFLATED, _ENCODINGS[coding])
+    return c.compress(data) + c.flush()
+
+
+def _compress_stream(chunks, coding, level):
+    """
+    Compress an iterable of ``bytes`` incrementally.
+
+    Each chunk is flushed as it is compressed, so that anything already
+    produced is not held back waiting for more. Chunks that are `Deferred`s
+    are compressed once they fire, which is before the next chunk is pulled.
+    """
+    c = zlib.compressobj(level, zlib.DEFLATED, _ENCODINGS[coding])
+
+    def _chunk(data):
+        if not data:
+            return b''
+        return c.compress(data) + c.flush(zlib.Z_SYNC_FLUSH)
+    for chunk in chunks:
+        if isinstance(chunk, Deferred):
+            yield chunk.addCallback(_chunk)
+        elif chunk:
+            yield _chunk(chunk)
+    yield c.flush()
+
+
+def _file_chunks(fileobj, chunk_size=2 ** 16):
+    """
+    Iterate a file-like object in chunks.
+    """
+    return iter(lambda: fileobj.read(chunk_size), b'')
+
+
+def precompress(body, encodings=(b'gzip', b'deflate'), level=9):
+    """
+    Compress a static payload ahead of time, for the ``precompressed`` key of
+    a response.
+
+    Responses with a ``precompressed`` map, of content coding to compressed
+    body, use the variant for the negotiated content coding instead of
+    compressing the body again.
+
+    :param bytes body: Payload.
+    :param encodings: Content codings to compress with.
+    :param int level: Compression level.
+    :rtype: pmap
+    """
+    return pmap({coding: _compress(body, coding, level)
+                 for coding in encodings})
+
+
+def _weak_etag(etag):
+    """
+    Weaken a strong entity tag, since a compressed representation is no longer
+    byte-for-byte identical.
+    """
+    if etag is None or etag.startswith(b'W/'):
+        return etag
+    return b'W/' + etag
+
+
+def _add_vary(headers, value):
+    """
+    Add a value to the ``Vary`` header, if it is not already there.
+    """
+    tokens = get_header_tokens(headers, b'Vary')
+    lower = [token.lower() for token in tokens]
+    if value.lower() in lower or b'*' in lower:
+        return headers
+    return set_header(headers, b'Vary', b', '.join(tokens + [value]))
+
+
+def _compressible_body(body):
+    """
+    Can a body be compressed, either in one go or as it is iterated?
+
+    `IBodyProducer` providers write themselves to the network and cannot be
+    compressed, nor can anything that is not iterable.
+    """
+    if isinstance(body, bytes) or hasattr(body, 'read'):
+        return True
+    if IBodyProducer.providedBy(body):
+        return False
+    try:
+        iter(body)
+    except TypeError:
+        return False
+    return True
+
+
+def _encode_response(request, response, encodings, min_size, level,
+                     compressible):
+    """
+    Compress a response, with its body already resolved, if it is worth
+    compressing and the client accepts it.
+    """
+    precompressed = response.get('precompressed') or {}
+    response = response.discard('precompressed')
+    headers = response.get('headers') or m()
+    body = response.get('body')
+    if (body is None or
+            not _compressible_body(body) or
+            response.get('status') in _UNENCODED_STATUSES or
+            get_header(headers, b'Content-Encoding') or
+            b'no-transform' in get_header_tokens(headers, b'Cache-Control') or
+            not compressible(get_first_header(headers, b'Content-Type'))):
+        return response
+    if isinstance(body, bytes) and len(body) < min_size:
+        return response
+    headers = _add_vary(headers, b'Accept-Encoding')
+    response = response.set('headers', headers)
+    if request.get('request_method') == b'HEAD':
+        return response
+    coding = negotiate_encoding(request.get('headers'), encodings)
+    if coding is None:
+        return response
+    if coding in precompressed:
+        body = precompressed[coding]
+    elif isinstance(body, bytes):
+        body = _compress(body, coding, level)
+    elif hasattr(body, 'read'):
+        body = _compress_stream(_file_chunks(body), coding, level)
+    else:
+        body = _compress_stream(body, coding, level)
+    headers = set_header(headers, b'Content-Encoding', coding)
+    headers = discard_header(headers, b'Content-Length')
+    if isinstance(body, bytes):
+        headers = set_header(headers, b'Content-Length', bytes(len(body)))
+    etag = get_first_header(headers, b'ETag')
+    if etag is not None:
+        headers = set_header(headers, b'ETag', _weak_etag(etag))
+    return response.update(m(body=body, headers=headers))
+
+
+def compress_response(encodings=(b'gzip', b'deflate'), min_size=2 ** 10,
+                      level=6, compressible=compressible_type):
+    """
+    An interceptor that compresses response bodies, with a content coding
+    negotiated from the request's ``Accept-Encoding`` header, in the leave
+    stage.
+
+    Bodies may be ``bytes``, file-like objects or iterables of ``bytes``, or a
+    `Deferred` that fires with any of those. ``bytes`` bodies are compressed
+    in one go, anything else is compressed incrementally as it is iterated.
+    Responses may carry a ``precompressed`` map of content coding to
+    compressed body, see `precompress`, for static payloads that should not be
+    compressed on every request.
+
+    Responses that already have a ``Content-Encoding``, ``bytes`` bodies
+    smaller than ``min_size``, and bodies whose ``Content-Type`` is not
+    ``compressible`` are left as they are, as are `IBodyProducer` bodies,
+    which cannot be compressed.
+
+    :param encodings: Supported content codings, in order of preference.
+    :param int min_size: Minimum size of a ``bytes`` body worth compressing.
+    :param int level: Compression level, trading CPU for size.
+    :param compressible: Predicate taking a ``Content-Type`` header value,
+    indicating whether it is worth compressing.
+    :rtype: Interceptor
+    """
+    def _compress_response_leave(context):
+        request = context.get(REQUEST) or m()
+        response = context.get(RESPONSE)
+        if response is None:
+            return context
+        body = response.get('body')
+        if isinstance(body, Deferred):
+            return body.addCallback(
+                lambda body: context.set(
+                    RESPONSE,
+                    _encode_response(
+                        request, response.set('body', body), encodings,
+                        min_size, level, compressible)))
+        return context.set(
+            RESPONSE,
+            _encode_response(
+                request, response, encodings, min_size, level, compressible))
+    return Interceptor(
+        name=_ns('compress_response'),
+        leave=_compress_response_leave)
+
+
+__all__ = [
+    'decompress_body', 'ContentDecodingError', 'compress_response',
+    'compressible_type', 'negotiate_encoding', 'precompress']
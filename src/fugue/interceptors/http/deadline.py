@@ -0,0 +1,101 @@
+"""
+Per-request deadlines.
+"""
+from pyrsistent import m
+
+from fugue._keys import DEADLINE, ERROR, REQUEST, RESPONSE
+from fugue.chain import Deadline, DeadlineExceeded
+from fugue.interceptors.basic import Interceptor
+from fugue.interceptors.http.headers import get_first_header
+from fugue.util import namespace
+
+
+_ns = namespace(__name__)
+
+_GATEWAY_TIMEOUT = m(
+    status=504,
+    headers=m(**{'Content-Type': b'text/plain'}),
+    body=b'Deadline exceeded')
+
+
+def remaining(context):
+    """
+    Number of seconds left until a context's deadline.
+
+    :return: Seconds, which may be negative, or ``None`` if the context has
+    no deadline.
+    """
+    deadline = context.get(DEADLINE)
+    if deadline is None:
+        return None
+    return deadline.remaining()
+
+
+def _header_timeout(headers, name):
+    """
+    Parse a timeout, in seconds, from a request header.
+    """
+    value = get_first_header(headers, name)
+    if value is None:
+        return None
+    try:
+        timeout = float(value)
+    except ValueError:
+        return None
+    if timeout != timeout or timeout < 0:
+        return None
+    return timeout
+
+
+def deadline(timeout=None, header=None, clock=None):
+    """
+    An interceptor that gives the rest of the chain a deadline to complete
+    its "enter" stages by.
+
+    The deadline is ``timeout`` seconds from now or, if the request has the
+    ``header`` header, the number of seconds it specifies, whichever is
+    sooner. An existing deadline, such as one from an earlier `deadline`
+    interceptor, is only ever brought forward; routes can use this to give
+    themselves a tighter deadline than the default.
+
+    Stages that begin after the deadline, or whose asynchronous result is
+    not delivered before it, fail with `fugue.chain.DeadlineExceeded`, see
+    `fugue.chain.execute`, and the error stage of this interceptor answers
+    them with an HTTP 504 response. Downstream interceptors can find out how
+    much time is left with `remaining`.
+
+    :param timeout: Number of seconds the chain has, or ``None`` to only use
+    ``header``.
+    :param bytes header: Name of a request header giving the number of
+    seconds the client is prepared to wait, or ``None``.
+    :param clock: `IReactorTime` provider, the global reactor if ``None``.
+    :rtype: Interceptor
+    """
+    if clock is None:
+        from twisted.internet import reactor as clock
+
+    def _deadline_enter(context):
+        timeouts = [timeout]
+        if header is not None:
+            timeouts.append(
+                _header_timeout(context[REQUEST].get('headers'), header))
+        timeouts = [t for t in timeouts if t is not None]
+        if not timeouts:
+            return context
+        expires = clock.seconds() + min(timeouts)
+        existing = context.get(DEADLINE)
+        if existing is not None and existing.expires <= expires:
+            return context
+        return context.set(DEADLINE, Deadline(expires=expires, clock=clock))
+
+    def _deadline_error(context, error):
+        if error.failure.check(DeadlineExceeded):
+            return context.set(RESPONSE, _GATEWAY_TIMEOUT)
+        return context.set(ERROR, error)
+    return Interceptor(
+        name=_ns('deadline'),
+        enter=_deadline_enter,
+        error=_deadline_error)
+
+
+__all__ = ['deadline', 'remaining']
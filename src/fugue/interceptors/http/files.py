@@ -0,0 +1,181 @@
+"""
+Responses for files on disk, with support for byte range requests.
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from pyrsistent import m
+from twisted.web.http import datetimeToString
+
+from fugue.interceptors.http.headers import get_first_header, Headers
+
+
+_BYTE_RANGE = re.compile(br'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$')
+_UNSATISFIABLE = object()
+
+
+class _BoundedReader(object):
+    """
+    File-like object that reads at most ``length`` bytes from another.
+    """
+    def __init__(self, fileobj, length):
+        self._fileobj = fileobj
+        self._remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        if size == 0:
+            return b''
+        data = self._fileobj.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._fileobj.close()
+
+
+class FileBody(object):
+    """
+    Response body for a region of a file, that is only opened once it is
+    written.
+
+    The Twisted and Nevow interceptors write the file in fixed-size chunks,
+    straight from the file to the transport; iterating the body, as other
+    interceptors that transform bodies do, produces the same chunks.
+    """
+    __slots__ = ['path', 'offset', 'length', 'chunk_size']
+
+    def __init__(self, path, offset=0, length=None, chunk_size=2 ** 16):
+        """
+        :param path: Path to the file.
+        :param int offset: Offset, in bytes, of the region to write.
+        :param int length: Length, in bytes, of the region to write, or
+        ``None`` for everything after ``offset``.
+        :param int chunk_size: Size of the chunks to iterate the file in.
+        """
+        if length is None:
+            length = os.path.getsize(path) - offset
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.chunk_size = chunk_size
+
+    def open(self):
+        """
+        Open the file, positioned at the start of the region.
+
+        :return: File-like object that reads only the region.
+        """
+        fileobj = open(self.path, 'rb')
+        if self.offset:
+            fileobj.seek(self.offset)
+        return _BoundedReader(fileobj, self.length)
+
+    def __iter__(self):
+        reader = self.open()
+        try:
+            for chunk in iter(lambda: reader.read(self.chunk_size), b''):
+                yield chunk
+        finally:
+            reader.close()
+
+    def __repr__(self):
+        return '{}({!r}, offset={!r}, length={!r})'.format(
+            type(self).__name__, self.path, self.offset, self.length)
+
+
+def _parse_range(value, size):
+    """
+    Parse a ``Range`` header for a representation of ``size`` bytes.
+
+    Only a single byte range is supported, anything else is ignored as the
+    HTTP specification allows.
+
+    :return: ``(first, last)`` byte positions, inclusive, `_UNSATISFIABLE` or
+    ``None`` if the header should be ignored.
+    """
+    match = _BYTE_RANGE.match(value)
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range, the last N bytes.
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            return _UNSATISFIABLE
+        return max(0, size - suffix), size - 1
+    first = int(first)
+    last = int(last) if last else None
+    if last is not None and last < first:
+        return None
+    if first >= size:
+        return _UNSATISFIABLE
+    if last is None:
+        return first, size - 1
+    return first, min(last, size - 1)
+
+
+def file_response(request, path, content_type=None, chunk_size=2 ** 16):
+    """
+    Create a response for a file, without reading it.
+
+    ``GET`` requests with a satisfiable single byte ``Range`` produce an HTTP
+    206 response for that part of the file, unless an ``If-Range`` header
+    does not match the file's modification date; unsatisfiable ranges
+    produce an HTTP 416 response.
+
+    :param request: Request map.
+    :param path: Path to a regular file.
+    :param bytes content_type: ``Content-Type`` of the response, guessed from
+    the file name if ``None``.
+    :param int chunk_size: Size of the chunks the body is iterated in.
+    :raise OSError: If the file cannot be accessed.
+    :raise ValueError: If the path is not a regular file.
+    :return: Response map with a `FileBody` body.
+    """
+    st = os.stat(path)
+    if not stat.S_ISREG(st.st_mode):
+        raise ValueError('Not a regular file: {!r}'.format(path))
+    if content_type is None:
+        content_type = (mimetypes.guess_type(path)[0] or
+                        'application/octet-stream').encode('ascii')
+    size = st.st_size
+    last_modified = datetimeToString(int(st.st_mtime))
+    headers = Headers([
+        (b'Content-Type', content_type),
+        (b'Accept-Ranges', b'bytes'),
+        (b'Last-Modified', last_modified)])
+    request_headers = request.get('headers')
+    method = request.get('request_method')
+    byte_range = None
+    range_header = get_first_header(request_headers, b'Range')
+    if_range = get_first_header(request_headers, b'If-Range')
+    if (method == b'GET' and range_header is not None and
+            (if_range is None or if_range == last_modified)):
+        byte_range = _parse_range(range_header, size)
+    if byte_range is _UNSATISFIABLE:
+        return m(
+            status=416,
+            headers=headers.add(b'Content-Range', b'bytes */%d' % (size,)),
+            body=b'')
+    status = 200
+    offset, length = 0, size
+    if byte_range is not None:
+        first, last = byte_range
+        status = 206
+        offset, length = first, last - first + 1
+        headers = headers.add(
+            b'Content-Range', b'bytes %d-%d/%d' % (first, last, size))
+    headers = headers.add(b'Content-Length', bytes(length))
+    body = None
+    if method != b'HEAD':
+        body = FileBody(path, offset, length, chunk_size)
+    return m(status=status, headers=headers, body=body)
+
+
+__all__ = ['file_response', 'FileBody']
@@ -0,0 +1,297 @@
+"""
+Utilities for HTTP header maps.
+
+Header maps, on requests and responses, map header names to a sequence of
+values or, for convenience, a single value. Header names are compared
+case-insensitively. Header maps are usually `Headers` but any map, such as a
+`pyrsistent.PMap`, can be used.
+"""
+from collections import Mapping
+
+from pyrsistent import pmap, pvector
+
+
+def _values(value):
+    """
+    Normalize a header map value into a list of values.
+    """
+    if isinstance(value, (bytes, unicode)):
+        return [value]
+    return list(value)
+
+
+class Headers(Mapping):
+    """
+    Immutable, case-insensitive, multi-valued header map.
+
+    Headers are stored, in the order they were given, as a flat tuple of
+    alternating names and values; the index used for lookups is only built on
+    first use. Looking up a header returns a list of all of its values, names
+    are reported in the case they were first given in.
+    """
+    __slots__ = ['_fields', '_index']
+
+    def __init__(self, pairs=()):
+        """
+        :param pairs: Iterable of ``(name, value)`` pairs, names may repeat.
+        """
+        fields = []
+        for name, value in pairs:
+            fields.append(name)
+            fields.append(value)
+        self._fields = tuple(fields)
+        self._index = None
+
+    @classmethod
+    def _from_fields(cls, fields):
+        headers = cls.__new__(cls)
+        headers._fields = fields
+        headers._index = None
+        return headers
+
+    @classmethod
+    def from_map(cls, headers):
+        """
+        Create headers from a header map, or an iterable of ``(name, values)``
+        pairs such as Twisted's ``Headers.getAllRawHeaders``.
+
+        :rtype: Headers
+        """
+        if isinstance(headers, cls):
+            return headers
+        if isinstance(headers, Mapping):
+            headers = headers.items()
+        fields = []
+        for name, values in headers:
+            for value in _values(values):
+                fields.append(name)
+                fields.append(value)
+        return cls._from_fields(tuple(fields))
+
+    def _get_index(self):
+        """
+        Map of lowercase header names to the name in its original case and a
+        list of values.
+        """
+        index = self._index
+        if index is None:
+            index = {}
+            fields = self._fields
+            for i in xrange(0, len(fields), 2):
+                name = fields[i]
+                entry = index.get(name.lower())
+                if entry is None:
+                    index[name.lower()] = (name, [fields[i + 1]])
+                else:
+                    entry[1].append(fields[i + 1])
+            self._index = index
+        return index
+
+    def pairs(self):
+        """
+        All ``(name, value)`` pairs, in order.
+
+        :rtype: Iterator[Tuple[bytes, bytes]]
+        """
+        fields = self._fields
+        return (
+            (fields[i], fields[i + 1]) for i in xrange(0, len(fields), 2))
+
+    def __getitem__(self, name):
+        return list(self._get_index()[name.lower()][1])
+
+    def __contains__(self, name):
+        return name.lower() in self._get_index()
+
+    def __iter__(self):
+        return (name for name, _ in self._get_index().itervalues())
+
+    def __len__(self):
+        return len(self._get_index())
+
+    def items(self):
+        return [(name, list(values))
+                for name, values in self._get_index().itervalues()]
+
+    def first(self, name, default=None):
+        """
+        Only the first value for a header by name.
+        """
+        entry = self._get_index().get(name.lower())
+        if entry is None:
+            return default
+        return entry[1][0]
+
+    def discard(self, name):
+        """
+        Remove all values for a header, in any case.
+
+        :rtype: Headers
+        """
+        if name not in self:
+            return self
+        name = name.lower()
+        fields = self._fields
+        return self._from_fields(tuple(
+            field
+            for i in xrange(0, len(fields), 2)
+            if fields[i].lower() != name
+            for field in fields[i:i + 2]))
+
+    def set(self, name, value):
+        """
+        Set a header, replacing all existing values in any case.
+
+        :param value: Header value, or sequence of values.
+        :rtype: Headers
+        """
+        return self.discard(name).add(name, value)
+
+    def add(self, name, value):
+        """
+        Add values for a header, after any existing ones.
+
+        :param value: Header value, or sequence of values.
+        :rtype: Headers
+        """
+        fields = []
+        for v in _values(value):
+            fields.append(name)
+            fields.append(v)
+        return self._from_fields(self._fields + tuple(fields))
+
+    def _normalized(self):
+        return dict((key, values)
+                    for key, (_, values) in self._get_index().iteritems())
+
+    def _frozen(self):
+        """
+        Lowercase header names mapped to vectors of values, which headers hash
+        the same as.
+        """
+        return pmap((key, pvector(values))
+                    for key, (_, values) in self._get_index().iteritems())
+
+    def __eq__(self, other):
+        """
+        Headers are equal to other header maps with the same headers,
+        regardless of the case of their names and whether single values are
+        in a sequence.
+
+        Since those maps can hash differently, a hashable header map is only
+        equal if it also hashes the same, as a `pyrsistent.PMap` of lowercase
+        names to vectors of values does. Such a map compares itself to
+        headers by their names as reported, so only this direction of the
+        comparison is case-insensitive.
+        """
+        if isinstance(other, Headers):
+            return self._normalized() == other._normalized()
+        if isinstance(other, Mapping):
+            if self._normalized() != Headers.from_map(other)._normalized():
+                return False
+            try:
+                return hash(other) == hash(self)
+            except TypeError:
+                return True
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash(self._frozen())
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, list(self.pairs()))
+
+
+def get_header(headers, name, default=None):
+    """
+    All values for a header by name.
+
+    :param headers: Header map.
+    :param bytes name: Header name, in any case.
+    :param default: Value to return if the header does not exist.
+    :rtype: List[bytes]
+    """
+    if headers is None:
+        return default
+    if isinstance(headers, Headers):
+        return headers.get(name, default)
+    value = headers.get(name)
+    if value is not None:
+        return _values(value)
+    name = name.lower()
+    for k, value in headers.items():
+        if k.lower() == name:
+            return _values(value)
+    return default
+
+
+def get_first_header(headers, name, default=None):
+    """
+    Only the first value for a header by name.
+
+    :param headers: Header map.
+    :param bytes name: Header name, in any case.
+    :param default: Value to return if the header does not exist.
+    :rtype: bytes
+    """
+    if isinstance(headers, Headers):
+        return headers.first(name, default)
+    values = get_header(headers, name)
+    if not values:
+        return default
+    return values[0]
+
+
+def get_header_tokens(headers, name):
+    """
+    All the elements of a comma-separated list header, such as
+    ``Content-Encoding``, across all of its values.
+
+    :param headers: Header map.
+    :param bytes name: Header name, in any case.
+    :rtype: List[bytes]
+    """
+    return [token.strip()
+            for value in get_header(headers, name, [])
+            for token in value.split(b',')
+            if token.strip()]
+
+
+def discard_header(headers, name):
+    """
+    Remove a header, in any case, from a header map.
+
+    :param headers: Header map.
+    :param bytes name: Header name, in any case.
+    :return: Updated header map.
+    """
+    if isinstance(headers, Headers):
+        return headers.discard(name)
+    name = name.lower()
+    for k in list(headers):
+        if k.lower() == name:
+            headers = headers.discard(k)
+    return headers
+
+
+def set_header(headers, name, value):
+    """
+    Set a header, replacing any existing one in any case, in a header map.
+
+    :param headers: Header map.
+    :param bytes name: Header name.
+    :param value: Header value, or sequence of values.
+    :return: Updated header map.
+    """
+    return discard_header(headers, name).set(name, value)
+
+
+__all__ = [
+    'Headers', 'get_header', 'get_first_header', 'get_header_tokens', 'discard_header',
+    'set_header']
@@ -0,0 +1,204 @@
+"""
+Encoding response bodies as JSON.
+"""
+from collections import Mapping, Sequence, Set
+
+from pyrsistent import m
+from twisted.internet.defer import Deferred
+
+from fugue._keys import RESPONSE
+from fugue.interceptors.basic import Interceptor
+from fugue.interceptors.http.headers import (
+    discard_header, get_header, set_header)
+from fugue.json_backend import get_backend
+from fugue.lazy import FrozenMapView, FrozenVectorView, lazy_thaw
+from fugue.util import namespace
+
+
+_ns = namespace(__name__)
+
+#: Statuses whose responses have no body.
+_NO_BODY_STATUSES = frozenset([204, 304])
+
+
+class _JSONArray(object):
+    """
+    Marker for an iterable to be encoded as a JSON array, see `json_array`.
+    """
+    def __init__(self, iterable):
+        self.iterable = iterable
+
+
+def json_array(iterable):
+    """
+    Mark an iterable, such as a generator, as a response body to be encoded as
+    a JSON array by `json_response`.
+
+    The iterable is only consumed as the response is written, which means its
+    items need not all exist in memory at once.
+
+    :param iterable: Items of the array.
+    """
+    return _JSONArray(iterable)
+
+
+def _default(obj):
+    """
+    ``default`` hook for JSON backends, encoding the `pyrsistent` and
+    `fugue.lazy` structures one level at a time.
+    """
+    if isinstance(obj, (FrozenMapView, FrozenVectorView)):
+        # The underlying structure is already plain, and needs no conversion.
+        return lazy_thaw(obj)
+    elif isinstance(obj, Mapping):
+        return dict(obj.iteritems())
+    elif isinstance(obj, (Sequence, Set)):
+        return list(obj)
+    raise TypeError('{!r} is not JSON serializable'.format(obj))
+
+
+def _encodable(body):
+    """
+    Is ``body`` something `json_response` should encode?
+    """
+    if isinstance(body, (bytes, unicode)):
+        return False
+    return isinstance(body, (Mapping, Sequence, Set, _JSONArray))
+
+
+def _chunked(pieces, chunk_size):
+    """
+    Join an iterable of ``bytes`` into chunks of at least ``chunk_size`` bytes,
+    except for the last one.
+    """
+    buf = []
+    size = 0
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield b''.join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield b''.join(buf)
+
+
+def _array_pieces(items, dumps):
+    """
+    Encode an iterable as a JSON array, one item at a time.
+    """
+    yield b'['
+    first = True
+    for item in items:
+        if first:
+            first = False
+        else:
+            yield b','
+        yield dumps(item, _default)
+    yield b']'
+
+
+def _object_pieces(mapping, dumps):
+    """
+    Encode a mapping as a JSON object, one member at a time.
+    """
+    yield b'{'
+    first = True
+    for key, value in mapping.iteritems():
+        if first:
+            first = False
+        else:
+            yield b','
+        # Encoding the member as an object of its own converts, or rejects,
+        # its key exactly as encoding the whole mapping would.
+        yield dumps({key: value}, _default)[1:-1]
+    yield b'}'
+
+
+def _encode_body(body, dumps, stream_threshold, chunk_size):
+    """
+    Encode a response body as JSON.
+
+    :rtype: ``bytes`` or ``Iterator[bytes]``
+    """
+    if isinstance(body, _JSONArray):
+        return _chunked(_array_pieces(body.iterable, dumps), chunk_size)
+    elif stream_threshold is not None and len(body) > stream_threshold:
+        if isinstance(body, Mapping):
+            pieces = _object_pieces(body, dumps)
+        else:
+            pieces = _array_pieces(body, dumps)
+        return _chunked(pieces, chunk_size)
+    return dumps(body, _default)
+
+
+def _encode_response(response, dumps, content_type, stream_threshold,
+                     chunk_size):
+    """
+    Encode a response, with its body already resolved, if its body is a JSON
+    encodable structure.
+    """
+    body = response.get('body')
+    if (not _encodable(body) or
+            response.get('status') in _NO_BODY_STATUSES):
+        return response
+    body = _encode_body(body, dumps, stream_threshold, chunk_size)
+    headers = response.get('headers') or m()
+    if not get_header(headers, b'Content-Type'):
+        headers = set_header(headers, b'Content-Type', content_type)
+    headers = discard_header(headers, b'Content-Length')
+    if isinstance(body, bytes):
+        headers = set_header(headers, b'Content-Length', bytes(len(body)))
+    return response.update(m(body=body, headers=headers))
+
+
+def json_response(backend=None, content_type=b'application/json',
+                  stream_threshold=2 ** 10, chunk_size=2 ** 16):
+    """
+    An interceptor that encodes structured response bodies as JSON in the
+    leave stage.
+
+    Bodies that are mappings (including `pyrsistent.PMap`), sequences or sets
+    (including `pyrsistent.PVector` and `pyrsistent.PSet`), or a `Deferred`
+    that fires with one of those, are encoded; anything else, such as
+    ``bytes``, is left as it is.
+
+    Collections with more than ``stream_threshold`` members, and iterables
+    marked with `json_array`, are encoded one member at a time as the body is
+    written, in chunks of about ``chunk_size`` bytes, instead of building the
+    entire document up front; these responses have no ``Content-Length`` and
+    are sent with chunked transfer encoding. Anything else is encoded in one
+    go, and gets a ``Content-Length``.
+
+    :param backend: JSON backend, or its name, to encode with, see
+    `fugue.json_backend.get_backend`.
+    :param bytes content_type: ``Content-Type`` for responses that do not
+    already have one.
+    :param int stream_threshold: Number of members beyond which a collection
+    is streamed, ``None`` to never stream collections.
+    :param int chunk_size: Approximate size of streamed chunks.
+    :rtype: Interceptor
+    """
+    dumps = get_backend(backend).dumps
+
+    def _encode(response):
+        return _encode_response(
+            response, dumps, content_type, stream_threshold, chunk_size)
+
+    def _json_response_leave(context):
+        response = context.get(RESPONSE)
+        if response is None:
+            return context
+        body = response.get('body')
+        if isinstance(body, Deferred):
+            return body.addCallback(
+                lambda body: context.set(
+                    RESPONSE, _encode(response.set('body', body))))
+        return context.set(RESPONSE, _encode(response))
+    return Interceptor(
+        name=_ns('json_response'),
+        leave=_json_response_leave)
+
+
+__all__ = ['json_response', 'json_array']
@@ -0,0 +1,310 @@
+"""
+Server-sent events, streamed to the client as ``text/event-stream``.
+"""
+from collections import Mapping
+
+from pyrsistent import m
+from twisted.internet.defer import Deferred
+from twisted.internet.error import ConnectionLost
+from twisted.python.failure import Failure
+from twisted.web.iweb import IBodyProducer, UNKNOWN_LENGTH
+from zope.interface import implementer
+
+from fugue.interceptors.http.headers import Headers
+
+
+#: Number of buffered bytes after which no more items are pulled from a
+#: source until they have been written.
+_PULL_THRESHOLD = 2 ** 14
+
+
+class SlowConsumer(Exception):
+    """
+    More events were buffered, waiting for the client to read them, than an
+    `EventStream` allows.
+    """
+
+
+def _text(value):
+    """
+    Encode a field value as UTF-8.
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return bytes(value)
+
+
+def format_event(data, event=None, id=None, retry=None):
+    """
+    Format a server-sent event.
+
+    :param data: Event data, `bytes` or `unicode`, which may span several
+    lines.
+    :param event: Event type, or ``None`` for the default type.
+    :param id: Event identifier, or ``None``.
+    :param int retry: Reconnection time, in milliseconds, or ``None``.
+    :rtype: bytes
+    """
+    lines = []
+    if event is not None:
+        lines.append(b'event: ' + _text(event))
+    if id is not None:
+        lines.append(b'id: ' + _text(id))
+    if retry is not None:
+        lines.append(b'retry: ' + bytes(int(retry)))
+    lines.extend(
+        b'data: ' + line for line in _text(data).splitlines() or [b''])
+    return b'\n'.join(lines) + b'\n\n'
+
+
+def _format(item):
+    """
+    Format an item from an event source, either event data or a map of
+    `format_event` arguments.
+    """
+    if isinstance(item, Mapping):
+        return format_event(**item)
+    return format_event(item)
+
+
+@implementer(IBodyProducer)
+class EventStream(object):
+    """
+    Response body that streams server-sent events for as long as the stream
+    is open.
+
+    Events can be sent from anywhere with `send`, or pulled from a ``source``
+    iterable, each of which is either event data, a map of `format_event`
+    arguments or a `Deferred` that fires with one of these; the next item is
+    only pulled once the previous one has been delivered and the client is
+    keeping up.
+
+    Events sent together, in the same reactor iteration, are written to the
+    client together. If nothing has been written for ``heartbeat`` seconds a
+    comment is written, keeping intermediaries from closing an idle
+    connection. The stream ends when it is closed, the source is exhausted or
+    the client goes away; use `when_closed` to clean up.
+    """
+    length = UNKNOWN_LENGTH
+
+    def __init__(self, source=None, heartbeat=15, max_buffer=2 ** 20,
+                 clock=None):
+        """
+        :param source: Iterable of events, or ``None``.
+        :param heartbeat: Number of idle seconds between heartbeats, or
+        ``None`` to disable them.
+        :param int max_buffer: Maximum number of bytes to buffer for a client
+        that is not keeping up, before giving up on it.
+        :param clock: `IReactorTime` provider, the global reactor if
+        ``None``.
+        """
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self._clock = clock
+        self._source = iter(source) if source is not None else None
+        self._heartbeat = heartbeat
+        self._max_buffer = max_buffer
+        self._buffer = []
+        self._buffered = 0
+        self._consumer = None
+        self._paused = False
+        self._closing = False
+        self._ended = False
+        self._finished = Deferred(lambda _: self.stopProducing())
+        self._pending = None
+        self._flush_call = None
+        self._heartbeat_call = None
+        self._close_waiters = []
+
+    @property
+    def closed(self):
+        """
+        Has the stream ended?
+        """
+        return self._closing or self._ended
+
+    def when_closed(self):
+        """
+        Be notified when the stream ends.
+
+        :rtype: Deferred
+        :return: Fires with ``None`` when the stream ends, for whatever
+        reason.
+        """
+        d = Deferred()
+        if self._ended:
+            d.callback(None)
+        else:
+            self._close_waiters.append(d)
+        return d
+
+    def send(self, data, event=None, id=None, retry=None):
+        """
+        Send an event, see `format_event`.
+
+        Events sent after the stream has ended are discarded.
+        """
+        self._write(format_event(data, event, id, retry))
+
+    def comment(self, text=b''):
+        """
+        Send a comment, which clients ignore.
+        """
+        self._write(b''.join(b':' + line + b'\n'
+                             for line in _text(text).splitlines() or [b'']) +
+                    b'\n')
+
+    def close(self):
+        """
+        End the stream, once everything sent so far has been written.
+        """
+        if self.closed:
+            return
+        self._closing = True
+        if self._consumer is not None:
+            self._flush()
+            self._end(None)
+
+    def _write(self, data):
+        """
+        Buffer data to be written, with anything else sent in this reactor
+        iteration.
+        """
+        if self.closed:
+            return
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered > self._max_buffer:
+            self._end(Failure(SlowConsumer(
+                'Client is not reading events fast enough')))
+        elif (self._consumer is not None and not self._paused and
+                self._flush_call is None):
+            self._flush_call = self._clock.callLater(0, self._flush)
+
+    def _flush(self):
+        """
+        Write everything buffered to the client.
+        """
+        if self._flush_call is not None:
+            if self._flush_call.active():
+                self._flush_call.cancel()
+            self._flush_call = None
+        if self._buffer:
+            data = b''.join(self._buffer)
+            self._buffer = []
+            self._buffered = 0
+            self._consumer.write(data)
+        self._schedule_heartbeat()
+        self._pull()
+
+    def _schedule_heartbeat(self):
+        """
+        Schedule a heartbeat, replacing any already scheduled.
+        """
+        if self._heartbeat_call is not None and self._heartbeat_call.active():
+            self._heartbeat_call.cancel()
+        self._heartbeat_call = None
+        if self._heartbeat is not None and not self.closed:
+            self._heartbeat_call = self._clock.callLater(
+                self._heartbeat, self._beat)
+
+    def _beat(self):
+        self._heartbeat_call = None
+        self.comment()
+
+    def _pull(self):
+        """
+        Pull items from the source until one is not immediately available, or
+        the client is not keeping up.
+        """
+        while (self._source is not None and self._pending is None and
+               not self._paused and not self.closed and
+               self._buffered < _PULL_THRESHOLD):
+            try:
+                item = next(self._source)
+            except StopIteration:
+                self._source = None
+                self.close()
+                return
+            except Exception:
+                self._end(Failure())
+                return
+            if isinstance(item, Deferred):
+                self._pending = item
+                item.addCallbacks(self._delivered, self._undelivered)
+            else:
+                self._write(_format(item))
+
+    def _delivered(self, item):
+        self._pending = None
+        self._write(_format(item))
+        self._pull()
+
+    def _undelivered(self, f):
+        self._pending = None
+        self._end(f)
+
+    def _end(self, result):
+        """
+        End the stream with a result for `startProducing`.
+        """
+        if self._ended:
+            return
+        self._ended = True
+        for call in [self._flush_call, self._heartbeat_call]:
+            if call is not None and call.active():
+                call.cancel()
+        self._flush_call = self._heartbeat_call = None
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.cancel()
+        close = getattr(self._source, 'close', None)
+        self._source = None
+        if close is not None:
+            close()
+        self._finished.callback(result)
+        waiters, self._close_waiters = self._close_waiters, []
+        for d in waiters:
+            d.callback(None)
+
+    def startProducing(self, consumer):
+        self._consumer = consumer
+        if self._ended:
+            return self._finished
+        self._flush()
+        if self._closing:
+            self._end(None)
+        return self._finished
+
+    def pauseProducing(self):
+        self._paused = True
+
+    def resumeProducing(self):
+        self._paused = False
+        if self._consumer is not None and not self.closed:
+            self._flush()
+
+    def stopProducing(self):
+        self._end(Failure(ConnectionLost('Event stream stopped')))
+
+
+def event_stream_response(stream, headers=()):
+    """
+    Create a response that streams server-sent events.
+
+    :param EventStream stream: Event stream.
+    :param headers: Additional response headers, as ``(name, value)`` pairs.
+    :return: Response map.
+    """
+    return m(
+        status=200,
+        headers=Headers([
+            (b'Content-Type', b'text/event-stream; charset=utf-8'),
+            # Compressing, or buffering, the stream would hold events back.
+            (b'Cache-Control', b'no-cache, no-transform'),
+            (b'X-Accel-Buffering', b'no')] + list(headers)),
+        body=stream)
+
+
+__all__ = [
+    'EventStream', 'event_stream_response', 'format_event', 'SlowConsumer']
@@ -3,11 +3,18 @@ from __future__ import absolute_import
 import cgi
 
 from hyperlink import URL
-from pyrsistent import freeze, m, thaw
-from twisted.internet.defer import Deferred, succeed
-
-from fugue._keys import REQUEST, RESPONSE
+from pyrsistent import m
+from twisted.internet.defer import CancelledError, Deferred, succeed
+from twisted.internet.error import ConnectionLost
+from twisted.python import log
+from twisted.python.compat import intToBytes
+from twisted.web.http import NO_BODY_CODES
+
+from fugue._keys import DISCONNECTED, REQUEST, RESPONSE
+from fugue.interceptors._producers import write_body
 from fugue.interceptors.basic import Interceptor
+from fugue.interceptors.http.headers import _values, Headers
+from fugue.lazy import delay, LazyMap
 from fugue.util import namespace, url_path
 
 
@@ -42,15 +49,11 @@ def _get_content_type(headers, default=b'application/octet-stream'):
     return content_type, options.get('charset')
 
 
-def _nevow_request_to_request_map(req):
+def _host_and_port(headers, scheme):
     """
-    Convert a Nevow request object into an immutable request map.
+    Determine the server name and port from the ``Host`` header.
     """
-    headers = req.requestHeaders
-    content_type, character_encoding = _get_content_type(headers)
-    iri = URL.from_text(req.uri.decode('utf-8')).to_iri()
     host = _get_first_header(headers, b'host').decode('utf-8')
-    scheme = u'https' if req.isSecure() else u'http'
     if u':' in host:
         host, port = host.split(u':', 1)
         port = int(port)
@@ -58,44 +61,149 @@ def _nevow_request_to_request_map(req):
         port = {
             u'https': 443,
             u'http': 80}.get(scheme)
-    return m(
-        body=req.content,
-        content_type=content_type,
-        content_length=_get_first_header(headers, b'content-length'),
-        character_encoding=character_encoding,
-        headers=freeze(dict(headers.getAllRawHeaders())),
-        remote_addr=req.getClientIP(),
-        request_method=req.method,
-        server_name=host,
-        server_port=port,
-        scheme=scheme,
-        #ssl_client_cert=XXX,
-        uri=iri,
-        #query_string
-        path_info=url_path(iri),
-        protocol=getattr(req, 'clientproto', None))
+    return host, port
+
+
+def _nevow_request_to_request_map(req):
+    """
+    Convert a Nevow request object into an immutable request map.
+
+    Only trivial values are computed up front, everything else is computed on
+    first access, see `fugue.lazy.LazyMap`.
+    """
+    headers = req.requestHeaders
+    scheme = u'https' if req.isSecure() else u'http'
+    content_type = delay(lambda: _get_content_type(headers))
+    iri = delay(lambda: URL.from_text(req.uri.decode('utf-8')).to_iri())
+    host_and_port = delay(lambda: _host_and_port(headers, scheme))
+    return LazyMap(
+        m(body=req.content,
+          request_method=req.method,
+          scheme=scheme,
+          #ssl_client_cert=XXX,
+          #query_string
+          protocol=getattr(req, 'clientproto', None)),
+        dict(
+            content_type=lambda: content_type()[0],
+            content_length=lambda: _get_first_header(
+                headers, b'content-length'),
+            character_encoding=lambda: content_type()[1],
+            headers=lambda: Headers.from_map(headers.getAllRawHeaders()),
+            remote_addr=req.getClientIP,
+            server_name=lambda: host_and_port()[0],
+            server_port=lambda: host_and_port()[1],
+            uri=iri,
+            path_info=lambda: url_path(iri())))
+
+
+def _disconnected(context):
+    """
+    Has the client gone away before the response was finished?
+
+    Adapters that track this put a callable answering the question in the
+    context at `DISCONNECTED`, without it the client is assumed to still be
+    there.
+    """
+    disconnected = context.get(DISCONNECTED)
+    return disconnected is not None and disconnected()
+
+
+def _body_failed(f, context, req):
+    """
+    Handle a response body that failed part of the way through being written.
+
+    The status and headers have already been sent, the best that can be done
+    is dropping the connection so that the client does not mistake the
+    response for a complete one.
+    """
+    if not (f.check(ConnectionLost, CancelledError) or
+            _disconnected(context)):
+        log.err(f, 'Writing response body failed')
+        req.loseConnection()
+
+
+def _set_headers(req, headers):
+    """
+    Set response headers on a Twisted request.
+    """
+    set_raw_headers = req.responseHeaders.setRawHeaders
+    if isinstance(headers, Headers):
+        # Values are already normalized lists.
+        for name, values in headers.items():
+            set_raw_headers(name, values)
+    else:
+        for name, values in headers.items():
+            set_raw_headers(name, _values(values))
+
+
+def _send_bytes(context, request_key, finish):
+    """
+    Write a response with a `bytes` body to the network in one go.
+
+    ``Content-Length`` is set from the body, unless the response already has
+    one or its status never has a body, so that Twisted does not fall back to
+    a chunked response. Nothing is written if the client has already
+    disconnected.
+
+    :return: The context, once the response has been written.
+    """
+    if _disconnected(context):
+        return context
+    req = context[request_key]
+    response = context[RESPONSE]
+    status = response['status']
+    body = response['body']
+    req.setResponseCode(status)
+    headers = response.get('headers')
+    if headers:
+        _set_headers(req, headers)
+    if (status not in NO_BODY_CODES and
+            not req.responseHeaders.hasHeader(b'Content-Length')):
+        req.responseHeaders.setRawHeaders(
+            b'Content-Length', [intToBytes(len(body))])
+    if body:
+        req.write(body)
+    finish(context)
+    return context
 
 
 def _send_response(context, request_key, finish):
     """
     Write a response to the network.
+
+    The body is written with flow control, see
+    `fugue.interceptors._producers.write_body`, or in one go if it is
+    `bytes`, see `_send_bytes`. Nothing is written if the client has already
+    disconnected.
+
+    :rtype: Deferred
+    :return: Fires with the context once the response has been written.
     """
-    req = context[request_key]
+    def _finish(_):
+        finish(context)
+        return context
+
     response = context[RESPONSE]
+    body = response.get('body')
+    if isinstance(body, bytes):
+        return succeed(_send_bytes(context, request_key, finish))
+    if _disconnected(context):
+        return succeed(context)
+    req = context[request_key]
     req.setResponseCode(response['status'])
-    for k, v in response.get('headers', {}).items():
-        if isinstance(v, (str, unicode)):
-            v = [v]
-        req.responseHeaders.setRawHeaders(k, thaw(v))
-    req.write(response['body'])
-    finish(context)
+    headers = response.get('headers')
+    if headers:
+        _set_headers(req, headers)
+    d = write_body(req, body)
+    return d.addCallbacks(
+        _finish,
+        lambda f: _body_failed(f, context, req) or context)
 
 
 def _send_error(context, message, request_key, finish):
     """
     Write an error response to the network.
     """
-    print 'lel', context
     _send_response(
         context.set(
             RESPONSE,
@@ -122,15 +230,24 @@ def _leave_nevow(request_key, finish=_noop):
     """
     Leave stage factory for Nevow interceptor.
 
-    Set the HTTP status code, any response headers and write the body (`bytes`
-    or `Deferred`) to the network. If ``RESPONSE`` is nonexistent, an HTTP 500
-    error is written to the network instead.
+    Set the HTTP status code, any response headers and write the body to the
+    network. If ``RESPONSE`` is nonexistent, an HTTP 500 error is written to
+    the network instead.
+
+    The body may be `bytes`, an iterable of `bytes`, a
+    `fugue.interceptors.http.files.FileBody`, a file-like object, an
+    `IBodyProducer` provider or a `Deferred` that fires with any of these.
+    `bytes` bodies are written in one go, with a ``Content-Length``, anything
+    else is streamed, at the pace the client reads it, and the stage
+    completes once the whole body has been written.
+    Chunks of an iterable body may themselves be `Deferred`s, letting the
+    first bytes go out before the rest of the body is ready.
     """
     def _leave_nevow_inner(context):
         def _leave(body, context):
-            context = context.set('body', body)
-            _send_response(context, request_key, finish)
-            return context
+            context = context.set(
+                RESPONSE, context[RESPONSE].set('body', body))
+            return _send_response(context, request_key, finish)
 
         response = context.get(RESPONSE)
         if response is None:
@@ -141,6 +258,8 @@ def _leave_nevow(request_key, finish=_noop):
                 finish)
             return succeed(context)
         body = response.get('body')
+        if isinstance(body, bytes):
+            return _send_bytes(context, request_key, finish)
         d = body if isinstance(body, Deferred) else succeed(body)
         d.addCallback(_leave, context)
         return d
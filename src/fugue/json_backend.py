@@ -0,0 +1,186 @@
+"""
+Interchangeable JSON implementations.
+
+The fastest implementations available, for decoding and encoding, are
+selected when this module is imported, see `DEFAULT_BACKEND`, falling back to
+the standard library `json` module.
+"""
+import codecs
+import json
+import platform
+from collections import Mapping, Sequence
+
+from pyrsistent import field, PRecord
+
+
+class JSONBackend(PRecord):
+    """
+    JSON implementation.
+    """
+    #: Name of the implementation.
+    name = field(type=str, mandatory=True)
+    #: ``loads(data, encoding=None)`` decoding a document from ``bytes`` in
+    #: ``encoding`` (UTF-8 if ``None``), or ``unicode``.
+    loads = field(mandatory=True)
+    #: ``dumps(obj, default=None)`` encoding an object as ASCII ``bytes``,
+    #: ``default`` is called for objects that cannot otherwise be encoded and
+    #: should return an encodable version of them or raise `TypeError`.
+    dumps = field(mandatory=True)
+
+
+def _decoded(data, encoding):
+    """
+    Decode ``bytes`` in any encoding other than UTF-8, which every backend
+    decodes natively.
+    """
+    if (isinstance(data, bytes) and encoding is not None and
+            codecs.lookup(encoding).name != 'utf-8'):
+        return data.decode(encoding)
+    return data
+
+
+def stdlib_backend():
+    """
+    Standard library `json` backend.
+    """
+    return JSONBackend(
+        name='json',
+        loads=lambda data, encoding=None: json.loads(_decoded(data, encoding)),
+        dumps=lambda obj, default=None: json.dumps(
+            obj, default=default, separators=(',', ':')))
+
+
+def simplejson_backend():
+    """
+    `simplejson` backend, only when its C extension is available.
+
+    :raise ImportError: If `simplejson`, or its C extension, is not available.
+    """
+    import simplejson
+    from simplejson import _speedups  # noqa
+
+    def _loads(data, encoding=None):
+        # Decoding ``bytes`` produces ``str`` values for ASCII strings, decode
+        # to ``unicode`` first for the same results as the standard library.
+        if isinstance(data, bytes):
+            data = data.decode(encoding or 'utf-8')
+        return simplejson.loads(data)
+    return JSONBackend(
+        name='simplejson',
+        loads=_loads,
+        dumps=lambda obj, default=None: simplejson.dumps(
+            obj, default=default, separators=(',', ':')))
+
+
+_UJSON_NATIVE = (bytes, unicode, int, long, float, bool, type(None))
+
+
+def _encodable(obj, default):
+    """
+    Convert ``obj`` into something `ujson` can encode, calling ``default`` for
+    anything that is not a builtin JSON type.
+    """
+    if isinstance(obj, _UJSON_NATIVE):
+        return obj
+    elif isinstance(obj, Mapping):
+        return {k: _encodable(v, default) for k, v in obj.iteritems()}
+    elif isinstance(obj, Sequence):
+        return [_encodable(v, default) for v in obj]
+    return _encodable(default(obj), default)
+
+
+def ujson_backend():
+    """
+    `ujson` backend.
+
+    `ujson` encodes floats with at most 15 significant digits, and cannot
+    decode integers that do not fit into 64 bits, which is why it is never
+    selected by default.
+
+    :raise ImportError: If `ujson` is not available.
+    """
+    import ujson
+
+    def _loads(data, encoding=None):
+        return ujson.loads(_decoded(data, encoding), precise_float=True)
+
+    def _dumps(obj, default=None):
+        if default is not None:
+            obj = _encodable(obj, default)
+        return ujson.dumps(
+            obj, double_precision=15, escape_forward_slashes=False)
+    return JSONBackend(name='ujson', loads=_loads, dumps=_dumps)
+
+
+#: Backend factories by name.
+BACKENDS = {
+    'json': stdlib_backend,
+    'simplejson': simplejson_backend,
+    'ujson': ujson_backend,
+}
+
+
+def _first_available(candidates):
+    """
+    The first available backend out of ``candidates``, falling back to the
+    standard library.
+    """
+    for name in candidates:
+        try:
+            return BACKENDS[name]()
+        except ImportError:
+            continue
+    return stdlib_backend()
+
+
+def select_backend(candidates=None):
+    """
+    Select the first available JSON backend.
+
+    By default decoding and encoding are chosen separately, for the running
+    interpreter: the standard library `json` module on PyPy is as fast as any
+    of the alternatives, on CPython `simplejson` decodes faster, when its C
+    extension is available, but the standard library encodes faster.
+
+    :param candidates: Names of backends, from `BACKENDS`, in order of
+    preference. ``None`` to use the default preference for the running
+    interpreter.
+    :rtype: JSONBackend
+    """
+    if candidates is not None:
+        return _first_available(candidates)
+    if platform.python_implementation() == 'PyPy':
+        return stdlib_backend()
+    loads = _first_available(['simplejson', 'json'])
+    dumps = stdlib_backend()
+    if loads.name == dumps.name:
+        return dumps
+    return JSONBackend(
+        name='{}+{}'.format(loads.name, dumps.name),
+        loads=loads.loads,
+        dumps=dumps.dumps)
+
+
+#: Backend selected when this module was imported.
+DEFAULT_BACKEND = select_backend()
+
+
+def get_backend(backend=None):
+    """
+    Resolve a JSON backend.
+
+    :param backend: `JSONBackend`, the name of one in `BACKENDS` or ``None``
+    for `DEFAULT_BACKEND`.
+    :raise ImportError: If the named backend is not available.
+    :rtype: JSONBackend
+    """
+    if backend is None:
+        return DEFAULT_BACKEND
+    elif isinstance(backend, JSONBackend):
+        return backend
+    return BACKENDS[backend]()
+
+
+__all__ = [
+    'JSONBackend', 'BACKENDS', 'DEFAULT_BACKEND', 'select_backend',
+    'get_backend', 'stdlib_backend', 'simplejson_backend', 'ujson_backend']
@@ -0,0 +1,414 @@
+"""
+Immutable data structures that defer work until a value is actually used.
+"""
+from collections import Mapping, Sequence
+
+from pyrsistent import freeze, pmap, PMap
+from twisted.python.failure import Failure
+
+
+def _delegate_to_frozen(name):
+    """
+    Create a method that delegates to the same method on the fully frozen
+    version of a view, for operations that produce a new structure.
+    """
+    def _delegate_to_frozen_inner(self, *a, **kw):
+        return getattr(self.freeze(), name)(*a, **kw)
+    _delegate_to_frozen_inner.__name__ = name
+    return _delegate_to_frozen_inner
+
+
+class _FrozenView(object):
+    """
+    Base for read-only views over plain Python structures.
+
+    Nested ``dict`` and ``list`` values are wrapped in views of their own on
+    first access, and cached, which means a structure that is only partially
+    read is only partially wrapped and never copied.
+    """
+    __slots__ = ['_data', '_views', '_frozen']
+
+    def __init__(self, data):
+        """
+        :param data: Structure to view, which must not be mutated afterwards.
+        """
+        self._data = data
+        self._views = {}
+        self._frozen = None
+
+    def _wrap(self, key, value):
+        """
+        Wrap a value retrieved by ``key``, if it is a container.
+        """
+        if isinstance(value, (dict, list)):
+            view = self._views.get(key)
+            if view is None:
+                view = self._views[key] = lazy_freeze(value)
+            return view
+        return value
+
+    def freeze(self):
+        """
+        Fully convert the view into its `pyrsistent` equivalent.
+        """
+        if self._frozen is None:
+            self._frozen = freeze(self._data)
+        return self._frozen
+
+    def __len__(self):
+        return len(self._data)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.freeze())
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self._data)
+
+
+class FrozenMapView(_FrozenView, Mapping):
+    """
+    Immutable, lazily frozen view over a ``dict`` with the interface of a
+    `pyrsistent.PMap`.
+    """
+    __slots__ = []
+
+    def __getitem__(self, key):
+        return self._wrap(key, self._data[key])
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenMapView):
+            return self._data == other._data
+        return Mapping.__eq__(self, other)
+
+    __hash__ = _FrozenView.__hash__
+
+    set = _delegate_to_frozen('set')
+    discard = _delegate_to_frozen('discard')
+    remove = _delegate_to_frozen('remove')
+    update = _delegate_to_frozen('update')
+    update_with = _delegate_to_frozen('update_with')
+    transform = _delegate_to_frozen('transform')
+    evolver = _delegate_to_frozen('evolver')
+
+
+class FrozenVectorView(_FrozenView, Sequence):
+    """
+    Immutable, lazily frozen view over a ``list`` with the interface of a
+    `pyrsistent.PVector`.
+    """
+    __slots__ = []
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FrozenVectorView(self._data[index])
+        value = self._data[index]
+        return self._wrap(index % len(self._data), value)
+
+    def __iter__(self):
+        for index, value in enumerate(self._data):
+            yield self._wrap(index, value)
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenVectorView):
+            return self._data == other._data
+        if (not isinstance(other, Sequence) or
+                isinstance(other, (bytes, unicode))):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            a == b for a, b in zip(self, other))
+
+    __hash__ = _FrozenView.__hash__
+
+    set = _delegate_to_frozen('set')
+    mset = _delegate_to_frozen('mset')
+    append = _delegate_to_frozen('append')
+    extend = _delegate_to_frozen('extend')
+    delete = _delegate_to_frozen('delete')
+    remove = _delegate_to_frozen('remove')
+    transform = _delegate_to_frozen('transform')
+    evolver = _delegate_to_frozen('evolver')
+
+
+def lazy_freeze(o):
+    """
+    Lazy version of `pyrsistent.freeze`.
+
+    ``dict`` and ``list`` values are wrapped in an immutable view, their
+    contents are only wrapped (recursively) when accessed. Any other value is
+    frozen immediately.
+
+    :rtype: `FrozenMapView`, `FrozenVectorView` or the result of
+    `pyrsistent.freeze`.
+    """
+    if isinstance(o, dict):
+        return FrozenMapView(o)
+    elif isinstance(o, list):
+        return FrozenVectorView(o)
+    return freeze(o)
+
+
+def lazy_thaw(o):
+    """
+    The plain structure underlying a view created by `lazy_freeze`, without
+    converting anything.
+
+    The result is shared with the view, and must not be mutated.
+
+    :return: The ``dict`` or ``list`` underlying a `FrozenMapView` or
+    `FrozenVectorView`, anything else as it is.
+    """
+    if isinstance(o, _FrozenView):
+        return o._data
+    return o
+
+
+class _Delay(object):
+    """
+    Zero-argument callable that memoizes the result, or exception, of the
+    first call to a function.
+    """
+    __slots__ = ['_f', '_result', '_failure']
+
+    def __init__(self, f):
+        self._f = f
+        self._result = None
+        self._failure = None
+
+    def __call__(self):
+        f = self._f
+        if f is not None:
+            self._f = None
+            try:
+                self._result = f()
+            except:
+                self._failure = Failure()
+        if self._failure is not None:
+            self._failure.raiseException()
+        return self._result
+
+
+def delay(f):
+    """
+    Delay calling a function until its result is needed, the result (or
+    exception) of the first call is remembered for subsequent calls.
+
+    :param f: Callable taking no arguments.
+    :rtype: Callable[[], Any]
+    """
+    if isinstance(f, _Delay):
+        return f
+    return _Delay(f)
+
+
+class LazyMap(Mapping):
+    """
+    Immutable map, with the interface of a `pyrsistent.PMap`, where some
+    values are only computed on first access.
+
+    A lazy value that raises `KeyError` indicates the key is absent from the
+    map, which means that determining the length of a map, iterating it or
+    comparing it requires computing all lazy values.
+
+    Computed values are shared by all maps derived from the same one.
+    """
+    __slots__ = ['_values', '_thunks']
+
+    def __init__(self, values=pmap(), thunks=pmap()):
+        """
+        :param values: Mapping of keys to values.
+        :param thunks: Mapping of keys to callables taking no arguments,
+        that compute values lazily.
+        """
+        self._values = values if isinstance(values, PMap) else pmap(values)
+        self._thunks = pmap({k: delay(f) for k, f in thunks.items()
+                             if k not in self._values})
+
+    @classmethod
+    def _create(cls, values, thunks):
+        """
+        Create a map from already conformed values and thunks.
+        """
+        lazy_map = cls.__new__(cls)
+        lazy_map._values = values
+        lazy_map._thunks = thunks
+        return lazy_map
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            return self._thunks[key]()
+
+    def __getattr__(self, key):
+        if key.startswith('_'):
+            raise AttributeError(key)
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __contains__(self, key):
+        if key in self._values:
+            return True
+        thunk = self._thunks.get(key)
+        if thunk is None:
+            return False
+        try:
+            thunk()
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for key in self._values:
+            yield key
+        for key in self._thunks:
+            if key in self:
+                yield key
+
+    def __len__(self):
+        return len(self._values) + sum(1 for key in self._thunks if key in self)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        return Mapping.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(frozenset(self.iteritems()))
+
+    def __repr__(self):
+        return 'LazyMap({!r}, pending={!r})'.format(
+            dict(self._values), sorted(self._thunks))
+
+    def set(self, key, value):
+        """
+        Return a new map with ``key`` set to ``value``.
+        """
+        return self._create(
+            self._values.set(key, value), self._thunks.discard(key))
+
+    def set_lazy(self, key, f):
+        """
+        Return a new map with the value for ``key`` computed, by calling ``f``
+        with no arguments, on first access.
+        """
+        return self._create(
+            self._values.discard(key), self._thunks.set(key, delay(f)))
+
+    def discard(self, key):
+        """
+        Return a new map without ``key``, if it exists.
+        """
+        return self._create(
+            self._values.discard(key), self._thunks.discard(key))
+
+    def remove(self, key):
+        """
+        Return a new map without ``key``, raising `KeyError` if it does not
+        exist.
+        """
+        if key not in self:
+            raise KeyError(key)
+        return self.discard(key)
+
+    def update(self, *maps):
+        """
+        Return a new map with the keys and values of ``maps`` merged into it.
+        """
+        e = self.evolver()
+        for mapping in maps:
+            for k, v in mapping.items():
+                e[k] = v
+        return e.persistent()
+
+    def transform(self, *transformations):
+        """
+        Transform arbitrarily complex combinations of maps and vectors, see
+        `pyrsistent.PMap.transform`.
+
+        Only the lazy values along transformed paths are computed, unless a
+        path begins with a matcher, such as `pyrsistent.ny`, which computes
+        them all.
+        """
+        paths = transformations[::2]
+        if all(path and not callable(path[0]) for path in paths):
+            keys = set(path[0] for path in paths)
+        else:
+            keys = set(self)
+        touched = pmap({key: self[key] for key in keys if key in self})
+        transformed = touched.transform(*transformations)
+        e = self.evolver()
+        for key in keys:
+            if key in transformed:
+                value = transformed[key]
+                if key not in touched or value is not touched[key]:
+                    e[key] = value
+            elif key in touched:
+                del e[key]
+        return e.persistent()
+
+    def evolver(self):
+        """
+        Create an evolver for this map.
+        """
+        return _LazyMapEvolver(self)
+
+
+class _LazyMapEvolver(object):
+    """
+    Evolver for `LazyMap`.
+    """
+    def __init__(self, original):
+        self._original = original
+        self._values = original._values.evolver()
+        self._thunks = original._thunks
+
+    def __getitem__(self, key):
+        return self.persistent()[key]
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def set(self, key, value):
+        self._values[key] = value
+        self._thunks = self._thunks.discard(key)
+        return self
+
+    def __delitem__(self, key):
+        self.remove(key)
+
+    def remove(self, key):
+        if key in self._values:
+            del self._values[key]
+        elif key in self._thunks:
+            self._thunks = self._thunks.discard(key)
+        else:
+            raise KeyError(key)
+        return self
+
+    def is_dirty(self):
+        return (self._values.is_dirty() or
+                self._thunks is not self._original._thunks)
+
+    def persistent(self):
+        if not self.is_dirty():
+            return self._original
+        return LazyMap._create(self._values.persistent(), self._thunks)
+
+
+__all__ = [
+    'FrozenMapView', 'FrozenVectorView', 'lazy_freeze', 'lazy_thaw', 'delay',
+    'LazyMap']
@@ -1,6 +1,7 @@
 from pyrsistent import freeze, m
 from testtools import TestCase
-from testtools.matchers import Contains, Equals, Is, MatchesListwise
+from testtools.matchers import (
+    Contains, ContainsDict, Equals, Is, MatchesListwise)
 from testtools.twistedsupport import succeeded
 from twisted.python.failure import Failure
 
@@ -54,6 +55,24 @@ class NevowAdapterResourceTests(TestCase):
             requests,
             MatchesListwise([Contains(NEVOW_REQUEST)]))
 
+    @depends_on('nevow')
+    def test_base_context(self):
+        """
+        Every request's context starts with the base context.
+        """
+        contexts = []
+        resource = nevow_adapter_resource(
+            [before(lambda context: contexts.append(context) or context)],
+            base_context={'service': 42})
+        req = fake_nevow_request()
+        self.assertThat(resource.renderHTTP(req), succeeded(Equals(b'')))
+        self.assertThat(
+            contexts,
+            MatchesListwise([
+                ContainsDict({
+                    'service': Equals(42),
+                    NEVOW_REQUEST: Is(req)})]))
+
     @depends_on('nevow')
     def test_body_status(self):
         """
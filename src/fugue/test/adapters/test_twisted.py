@@ -1,11 +1,18 @@
 from testtools import ExpectedException, TestCase
-from testtools.matchers import Contains, Equals, Is, MatchesListwise
+from testtools.matchers import AfterPreprocessing as After
+from testtools.matchers import (
+    Contains, ContainsDict, Equals, HasLength, Is, MatchesListwise)
+from twisted.internet.defer import CancelledError, Deferred
+from twisted.internet.error import ConnectionDone
+from twisted.python import log
 from twisted.python.failure import Failure
 from twisted.web.resource import Resource
 from twisted.web.server import NOT_DONE_YET
 
+from fugue._keys import DISCONNECTED, STACK
 from fugue.adapters.twisted import twisted_adapter_resource
-from fugue.interceptors import before, handler
+from fugue.interceptors import before, handler, Interceptor
+from fugue.interceptors.http.headers import Headers
 from fugue.interceptors.twisted import TWISTED_REQUEST
 from fugue.test.adapters.test_nevow import ok
 from fugue.test.interceptors.test_twisted import fake_twisted_request
@@ -53,6 +60,30 @@ class TwistedAdapterResourceTests(TestCase):
             next(request.finish.counter),
             Equals(1))
 
+    def test_base_context(self):
+        """
+        Every request's context starts with the base context, and is executed
+        with the same interceptors.
+        """
+        contexts = []
+        interceptor = before(
+            lambda context: contexts.append(context) or context)
+        resource = twisted_adapter_resource(
+            [interceptor], base_context={'service': 42})
+        requests = [fake_twisted_request(), fake_twisted_request()]
+        for req in requests:
+            resource.render(req)
+        self.assertThat(
+            contexts,
+            MatchesListwise([
+                ContainsDict({
+                    'service': Equals(42),
+                    TWISTED_REQUEST: Is(req),
+                    STACK: After(lambda stack: stack[0], Is(interceptor))})
+                for req in requests]))
+        self.assertThat(
+            contexts[0][STACK][1], Is(contexts[1][STACK][1]))
+
     def test_body_status(self):
         """
         Write a response body and status to the Twisted request.
@@ -89,6 +120,32 @@ class TwistedAdapterResourceTests(TestCase):
             req.responseHeaders.getRawHeaders(b'X-Bar'),
             Equals([b'bar']))
 
+    def test_content_length(self):
+        """
+        `bytes` bodies are written with a ``Content-Length`` instead of
+        chunked, unless the response already has one or never has a body.
+        """
+        def _headers(response):
+            resource = twisted_adapter_resource(
+                [handler(lambda _: response)])
+            req = fake_twisted_request()
+            resource.render(req)
+            self.assertThat(
+                next(req.finish.counter),
+                Equals(1))
+            return req.responseHeaders
+        self.assertThat(
+            _headers(ok(b'Hello world!')).getRawHeaders(b'Content-Length'),
+            Equals([b'12']))
+        self.assertThat(
+            _headers(
+                ok(b'Hello', headers=Headers([(b'content-length', b'5')]))
+            ).getRawHeaders(b'Content-Length'),
+            Equals([b'5']))
+        self.assertThat(
+            _headers(ok(b'', status=304)).hasHeader(b'Content-Length'),
+            Equals(False))
+
     def test_error(self):
         """
         If an exception is unhandled, set the response body and status
@@ -107,3 +164,111 @@ class TwistedAdapterResourceTests(TestCase):
         self.assertThat(
             req.code,
             Equals(500))
+
+    def test_streaming_body(self):
+        """
+        Iterable bodies are streamed to the Twisted request, which is only
+        finished once the whole body has been written.
+        """
+        def _chunks():
+            yield b'Hello '
+            yield b'world!'
+        resource = twisted_adapter_resource(
+            [handler(lambda _: ok(_chunks()))])
+        req = fake_twisted_request()
+        resource.render(req)
+        req.channel.transport.written.seek(0)
+        self.assertThat(
+            req.channel.transport.written.read(),
+            Contains(b'6\r\nHello \r\n6\r\nworld!\r\n'))
+        self.assertThat(
+            next(req.finish.counter),
+            Equals(1))
+
+    def test_deferred_chunks(self):
+        """
+        Chunks of an iterable body that are not yet available are waited for,
+        after writing those that are.
+        """
+        rest = Deferred()
+
+        def _chunks():
+            yield b'Hello '
+            yield rest
+        resource = twisted_adapter_resource(
+            [handler(lambda _: ok(_chunks()))])
+        req = fake_twisted_request()
+        resource.render(req)
+        written = req.channel.transport.written
+        self.assertThat(written.getvalue(), Contains(b'6\r\nHello \r\n'))
+        rest.callback(b'world!')
+        self.assertThat(written.getvalue(), Contains(b'6\r\nworld!\r\n'))
+        self.assertThat(
+            next(req.finish.counter),
+            Equals(1))
+
+    def test_streaming_body_failure(self):
+        """
+        If a streamed body fails part of the way through, the error is logged
+        and the connection is dropped instead of finishing the request.
+        """
+        def _chunks():
+            yield b'Hello '
+            raise RuntimeError('Nope')
+        errors = []
+        self.patch(log, 'err', lambda f, why: errors.append(f))
+        resource = twisted_adapter_resource(
+            [handler(lambda _: ok(_chunks()))])
+        req = fake_twisted_request()
+        resource.render(req)
+        self.assertThat(
+            errors,
+            MatchesListwise([After(lambda f: f.type, Is(RuntimeError))]))
+        self.assertThat(req.channel.transport.disconnected, Equals(True))
+        self.assertThat(
+            next(req.finish.counter),
+            Equals(0))
+
+    def test_disconnected(self):
+        """
+        Stages can tell whether the client has disconnected.
+        """
+        contexts = []
+        resource = twisted_adapter_resource([
+            before(lambda context: contexts.append(context) or Deferred())])
+        req = fake_twisted_request()
+        resource.render(req)
+        [context] = contexts
+        self.assertThat(context[DISCONNECTED](), Equals(False))
+        req.connectionLost(Failure(ConnectionDone()))
+        self.assertThat(context[DISCONNECTED](), Equals(True))
+
+    def test_disconnect(self):
+        """
+        If the client disconnects, the stage being waited on is cancelled, the
+        remaining "enter" stages are skipped, the "error" stages are run and
+        nothing is written to the request.
+        """
+        cancelled = []
+        entered = []
+        errors = []
+        resource = twisted_adapter_resource([
+            Interceptor(
+                name='cleanup',
+                error=lambda context, error: errors.append(error) or context),
+            before(lambda context: Deferred(cancelled.append)),
+            before(lambda context: entered.append(context) or context)])
+        req = fake_twisted_request()
+        transport = req.channel.transport
+        resource.render(req)
+        req.connectionLost(Failure(ConnectionDone()))
+        self.assertThat(cancelled, HasLength(1))
+        self.assertThat(entered, Equals([]))
+        self.assertThat(
+            errors,
+            MatchesListwise([
+                After(lambda error: error.failure.type, Is(CancelledError))]))
+        self.assertThat(transport.written.getvalue(), Equals(b''))
+        self.assertThat(
+            next(req.finish.counter),
+            Equals(0))
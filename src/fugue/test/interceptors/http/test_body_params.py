@@ -1,19 +1,32 @@
 import hashlib
 import json
+import os
 import urllib
 from io import BytesIO
 
-from pyrsistent import freeze, m, pmap
-from testtools import TestCase
+from pyrsistent import freeze, m, ny, pmap
+from fixtures import TempDir
+from multipart import MultipartError
+from testtools import ExpectedException, TestCase
 from testtools.matchers import AfterPreprocessing as After
-from testtools.matchers import Always, ContainsDict, Equals, Is, MatchesDict
-from testtools.twistedsupport import succeeded
+from testtools.matchers import (
+    AllMatch, Always, ContainsDict, Equals, HasLength, Is, IsInstance,
+    MatchesDict, MatchesListwise, Not)
+from testtools.twistedsupport import failed, succeeded
 
-from fugue._keys import REQUEST
+from fugue._keys import REQUEST, RESPONSE
 from fugue.chain import execute
 from fugue.interceptors.http import body_params
-from fugue.interceptors.http.body_params import default_parsers
+from fugue.interceptors import handler
+from fugue.interceptors.http._multipart import MultipartReader
+from fugue.interceptors.http.body_params import (
+    _DepthCounter, _ParserTable, BodyLimits, default_parsers, form_parser,
+    json_parser, json_stream_parser, multipart_form_parser,
+    multipart_stream_parser, ParseError, RequestTooLarge)
+from fugue.json_backend import JSONBackend
+from fugue.lazy import FrozenMapView, LazyMap
 from fugue.test.test_chain import empty_context
+from fugue.util import identity
 
 
 class BodyParamsTests(TestCase):
@@ -47,6 +60,153 @@ class BodyParamsTests(TestCase):
             succeeded(Equals(context)))
 
 
+class ParserTableTests(TestCase):
+    """
+    Tests for `_ParserTable`.
+    """
+    def table(self):
+        return _ParserTable({
+            b'application/json': 'json',
+            b'application/*+json': 'suffix',
+            b'*/*+xml': 'any-suffix',
+            b'text/*': 'text',
+        })
+
+    def test_exact(self):
+        """
+        Exact media types match, ignoring parameters and case.
+        """
+        table = self.table()
+        self.assertThat(
+            table.parser_for(b'application/json'),
+            Equals('json'))
+        self.assertThat(
+            table.parser_for(b'Application/JSON; charset="utf-8"'),
+            Equals('json'))
+
+    def test_suffix(self):
+        """
+        Structured syntax suffix wildcards match media types with that suffix,
+        a wildcard top-level type matches any top-level type.
+        """
+        table = self.table()
+        self.assertThat(
+            table.parser_for(b'application/vnd.api+json'),
+            Equals('suffix'))
+        self.assertThat(
+            table.parser_for(b'image/svg+xml'),
+            Equals('any-suffix'))
+
+    def test_range(self):
+        """
+        Media ranges match any subtype of a top-level type.
+        """
+        self.assertThat(
+            self.table().parser_for(b'text/csv'),
+            Equals('text'))
+
+    def test_unmatched(self):
+        """
+        If nothing matches, or there is no content type, the identity function
+        is the parser.
+        """
+        table = self.table()
+        self.assertThat(
+            table.parser_for(b'image/png'),
+            Is(identity))
+        self.assertThat(
+            table.parser_for(None),
+            Is(identity))
+
+    def test_any(self):
+        """
+        ``*/*`` matches anything not matched more specifically.
+        """
+        table = _ParserTable({
+            b'*/*': 'any',
+            b'text/plain': 'text'})
+        self.assertThat(
+            table.parser_for(b'image/png'),
+            Equals('any'))
+        self.assertThat(
+            table.parser_for(b'text/plain'),
+            Equals('text'))
+
+
+class LazyBodyParamsTests(TestCase):
+    """
+    Tests for `body_params` in lazy mode.
+    """
+    def request(self):
+        return m(
+            content_type='application/json; charset="utf-8"',
+            character_encoding='utf-8',
+            body=BytesIO(b'{"a": 1}'))
+
+    def test_deferred(self):
+        """
+        The body is only parsed once a parameter key is accessed, and keys the
+        parser does not produce are absent.
+        """
+        context = empty_context.set(REQUEST, self.request())
+        request = body_params(lazy=True).enter(context)[REQUEST]
+        self.assertThat(request['body'].tell(), Equals(0))
+        self.assertThat(
+            request,
+            ContainsDict({
+                'json_params': Equals(freeze({u'a': 1}))}))
+        self.assertThat(request.get('form_params'), Is(None))
+        self.assertThat(
+            request.set('json_params', 42)['json_params'],
+            Equals(42))
+
+    def test_unhandled(self):
+        """
+        If nothing can handle the content type, return the request untouched.
+        """
+        request = self.request().set('content_type', 'text/plain')
+        context = empty_context.set(REQUEST, request)
+        self.assertThat(
+            execute(context, [body_params(lazy=True)]),
+            succeeded(Equals(context)))
+
+    def test_error(self):
+        """
+        Parsing errors are raised when the parameters are accessed.
+        """
+        context = empty_context.set(
+            REQUEST, self.request().set('body', BytesIO(b'{')))
+        request = body_params(lazy=True).enter(context)[REQUEST]
+        for _ in range(2):
+            self.assertRaises(ValueError, lambda: request['json_params'])
+
+
+    def test_parser_key_error(self):
+        """
+        A `KeyError` raised while parsing is raised as `ParseError`, rather
+        than being mistaken for the parameter being absent.
+        """
+        def _parser(request):
+            return {}['missing']
+        context = empty_context.set(REQUEST, self.request())
+        request = body_params(
+            {b'application/json': _parser}, lazy=True).enter(context)[REQUEST]
+        for f in [lambda: request['json_params'],
+                  lambda: request.get('json_params'),
+                  lambda: 'json_params' in request]:
+            self.assertRaises(ParseError, f)
+
+    def test_multipart_boundary(self):
+        """
+        A multipart body without a boundary fails to parse, rather than having
+        no parameters.
+        """
+        request = self.request().set('content_type', b'multipart/form-data')
+        context = empty_context.set(REQUEST, request)
+        request = body_params(lazy=True).enter(context)[REQUEST]
+        self.assertRaises(ParseError, request.get, 'multipart_params')
+
+
 class JSONBodyParamsTests(TestCase):
     """
     Tests for the ``application/json`` aspect of `body_params`.
@@ -86,6 +246,60 @@ class JSONBodyParamsTests(TestCase):
                     REQUEST: ContainsDict({
                         'json_params': Equals(freeze(self.payload()))})})))
 
+    def test_lazy(self):
+        """
+        By default the parsed result is frozen, it is only lazily frozen when
+        asked.
+        """
+        self.assertThat(
+            json_parser()(self.request())['json_params'],
+            IsInstance(type(pmap())))
+        self.assertThat(
+            json_parser(lazy=True)(self.request())['json_params'],
+            IsInstance(FrozenMapView))
+
+    def test_backend(self):
+        """
+        The JSON backend can be chosen, unless additional options for the
+        standard library are given.
+        """
+        calls = []
+
+        def _loads(data, encoding=None):
+            calls.append((data, encoding))
+            return json.loads(data)
+        backend = JSONBackend(name='test', loads=_loads, dumps=json.dumps)
+        request = self.request()
+        self.assertThat(
+            json_parser(backend=backend)(request)['json_params'],
+            Equals(freeze(self.payload())))
+        self.assertThat(
+            calls,
+            Equals([(json.dumps(self.payload()), 'utf-8')]))
+        self.assertThat(
+            json_parser(
+                backend=backend, object_hook=lambda d: d.keys())(
+                    self.request())['json_params'],
+            IsInstance(type(freeze([]))))
+        self.assertThat(calls, HasLength(1))
+
+    def test_structured_suffix(self):
+        """
+        Media types with a ``+json`` structured syntax suffix are parsed as JSON
+        by the default parsers.
+        """
+        interceptors = [
+            body_params()]
+        request = self.request().set(
+            'content_type', 'application/vnd.api+json; charset="utf-8"')
+        context = empty_context.set(REQUEST, request)
+        self.assertThat(
+            execute(context, interceptors),
+            succeeded(
+                ContainsDict({
+                    REQUEST: ContainsDict({
+                        'json_params': Equals(freeze(self.payload()))})})))
+
     def test_custom(self):
         """
         Custom content parsers.
@@ -102,6 +316,81 @@ class JSONBodyParamsTests(TestCase):
                         'json_params': Equals(42)})})))
 
 
+class JSONStreamBodyParamsTests(TestCase):
+    """
+    Tests for `body_params` with `json_stream_parser`.
+    """
+    def request(self, body):
+        return m(
+            content_type='application/json; charset="utf-8"',
+            character_encoding='utf-8',
+            body=BytesIO(body))
+
+    def parse(self, body, **kw):
+        interceptors = [
+            body_params({b'application/json': json_stream_parser(**kw)})]
+        context = empty_context.set(REQUEST, self.request(body))
+        return execute(context, interceptors)
+
+    def test_frozen(self):
+        """
+        The document is parsed into a frozen structure, regardless of how
+        values straddle chunks.
+        """
+        payload = {
+            u'a': [1, 22, 333],
+            u'b': {u'c': u'\N{SNOWMAN}'},
+            u'd': None}
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        for chunk_size in [1, 3, 1024]:
+            self.assertThat(
+                self.parse(body, chunk_size=chunk_size),
+                succeeded(
+                    ContainsDict({
+                        REQUEST: ContainsDict({
+                            'json_params': Equals(freeze(payload))})})))
+
+    def test_scalar(self):
+        """
+        Top-level scalars are parsed.
+        """
+        self.assertThat(
+            self.parse(b' 12345 ', chunk_size=2),
+            succeeded(
+                ContainsDict({
+                    REQUEST: ContainsDict({
+                        'json_params': Equals(12345)})})))
+
+    def test_items(self):
+        """
+        Items of a top-level array are lazily parsed and frozen.
+        """
+        body = BytesIO(b'[1, {"a": [2]}, "three"]')
+        request = json_stream_parser(items=True, chunk_size=4)(
+            self.request(b'').set('body', body))
+        self.assertThat(body.tell(), Equals(4))
+        self.assertThat(
+            list(request['json_params']),
+            Equals([1, freeze({u'a': [2]}), u'three']))
+
+    def test_items_not_array(self):
+        """
+        Only arrays can have their items parsed.
+        """
+        self.assertThat(
+            self.parse(b'{"a": 1}', items=True),
+            failed(After(lambda f: f.type, Is(ValueError))))
+
+    def test_invalid(self):
+        """
+        Malformed or trailing content is an error.
+        """
+        for body in [b'', b'[1, 2', b'{"a" 1}', b'{1: 2}', b'[1] [2]']:
+            self.assertThat(
+                self.parse(body, chunk_size=2),
+                failed(After(lambda f: f.type, Is(ValueError))))
+
+
 class FormBodyParamsTests(TestCase):
     """
     Tests for the ``application/x-www-form-urlencoded`` aspect of `body_params`.
@@ -135,6 +424,39 @@ class FormBodyParamsTests(TestCase):
                                 u'c': u'\N{SNOWMAN}',
                                 u'd': True}))})})))
 
+    def test_decoding(self):
+        """
+        Fields may be separated by ``&`` or ``;``, blank fields are skipped,
+        fields without a value are empty and repeated fields keep all their
+        values, including empty ones.
+        """
+        request = m(
+            content_type='application/x-www-form-urlencoded',
+            body=BytesIO(
+                b'a=1;b=%E2%98%83&&c&d=x+y&a=&a=%2B3&e=f=g'))
+        self.assertThat(
+            form_parser()(request)['form_params'],
+            Equals(
+                pmap({
+                    u'a': [u'1', u'', u'+3'],
+                    u'b': u'\N{SNOWMAN}',
+                    u'c': True,
+                    u'd': u'x y',
+                    u'e': u'f=g'})))
+
+    def test_character_encoding(self):
+        """
+        The request's ``character_encoding`` is used to decode keys and
+        values.
+        """
+        request = m(
+            content_type='application/x-www-form-urlencoded',
+            character_encoding='latin1',
+            body=BytesIO(b'%E9=%E9'))
+        self.assertThat(
+            form_parser()(request)['form_params'],
+            Equals(pmap({u'\xe9': u'\xe9'})))
+
 
 def open_test_data(path):
     import os.path
@@ -157,60 +479,430 @@ def Multipart(content_length, name, headers, body,
     })
 
 
+def _read_params(request):
+    """
+    Read the parsed parameters of a request, so that they can be inspected
+    once the files they are read from have been closed.
+    """
+    return request.transform(
+        ['form_params'], pmap,
+        ['multipart_params', ny, 'body'], lambda f: BytesIO(f.read()))
+
+
 class MultipartFormBodyParamsTests(TestCase):
     """
     Tests for the ``multipart/form-data`` aspect of `body_params`.
     """
+    def request(self):
+        return m(
+            content_type='multipart/form-data; boundary=---------------------------114772229410704779042051621609',
+            body=open_test_data('data/multipart_request'))
+
     def test_default(self):
         """
         Default content parsers.
         """
+        requests = []
         interceptors = [
-            body_params()]
-        request = m(
+            body_params(),
+            handler(lambda req: requests.append(_read_params(req)))]
+        context = empty_context.set(REQUEST, self.request())
+        self.assertThat(
+            execute(context, interceptors),
+            succeeded(Always()))
+        self.assertThat(
+            requests,
+            MatchesListwise([
+                ContainsDict({
+                    'multipart_params': MatchesDict({
+                        u'name': Multipart(
+                            content_length=Equals(8),
+                            name=Equals(u'name'),
+                            headers=MatchesDict({
+                                u'Content-Disposition': Equals(
+                                    u'form-data; name="name"'),
+                            }),
+                            body=Equals(b'Some One')),
+                        u'email': Multipart(
+                            content_length=Equals(16),
+                            name=Equals(u'email'),
+                            headers=MatchesDict({
+                                u'Content-Disposition': Equals(
+                                    u'form-data; name="email"'),
+                            }),
+                            body=Equals(b'user@example.com')),
+                        u'avatar': Multipart(
+                            content_length=Equals(869),
+                            content_type=Equals(u'image/png'),
+                            filename=Equals(u'smiley-cool.png'),
+                            name=Equals(u'avatar'),
+                            headers=MatchesDict({
+                                u'Content-Type': Equals(u'image/png'),
+                                u'Content-Disposition': Equals(
+                                    u'form-data; name="avatar"; filename="smiley-cool.png"'),
+                            }),
+                            body=After(
+                                lambda x: hashlib.sha256(x).hexdigest(),
+                                Equals(b'25fbe073db80f71a13fb8e0a190a76c0fda494d18849fa6fa87ea5a0924baa07'))),
+                        # XXX: This syntax isn't supported by the multipart
+                        # parser, multiple things with the same name are
+                        # overwritten.
+                        u'attachments[]': Always(),
+                    }),
+                    'form_params': MatchesDict({
+                        u'name': Equals(u'Some One'),
+                        u'email': Equals(u'user@example.com')})})]))
+
+    def bodies(self, lazy, interceptor):
+        """
+        Execute `body_params` followed by ``interceptor`` and collect the
+        bodies of the multipart parameters, while the chain is executing.
+        """
+        bodies = []
+
+        def _bodies(req):
+            bodies.extend(
+                part['body'] for part in req['multipart_params'].values())
+            self.assertThat([f.closed for f in bodies], AllMatch(Is(False)))
+        interceptors = [
+            body_params(lazy=lazy),
+            handler(_bodies),
+            interceptor]
+        d = execute(empty_context.set(REQUEST, self.request()), interceptors)
+        self.assertThat(bodies, HasLength(4))
+        return d, bodies
+
+    def test_close_spooled(self):
+        """
+        Files that parts were spooled into are closed once the response has
+        been produced, without leaving anything behind in the context.
+        """
+        for lazy in [False, True]:
+            d, bodies = self.bodies(lazy, handler(lambda req: m(status=200)))
+            self.assertThat(
+                d,
+                succeeded(
+                    After(lambda context: set(context),
+                          Equals({REQUEST, RESPONSE}))))
+            self.assertThat([f.closed for f in bodies], AllMatch(Is(True)))
+
+    def test_close_spooled_error(self):
+        """
+        Files that parts were spooled into are closed if handling the request
+        fails.
+        """
+        def _fail(req):
+            raise RuntimeError('failed')
+        for lazy in [False, True]:
+            d, bodies = self.bodies(lazy, handler(_fail))
+            self.assertThat(
+                d, failed(After(lambda f: f.type, Is(RuntimeError))))
+            self.assertThat([f.closed for f in bodies], AllMatch(Is(True)))
+
+
+class MultipartSpoolingTests(TestCase):
+    """
+    Tests for spooling in `multipart_form_parser`.
+    """
+    def request(self):
+        return m(
             content_type='multipart/form-data; boundary=---------------------------114772229410704779042051621609',
             body=open_test_data('data/multipart_request'))
-        context = empty_context.set(REQUEST, request)
+
+    def test_memfile_limit(self):
+        """
+        Parts larger than ``memfile_limit`` are spooled to temporary files in
+        ``spool_dir``.
+        """
+        spool_dir = self.useFixture(TempDir()).path
+        request = multipart_form_parser(
+            memfile_limit=100, spool_dir=spool_dir)(self.request())
+        params = request['multipart_params']
+        self.assertThat(params[u'name']['body'], IsInstance(BytesIO))
+        self.assertThat(params[u'avatar']['body'], Not(IsInstance(BytesIO)))
         self.assertThat(
-            execute(context, interceptors),
+            hashlib.sha256(params[u'avatar']['body'].read()).hexdigest(),
+            Equals(b'25fbe073db80f71a13fb8e0a190a76c0fda494d18849fa6fa87ea5a0924baa07'))
+
+    def test_mem_limit(self):
+        """
+        Once the in-memory parts of a request would exceed ``mem_limit``,
+        parts are spooled to temporary files.
+        """
+        request = multipart_form_parser(mem_limit=10)(self.request())
+        params = request['multipart_params']
+        self.assertThat(params[u'name']['body'], IsInstance(BytesIO))
+        self.assertThat(params[u'email']['body'], Not(IsInstance(BytesIO)))
+        self.assertThat(params[u'email']['body'].read(),
+                        Equals(b'user@example.com'))
+
+    def test_lazy_values(self):
+        """
+        Form values are only decoded when accessed, without disturbing the
+        part's body.
+        """
+        request = multipart_form_parser()(self.request())
+        form_params = request['form_params']
+        self.assertThat(form_params, IsInstance(LazyMap))
+        body = request['multipart_params'][u'name']['body']
+        body.read(4)
+        self.assertThat(form_params[u'name'], Equals(u'Some One'))
+        self.assertThat(body.read(), Equals(b' One'))
+
+
+class MultipartStreamTests(TestCase):
+    """
+    Tests for `multipart_stream_parser`.
+    """
+    def request(self):
+        return m(
+            content_type='multipart/form-data; boundary=---------------------------114772229410704779042051621609',
+            body=open_test_data('data/multipart_request'))
+
+    def test_parts(self):
+        """
+        Parts are produced lazily, with bodies read directly from the request
+        body, and unread parts are skipped.
+        """
+        request = multipart_stream_parser(buffer_size=100)(self.request())
+        self.assertThat(request['body'].tell(), Equals(0))
+        parts = request['multipart_parts']
+        name = next(parts)
+        self.assertThat(
+            name,
+            ContainsDict({
+                u'name': Equals(u'name'),
+                u'content_type': Is(None),
+                u'filename': Is(None)}))
+        next(parts)
+        avatar = next(parts)
+        self.assertThat(
+            avatar,
+            ContainsDict({
+                u'name': Equals(u'avatar'),
+                u'content_type': Equals(u'image/png'),
+                u'filename': Equals(u'smiley-cool.png')}))
+        h = hashlib.sha256()
+        for chunk in iter(lambda: avatar['body'].read(64), b''):
+            self.assertThat(len(chunk), Not(Equals(0)))
+            h.update(chunk)
+        self.assertThat(
+            h.hexdigest(),
+            Equals(b'25fbe073db80f71a13fb8e0a190a76c0fda494d18849fa6fa87ea5a0924baa07'))
+        self.assertThat(list(parts), HasLength(2))
+
+    def test_max_parts(self):
+        """
+        ``max_parts`` is enforced while iterating.
+        """
+        request = multipart_stream_parser(limits=BodyLimits(max_parts=2))(
+            self.request())
+        parts = request['multipart_parts']
+        next(parts)
+        next(parts)
+        with ExpectedException(RequestTooLarge):
+            next(parts)
+
+
+class MultipartReaderTests(TestCase):
+    """
+    Tests for `MultipartReader`.
+    """
+    def parts(self, body, buffer_size=2 ** 16):
+        reader = MultipartReader(BytesIO(body), b'xyz', buffer_size)
+        return [(headers, part.read()) for headers, part in reader.parts()]
+
+    def test_parts(self):
+        """
+        Parts are read irrespective of how the boundaries align with reads,
+        preamble and epilogue are ignored.
+        """
+        body = (b'preamble\r\n--xyz\r\n'
+                b'Content-Disposition: form-data;\r\n name="a"\r\n\r\n'
+                b'one\r\n--xy\r\n--xyz  \r\n'
+                b'\r\n'
+                b'two\r\n--xyz--\r\nepilogue')
+        for buffer_size in [1, 7, 2 ** 16]:
+            self.assertThat(
+                self.parts(body, buffer_size),
+                Equals([
+                    ([(u'Content-Disposition', u'form-data;name="a"')],
+                     b'one\r\n--xy'),
+                    ([], b'two')]))
+
+    def test_unread(self):
+        """
+        Unread part bodies are skipped, and are no longer readable once the
+        next part is produced.
+        """
+        body = b'--xyz\r\n\r\none\r\n--xyz\r\n\r\ntwo\r\n--xyz--'
+        parts = MultipartReader(BytesIO(body), b'xyz').parts()
+        _, first = next(parts)
+        _, second = next(parts)
+        with ExpectedException(ValueError):
+            first.read()
+        self.assertThat(second.read(), Equals(b'two'))
+        self.assertThat(list(parts), HasLength(0))
+
+    def test_truncated(self):
+        """
+        A stream that ends before the final boundary is an error.
+        """
+        with ExpectedException(MultipartError):
+            self.parts(b'--xyz\r\n\r\none')
+
+
+class BodyLimitsTests(TestCase):
+    """
+    Tests for `body_params` with `BodyLimits`.
+    """
+    def execute(self, request, limits, lazy=False):
+        interceptors = [
+            body_params(limits=limits, lazy=lazy),
+            handler(lambda req: m(
+                status=200, body=req.get('json_params') or
+                req.get('form_params') or
+                req.get('multipart_params')))]
+        return execute(empty_context.set(REQUEST, request), interceptors)
+
+    def assertStatus(self, d, status):
+        self.assertThat(
+            d,
             succeeded(
                 ContainsDict({
-                    REQUEST: ContainsDict({
-                        'multipart_params': MatchesDict({
-                            u'name': Multipart(
-                                content_length=Equals(8),
-                                name=Equals(u'name'),
-                                headers=MatchesDict({
-                                    u'Content-Disposition': Equals(
-                                        u'form-data; name="name"'),
-                                }),
-                                body=Equals(b'Some One')),
-                            u'email': Multipart(
-                                content_length=Equals(16),
-                                name=Equals(u'email'),
-                                headers=MatchesDict({
-                                    u'Content-Disposition': Equals(
-                                        u'form-data; name="email"'),
-                                }),
-                                body=Equals(b'user@example.com')),
-                            u'avatar': Multipart(
-                                content_length=Equals(869),
-                                content_type=Equals(u'image/png'),
-                                filename=Equals(u'smiley-cool.png'),
-                                name=Equals(u'avatar'),
-                                headers=MatchesDict({
-                                    u'Content-Type': Equals(u'image/png'),
-                                    u'Content-Disposition': Equals(
-                                        u'form-data; name="avatar"; filename="smiley-cool.png"'),
-                                }),
-                                body=After(
-                                    lambda x: hashlib.sha256(x).hexdigest(),
-                                    Equals(b'25fbe073db80f71a13fb8e0a190a76c0fda494d18849fa6fa87ea5a0924baa07'))),
-                            # XXX: This syntax isn't supported by the multipart
-                            # parser, multiple things with the same name are
-                            # overwritten.
-                            u'attachments[]': Always(),
-                        }),
-                        'form_params': MatchesDict({
-                            u'name': Equals(u'Some One'),
-                            u'email': Equals(u'user@example.com')})})})))
+                    RESPONSE: ContainsDict({
+                        'status': Equals(status)})})))
+
+    def json_request(self, body, content_length=None):
+        return m(
+            content_type='application/json',
+            content_length=content_length,
+            body=BytesIO(body))
+
+    def test_content_length(self):
+        """
+        A ``content_length`` that exceeds the limit results in a 413 response
+        without reading the body, in either mode.
+        """
+        for lazy in [False, True]:
+            request = self.json_request(b'[1, 2, 3]', b'9')
+            self.assertStatus(
+                self.execute(request, BodyLimits(max_bytes=8), lazy), 413)
+            self.assertThat(request['body'].tell(), Equals(0))
+
+    def test_max_bytes(self):
+        """
+        Reading more than ``max_bytes`` results in a 413 response, without
+        reading much further, in either mode.
+        """
+        for lazy in [False, True]:
+            request = self.json_request(b'[1, 2, 3]' + b' ' * 100)
+            self.assertStatus(
+                self.execute(request, BodyLimits(max_bytes=9), lazy), 413)
+            self.assertThat(request['body'].tell(), Equals(10))
+        self.assertStatus(
+            self.execute(
+                self.json_request(b'[1, 2, 3]', b'9'),
+                BodyLimits(max_bytes=9)),
+            200)
+
+    def test_max_depth(self):
+        """
+        JSON documents nested more deeply than ``max_depth`` result in a 413
+        response.
+        """
+        limits = BodyLimits(max_depth=2)
+        self.assertStatus(
+            self.execute(self.json_request(b'[[1], {"a": 2}]'), limits),
+            200)
+        self.assertStatus(
+            self.execute(self.json_request(b'[[1], {"a": [2]}]'), limits),
+            413)
+        self.assertThat(
+            execute(
+                empty_context.set(
+                    REQUEST, self.json_request(b'[[1], {"a": [2]}]')),
+                [body_params({
+                    b'application/json': json_stream_parser(
+                        limits=limits)})]),
+            succeeded(
+                ContainsDict({
+                    RESPONSE: ContainsDict({
+                        'status': Equals(413)})})))
+
+    def test_max_depth_undecoded(self):
+        """
+        ``max_depth`` is enforced before decoding, so documents too deeply
+        nested to decode are still rejected with a 413 response, and brackets
+        in strings do not count.
+        """
+        limits = BodyLimits(max_depth=20)
+        deep = b'[' * 100000 + b']' * 100000
+        for parser in [json_parser(limits=limits),
+                       json_stream_parser(limits=limits, chunk_size=16)]:
+            self.assertThat(
+                execute(
+                    empty_context.set(REQUEST, self.json_request(deep)),
+                    [body_params({b'application/json': parser})]),
+                succeeded(
+                    ContainsDict({
+                        RESPONSE: ContainsDict({
+                            'status': Equals(413)})})))
+        self.assertStatus(
+            self.execute(
+                self.json_request(b'[{"a[[": "]\\"[[[[\\\\"}, "{{{"]'),
+                BodyLimits(max_depth=2)),
+            200)
+
+    def test_depth_counter(self):
+        """
+        `_DepthCounter` keeps its place across the parts of a document fed
+        to it.
+        """
+        counter = _DepthCounter(2)
+        for part in [b'[["\\', b'"[[', b'"]', b',[', b']]']:
+            counter.feed(part)
+        counter = _DepthCounter(2)
+        counter.feed(u'[["\\\\"')
+        self.assertRaises(RequestTooLarge, counter.feed, u'[')
+
+    def test_max_fields(self):
+        """
+        Forms with more than ``max_fields`` fields result in a 413 response.
+        """
+        def _request():
+            return m(
+                content_type='application/x-www-form-urlencoded',
+                body=BytesIO(b'a=1&b=2&c=3'))
+        self.assertStatus(
+            self.execute(_request(), BodyLimits(max_fields=3)), 200)
+        self.assertStatus(
+            self.execute(_request(), BodyLimits(max_fields=2)), 413)
+
+    def test_max_value_length(self):
+        """
+        Form values longer than ``max_value_length``, before decoding, result
+        in a 413 response.
+        """
+        def _request():
+            return m(
+                content_type='application/x-www-form-urlencoded',
+                body=BytesIO(b'a=1&b=%20%20'))
+        self.assertStatus(
+            self.execute(_request(), BodyLimits(max_value_length=6)), 200)
+        self.assertStatus(
+            self.execute(_request(), BodyLimits(max_value_length=5)), 413)
+
+    def test_max_parts(self):
+        """
+        Multipart bodies with more than ``max_parts`` parts result in a 413
+        response.
+        """
+        def _request():
+            return m(
+                content_type='multipart/form-data; boundary=---------------------------114772229410704779042051621609',
+                body=open_test_data('data/multipart_request'))
+        self.assertStatus(
+            self.execute(_request(), BodyLimits(max_parts=5)), 200)
+        self.assertStatus(
+            self.execute(_request(), BodyLimits(max_parts=2)), 413)
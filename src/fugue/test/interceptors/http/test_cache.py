@@ -0,0 +1,285 @@
+from hyperlink import URL
+from pyrsistent import m, pmap, v
+from testtools import TestCase
+from testtools.matchers import ContainsDict, Equals, HasLength, Is, Not
+from testtools.twistedsupport import succeeded
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.task import Clock
+from twisted.python import log
+
+from fugue._keys import REQUEST, RESPONSE
+from fugue.chain import execute
+from fugue.interceptors import before
+from fugue.interceptors.http import response_cache
+from fugue.interceptors.http.cache import cache_key, cacheable, ResponseCache
+from fugue.test.test_chain import empty_context
+
+
+def request(path=u'/a', method=b'GET', headers=m(), uri=None):
+    return m(
+        request_method=method,
+        path_info=path,
+        headers=headers,
+        uri=uri)
+
+
+def response(body=b'body', status=200, **headers):
+    return m(status=status, headers=pmap(headers), body=body)
+
+
+class CacheKeyTests(TestCase):
+    """
+    Tests for `cache_key`.
+    """
+    def test_default(self):
+        """
+        The method, path and entire query are the key by default.
+        """
+        key = cache_key()
+        self.assertThat(key(request()), Equals((b'GET', u'/a', ())))
+        self.assertThat(
+            key(request(headers=m(**{b'Accept': b'text/html'}))),
+            Equals(key(request())))
+        self.assertThat(
+            key(request(uri=URL.from_text(u'/a?q=a'))),
+            Equals((b'GET', u'/a', ((u'q', u'a'),))))
+        self.assertThat(
+            key(request(uri=URL.from_text(u'/a?q=b'))),
+            Not(Equals(key(request(uri=URL.from_text(u'/a?q=a'))))))
+
+    def test_projection(self):
+        """
+        Selected headers, query parameters and path parameters are part of
+        the key.
+        """
+        key = cache_key(
+            headers=[b'accept'], query=[u'page'], path_params=True)
+        req = request(
+            headers=m(**{b'Accept': v(b'text/html')}),
+            uri=URL.from_text(u'/a?page=2&x=1')).set(
+                'path_params', m(id=u'1'))
+        self.assertThat(
+            key(req),
+            Equals((b'GET', u'/a', (b'text/html',), (u'2',), m(id=u'1'))))
+        self.assertThat(
+            key(req.set('uri', URL.from_text(u'/a?page=2&x=2'))),
+            Equals(key(req)))
+        self.assertThat(
+            key(req.set('uri', URL.from_text(u'/a?page=3'))),
+            Not(Equals(key(req))))
+
+
+class CacheableTests(TestCase):
+    """
+    Tests for `cacheable`.
+    """
+    def test_cacheable(self):
+        """
+        Complete responses, with a cacheable status, are cacheable.
+        """
+        self.assertThat(cacheable(response()), Equals(True))
+        self.assertThat(cacheable(response(status=404)), Equals(True))
+
+    def test_uncacheable(self):
+        """
+        Incomplete bodies, uncacheable statuses, cookies and ``Cache-Control``
+        directives make responses uncacheable.
+        """
+        for resp in [response(body=iter([b'a'])),
+                     response(body=Deferred()),
+                     response(status=500),
+                     response(**{'Set-Cookie': b'a=b'}),
+                     response(**{'Cache-Control': b'max-age=0, Private'}),
+                     response(**{'cache-control': v(b'no-store')})]:
+            self.assertThat(cacheable(resp), Equals(False))
+
+
+class ResponseCacheTests(TestCase):
+    """
+    Tests for `ResponseCache`.
+    """
+    def test_expiry(self):
+        """
+        Entries are usable until they are no longer fresh or stale.
+        """
+        clock = Clock()
+        cache = ResponseCache(clock=clock)
+        cache.put('a', response(), ttl=10, stale_ttl=5)
+        clock.advance(14)
+        self.assertThat(cache.get('a').expires, Equals(10))
+        clock.advance(1)
+        self.assertThat(cache.get('a'), Is(None))
+        self.assertThat(cache.size, Equals(0))
+        self.assertThat(len(cache), Equals(0))
+
+    def test_eviction(self):
+        """
+        The least recently used entries are evicted once the cache is larger
+        than ``max_bytes``, responses larger than that are never stored.
+        """
+        body = b'x' * 1000
+        cache = ResponseCache(max_bytes=3000, clock=Clock())
+        for key in 'abc':
+            cache.put(key, response(body), ttl=10)
+        self.assertThat(len(cache), Equals(2))
+        self.assertThat(cache.get('a'), Is(None))
+        cache.get('b')
+        cache.put('d', response(body), ttl=10)
+        self.assertThat(cache.get('c'), Is(None))
+        self.assertThat(cache.get('b'), Not(Is(None)))
+        cache.put('e', response(b'x' * 3000), ttl=10)
+        self.assertThat(cache.get('e'), Is(None))
+        self.assertThat(len(cache), Equals(2))
+        self.assertThat(cache.size <= 3000, Equals(True))
+
+
+class ResponseCacheInterceptorTests(TestCase):
+    """
+    Tests for `response_cache`.
+    """
+    def setUp(self):
+        super(ResponseCacheInterceptorTests, self).setUp()
+        self.clock = Clock()
+        self.cache = ResponseCache(clock=self.clock)
+        self.calls = []
+        self.next_response = None
+
+    def handle(self, context):
+        self.calls.append(context[REQUEST])
+        d = self.next_response
+        if d is None:
+            d = succeed(response(b'response {}'.format(len(self.calls))))
+        return d.addCallback(lambda resp: context.set(RESPONSE, resp))
+
+    def execute(self, req=None, **kw):
+        interceptors = [
+            response_cache(cache=self.cache, **kw),
+            before(self.handle)]
+        return execute(
+            empty_context.set(REQUEST, req or request()), interceptors)
+
+    def assertBody(self, d, body):
+        self.assertThat(
+            d,
+            succeeded(
+                ContainsDict({
+                    RESPONSE: ContainsDict({'body': Equals(body)})})))
+
+    def test_hit(self):
+        """
+        Cached responses are served, with their ``Age``, without running the
+        rest of the chain.
+        """
+        self.assertBody(self.execute(), b'response 1')
+        self.clock.advance(5)
+        self.assertThat(
+            self.execute(),
+            succeeded(
+                ContainsDict({
+                    RESPONSE: Equals(
+                        response(b'response 1', **{b'Age': b'5'}))})))
+        self.assertThat(self.calls, HasLength(1))
+
+    def test_expired(self):
+        """
+        Responses are only served until they expire.
+        """
+        self.assertBody(self.execute(ttl=10), b'response 1')
+        self.clock.advance(10)
+        self.assertBody(self.execute(ttl=10), b'response 2')
+
+    def test_uncached(self):
+        """
+        Unsafe methods, and uncacheable responses, are not cached.
+        """
+        self.assertBody(self.execute(request(method=b'POST')), b'response 1')
+        self.assertBody(self.execute(request(method=b'POST')), b'response 2')
+        self.next_response = succeed(response(status=500))
+        self.execute()
+        self.assertThat(len(self.cache), Equals(0))
+
+    def test_vary(self):
+        """
+        Responses that vary on request headers that are not part of the key
+        are not cached, those that only vary on headers in the key are cached
+        for each variant.
+        """
+        for vary in [b'*', b'Accept-Encoding', b'Accept, accept-encoding']:
+            self.next_response = succeed(response(Vary=vary))
+            self.execute()
+            self.assertThat(len(self.cache), Equals(0))
+        self.next_response = None
+        key = cache_key(headers=[b'Accept-Encoding'])
+        for encoding in [b'gzip', b'identity', b'gzip']:
+            self.handle = lambda context: context.set(
+                RESPONSE, response(encoding, Vary=b'accept-encoding'))
+            self.assertBody(
+                self.execute(
+                    request(headers=m(**{'Accept-Encoding': encoding})),
+                    key=key),
+                encoding)
+        self.assertThat(len(self.cache), Equals(2))
+
+    def test_query(self):
+        """
+        Requests that differ only in their query are cached separately.
+        """
+        for q in [u'a', u'b', u'a']:
+            self.execute(
+                request(uri=URL.from_text(u'/a?q={}'.format(q))))
+        self.assertThat(self.calls, HasLength(2))
+        self.assertThat(len(self.cache), Equals(2))
+
+    def test_credentials(self):
+        """
+        Requests with credentials are not cached, unless the credentials are
+        part of the key.
+        """
+        for name in [b'Authorization', b'Cookie']:
+            for user in [b'alice', b'bob']:
+                self.execute(request(headers=m(**{name: user})))
+        self.assertThat(self.calls, HasLength(4))
+        self.assertThat(len(self.cache), Equals(0))
+        key = cache_key(headers=[b'Authorization'])
+        for user in [b'alice', b'bob', b'alice']:
+            self.execute(
+                request(headers=m(Authorization=user)), key=key)
+        self.assertThat(self.calls, HasLength(6))
+        self.assertThat(len(self.cache), Equals(2))
+
+    def test_stale_while_revalidate(self):
+        """
+        Expired responses are served while they are still within
+        ``stale_ttl``, and refreshed by one background execution of the rest
+        of the chain.
+        """
+        self.assertBody(self.execute(ttl=10, stale_ttl=10), b'response 1')
+        self.clock.advance(10)
+        d = Deferred()
+        self.next_response = d
+        for _ in range(3):
+            self.assertBody(
+                self.execute(ttl=10, stale_ttl=10), b'response 1')
+        self.assertThat(self.calls, HasLength(2))
+        d.callback(response(b'refreshed'))
+        self.assertBody(self.execute(ttl=10, stale_ttl=10), b'refreshed')
+        self.assertThat(self.calls, HasLength(2))
+
+    def test_refresh_failure(self):
+        """
+        A failed refresh is logged and a later request refreshes again.
+        """
+        errors = []
+        self.patch(log, 'err', lambda f, why: errors.append(f))
+        self.execute(ttl=10, stale_ttl=10)
+        self.clock.advance(10)
+        d = Deferred()
+        self.next_response = d
+        self.execute(ttl=10, stale_ttl=10)
+        d.errback(RuntimeError('nope'))
+        self.assertThat(errors, HasLength(1))
+        self.next_response = None
+        self.execute(ttl=10, stale_ttl=10)
+        self.assertThat(self.calls, HasLength(3))
+        self.assertBody(self.execute(ttl=10, stale_ttl=10), b'response 3')
+
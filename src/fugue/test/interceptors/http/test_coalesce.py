@@ -0,0 +1,159 @@
+from hyperlink import URL
+from pyrsistent import m
+from testtools import TestCase
+from testtools.matchers import (
+    AfterPreprocessing as After, ContainsDict, Equals, HasLength)
+from testtools.twistedsupport import failed, has_no_result, succeeded
+from twisted.internet.defer import CancelledError, Deferred
+
+from fugue._keys import REQUEST, RESPONSE
+from fugue.chain import DeadlineExceeded, execute
+from fugue.interceptors import before
+from fugue.interceptors.http import coalesce
+from fugue.interceptors.http.cache import cache_key
+from fugue.test.test_chain import empty_context
+
+
+class CoalesceTests(TestCase):
+    """
+    Tests for `coalesce`.
+    """
+    def setUp(self):
+        super(CoalesceTests, self).setUp()
+        self.interceptor = coalesce()
+        self.pending = []
+
+    def handle(self, context):
+        d = Deferred()
+        self.pending.append(d)
+        return d.addCallback(lambda response: context.set(RESPONSE, response))
+
+    def execute(self, path=u'/a', method=b'GET', query=u'', headers=m()):
+        request = m(
+            request_method=method,
+            path_info=path,
+            uri=URL.from_text(path + query),
+            headers=headers)
+        return execute(
+            empty_context.set(REQUEST, request),
+            [self.interceptor, before(self.handle)])
+
+    def assertResponse(self, d, response):
+        self.assertThat(
+            d, succeeded(ContainsDict({RESPONSE: Equals(response)})))
+
+    def test_followers(self):
+        """
+        Identical concurrent requests wait for the leader's response, instead
+        of executing the rest of the chain.
+        """
+        ds = [self.execute() for _ in range(3)]
+        other = self.execute(path=u'/b')
+        self.assertThat(self.pending, HasLength(2))
+        for d in ds + [other]:
+            self.assertThat(d, has_no_result())
+        response = m(status=200, body=b'shared')
+        self.pending[0].callback(response)
+        for d in ds:
+            self.assertResponse(d, response)
+        self.assertThat(other, has_no_result())
+
+    def test_after_completion(self):
+        """
+        Requests after the leader has completed execute the chain again.
+        """
+        self.execute()
+        self.pending[0].callback(m(status=200, body=b'first'))
+        d = self.execute()
+        self.assertThat(self.pending, HasLength(2))
+        self.pending[1].callback(m(status=200, body=b'second'))
+        self.assertResponse(d, m(status=200, body=b'second'))
+
+    def test_unsafe(self):
+        """
+        Requests with unsafe methods are never coalesced.
+        """
+        self.execute(method=b'POST')
+        self.execute(method=b'POST')
+        self.assertThat(self.pending, HasLength(2))
+
+    def test_query(self):
+        """
+        Requests that differ in their query are not coalesced.
+        """
+        self.execute(query=u'?q=a')
+        self.execute(query=u'?q=b')
+        self.execute(query=u'?q=a')
+        self.assertThat(self.pending, HasLength(2))
+
+    def test_credentials(self):
+        """
+        Requests with credentials are not coalesced, unless the credentials
+        are part of the key.
+        """
+        for name in [b'Authorization', b'Cookie']:
+            for _ in range(2):
+                self.execute(headers=m(**{name: b'secret'}))
+        self.assertThat(self.pending, HasLength(4))
+        self.interceptor = coalesce(
+            key=cache_key(headers=[b'Authorization']))
+        for user in [b'alice', b'bob', b'alice']:
+            self.execute(headers=m(Authorization=user))
+        self.assertThat(self.pending, HasLength(6))
+
+    def test_unshareable(self):
+        """
+        Followers of a leader whose response is not shareable execute the
+        chain themselves.
+        """
+        self.execute()
+        d = self.execute()
+        self.pending[0].callback(
+            m(status=200,
+              headers=m(**{b'Set-Cookie': b'a=b'}),
+              body=b'private'))
+        self.assertThat(self.pending, HasLength(2))
+        self.pending[1].callback(m(status=200, body=b'own'))
+        self.assertResponse(d, m(status=200, body=b'own'))
+
+    def test_vary(self):
+        """
+        Responses that vary on the request are not shareable.
+        """
+        self.execute()
+        d = self.execute()
+        self.pending[0].callback(
+            m(status=200,
+              headers=m(**{b'Vary': b'Accept-Encoding'}),
+              body=b'gzipped'))
+        self.assertThat(self.pending, HasLength(2))
+        self.assertThat(d, has_no_result())
+
+    def test_leader_cancelled(self):
+        """
+        Followers of a leader that is cancelled, or exceeds its deadline,
+        execute the chain themselves.
+        """
+        for error in [CancelledError(), DeadlineExceeded()]:
+            self.pending = []
+            leader = self.execute()
+            follower = self.execute()
+            self.pending[0].errback(error)
+            self.assertThat(
+                leader, failed(After(lambda f: f.type, Equals(type(error)))))
+            self.assertThat(self.pending, HasLength(2))
+            self.pending[1].callback(m(status=200, body=b'own'))
+            self.assertResponse(follower, m(status=200, body=b'own'))
+
+    def test_failure(self):
+        """
+        Followers fail with the leader's error, and the key is released.
+        """
+        leader = self.execute()
+        follower = self.execute()
+        self.pending[0].errback(RuntimeError('nope'))
+        for d in [leader, follower]:
+            self.assertThat(
+                d, failed(After(lambda f: f.type, Equals(RuntimeError))))
+        self.execute()
+        self.assertThat(self.pending, HasLength(2))
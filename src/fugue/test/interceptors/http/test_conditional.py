@@ -0,0 +1,157 @@
+from pyrsistent import m, pmap
+from testtools import TestCase
+from testtools.matchers import (
+    Contains, ContainsDict, Equals, HasLength, MatchesDict, Not)
+from testtools.twistedsupport import succeeded
+from twisted.internet.defer import succeed
+from twisted.web.http import datetimeToString
+
+from fugue._keys import REQUEST, RESPONSE
+from fugue.chain import execute
+from fugue.interceptors import handler
+from fugue.interceptors.http import conditional
+from fugue.interceptors.http.conditional import quote_etag
+from fugue.test.test_chain import empty_context
+
+
+LAST_MODIFIED = 1500000000
+
+
+class ConditionalTests(TestCase):
+    """
+    Tests for `conditional`.
+    """
+    def execute(self, headers, method=b'GET', validators=None):
+        if validators is None:
+            validators = m(etag=b'abc', last_modified=LAST_MODIFIED)
+        rendered = []
+
+        def _render(request):
+            rendered.append(request)
+            return m(status=200, headers=m(), body=b'expensive')
+        interceptors = [
+            conditional(lambda request: validators),
+            handler(_render)]
+        request = m(request_method=method, headers=pmap(headers))
+        return (
+            execute(empty_context.set(REQUEST, request), interceptors),
+            rendered)
+
+    def assertStatus(self, result, status, rendered=None):
+        d, _rendered = result
+        self.assertThat(
+            d,
+            succeeded(
+                ContainsDict({
+                    RESPONSE: ContainsDict({'status': Equals(status)})})))
+        if rendered is not None:
+            self.assertThat(_rendered, HasLength(1 if rendered else 0))
+
+    def test_if_none_match(self):
+        """
+        A matching ``If-None-Match`` results in a 304 response without running
+        the rest of the chain, weak comparison is used.
+        """
+        for value in [b'"abc"', b'"x", W/"abc"', b'*']:
+            self.assertStatus(
+                self.execute({b'If-None-Match': value}), 304, False)
+        self.assertStatus(
+            self.execute({b'If-None-Match': b'"abcd"'}), 200, True)
+
+    def test_if_none_match_any(self):
+        """
+        ``If-None-Match: *`` only matches a resource with validators, as a
+        current representation of it exists.
+        """
+        self.assertStatus(
+            self.execute(
+                {b'If-None-Match': b'*'},
+                validators=m(last_modified=LAST_MODIFIED)),
+            304, False)
+        self.assertStatus(
+            self.execute({b'If-None-Match': b'*'}, method=b'PUT'),
+            412, False)
+        for validators in [{}, m(etag=None, last_modified=None)]:
+            for method in [b'GET', b'PUT']:
+                self.assertStatus(
+                    self.execute(
+                        {b'If-None-Match': b'*'}, method=method,
+                        validators=validators),
+                    200, True)
+
+    def test_if_modified_since(self):
+        """
+        ``If-Modified-Since`` at or after the last modification results in a
+        304 response, but only without ``If-None-Match``.
+        """
+        self.assertStatus(
+            self.execute(
+                {b'If-Modified-Since': datetimeToString(LAST_MODIFIED)}),
+            304, False)
+        self.assertStatus(
+            self.execute(
+                {b'If-Modified-Since': datetimeToString(LAST_MODIFIED - 1)}),
+            200, True)
+        self.assertStatus(
+            self.execute(
+                {b'If-Modified-Since': datetimeToString(LAST_MODIFIED),
+                 b'If-None-Match': b'"nope"'}),
+            200, True)
+        self.assertStatus(
+            self.execute({b'If-Modified-Since': b'garbage'}), 200, True)
+
+    def test_unsafe(self):
+        """
+        A matching ``If-None-Match`` for an unsafe method results in a 412
+        response, ``If-Modified-Since`` is ignored.
+        """
+        self.assertStatus(
+            self.execute({b'If-None-Match': b'"abc"'}, method=b'PUT'),
+            412, False)
+        self.assertStatus(
+            self.execute(
+                {b'If-Modified-Since': datetimeToString(LAST_MODIFIED)},
+                method=b'POST'),
+            200, True)
+
+    def test_headers(self):
+        """
+        Validators are included in 304 responses and added to successful
+        responses.
+        """
+        expected = MatchesDict({
+            b'ETag': Equals(b'"abc"'),
+            b'Last-Modified': Equals(datetimeToString(LAST_MODIFIED))})
+        for headers in [{}, {b'If-None-Match': b'"abc"'}]:
+            d, _ = self.execute(headers)
+            self.assertThat(
+                d,
+                succeeded(
+                    ContainsDict({
+                        RESPONSE: ContainsDict({'headers': expected})})))
+
+    def test_deferred(self):
+        """
+        Validators may be computed asynchronously, or not at all.
+        """
+        self.assertStatus(
+            self.execute(
+                {b'If-None-Match': b'"abc"'},
+                validators=succeed({'etag': b'"abc"'})),
+            304, False)
+        d, _ = self.execute({b'If-None-Match': b'*'}, validators={})
+        self.assertThat(
+            d,
+            succeeded(
+                ContainsDict({
+                    RESPONSE: ContainsDict({
+                        'headers': Not(Contains(b'ETag'))})})))
+
+    def test_quote_etag(self):
+        """
+        Entity tags are quoted unless already quoted.
+        """
+        self.assertThat(quote_etag(b'abc'), Equals(b'"abc"'))
+        self.assertThat(quote_etag(b'abc', weak=True), Equals(b'W/"abc"'))
+        self.assertThat(quote_etag(b'W/"abc"'), Equals(b'W/"abc"'))
+
@@ -0,0 +1,431 @@
+import gzip
+import zlib
+from io import BytesIO
+
+from pyrsistent import m, pmap, v
+from testtools import TestCase
+from testtools.matchers import AfterPreprocessing as After
+from testtools.matchers import (
+    Contains, ContainsDict, Equals, HasLength, Is, MatchesAll, MatchesDict,
+    Not)
+from testtools.twistedsupport import has_no_result, succeeded
+from twisted.internet.defer import Deferred
+from twisted.web.client import FileBodyProducer
+
+from fugue._keys import REQUEST, RESPONSE
+from fugue.chain import execute
+from fugue.interceptors import handler
+from fugue.interceptors.http import (
+    body_params, compress_response, decompress_body)
+from fugue.interceptors.http.content_encoding import (
+    _DecompressingReader, ContentDecodingError, negotiate_encoding,
+    precompress)
+from fugue.interceptors.http.body_params import BodyLimits, RequestTooLarge
+from fugue.test.test_chain import empty_context
+
+
+def gzipped(data):
+    f = BytesIO()
+    with gzip.GzipFile(fileobj=f, mode='wb') as g:
+        g.write(data)
+    return f.getvalue()
+
+
+def deflated(data, wbits=zlib.MAX_WBITS):
+    c = zlib.compressobj(6, zlib.DEFLATED, wbits)
+    return c.compress(data) + c.flush()
+
+
+class DecompressingReaderTests(TestCase):
+    """
+    Tests for `_DecompressingReader`.
+    """
+    data = b''.join(b'line {}\n'.format(i) for i in range(1000))
+
+    def reader(self, compressed, wbits=16 + zlib.MAX_WBITS, **kw):
+        return _DecompressingReader(BytesIO(compressed), wbits, **kw)
+
+    def test_read(self):
+        """
+        Reading everything, or in chunks, produces the decompressed data.
+        """
+        self.assertThat(
+            self.reader(gzipped(self.data)).read(),
+            Equals(self.data))
+        reader = self.reader(gzipped(self.data), chunk_size=7)
+        self.assertThat(
+            b''.join(iter(lambda: reader.read(100), b'')),
+            Equals(self.data))
+
+    def test_readline(self):
+        """
+        Lines can be read, and iterated.
+        """
+        reader = self.reader(gzipped(self.data), chunk_size=16)
+        self.assertThat(reader.readline(), Equals(b'line 0\n'))
+        self.assertThat(reader.readline(3), Equals(b'lin'))
+        self.assertThat(list(reader), HasLength(999))
+
+    def test_deflate(self):
+        """
+        ``deflate`` data may be zlib wrapped, as specified, or raw.
+        """
+        for wbits in [zlib.MAX_WBITS, -zlib.MAX_WBITS]:
+            self.assertThat(
+                self.reader(
+                    deflated(self.data, wbits), zlib.MAX_WBITS).read(),
+                Equals(self.data))
+
+    def test_max_size(self):
+        """
+        Decompressing more than ``max_size`` bytes raises `RequestTooLarge`,
+        without decompressing much more than that.
+        """
+        bomb = gzipped(b'\0' * 2 ** 24)
+        reader = self.reader(bomb, max_size=2 ** 16, chunk_size=2 ** 10)
+        self.assertRaises(RequestTooLarge, reader.read)
+        self.assertThat(reader._size, Equals(2 ** 16 + 2 ** 10))
+        self.assertThat(
+            len(self.reader(gzipped(self.data), max_size=len(self.data))
+                .read()),
+            Equals(len(self.data)))
+
+    def test_corrupt(self):
+        """
+        Data that cannot be decompressed raises `ContentDecodingError`.
+        """
+        self.assertRaises(
+            ContentDecodingError,
+            self.reader(b'not gzip at all').read)
+
+    def test_truncated(self):
+        """
+        Data that ends before the end of the compressed stream, or continues
+        past it, raises `ContentDecodingError` once it has been read.
+        """
+        for data, wbits in [(gzipped(self.data), 16 + zlib.MAX_WBITS),
+                            (deflated(self.data), zlib.MAX_WBITS),
+                            (deflated(self.data, -zlib.MAX_WBITS),
+                             zlib.MAX_WBITS)]:
+            for truncated in [data[:-1], data[:-4], data[:len(data) // 2]]:
+                self.assertRaises(
+                    ContentDecodingError,
+                    self.reader(truncated, wbits).read)
+            self.assertRaises(
+                ContentDecodingError,
+                self.reader(data + data, wbits).read)
+
+
+class DecompressBodyTests(TestCase):
+    """
+    Tests for `decompress_body`.
+    """
+    def execute(self, request, **kw):
+        interceptors = [
+            decompress_body(**kw),
+            body_params(limits=BodyLimits(max_bytes=2 ** 10)),
+            handler(lambda req: m(status=200, body=req.get('json_params')))]
+        return execute(empty_context.set(REQUEST, request), interceptors)
+
+    def request(self, body, *codings):
+        return m(
+            content_type=b'application/json',
+            content_length=bytes(len(body)),
+            headers=pmap({b'Content-Encoding': v(*codings)}),
+            body=BytesIO(body))
+
+    def assertResponse(self, d, status, body=None):
+        self.assertThat(
+            d,
+            succeeded(
+                ContainsDict({
+                    RESPONSE: ContainsDict({
+                        'status': Equals(status),
+                        'body': Not(Is(None)) if body is None else body})})))
+
+    def test_gzip(self):
+        """
+        ``gzip`` encoded bodies are decompressed before being parsed, the
+        ``Content-Encoding`` header and ``content_length`` are removed.
+        """
+        seen = []
+        request = self.request(gzipped(b'{"a": 1}'), b'gzip')
+        interceptors = [
+            decompress_body(),
+            handler(lambda req: seen.append(req) or m(status=200))]
+        execute(empty_context.set(REQUEST, request), interceptors)
+        [req] = seen
+        self.assertThat(req['content_length'], Is(None))
+        self.assertThat(req['headers'], Equals(m()))
+        self.assertResponse(
+            self.execute(self.request(gzipped(b'{"a": 1}'), b'gzip')),
+            200, Equals(m(a=1)))
+
+    def test_multiple(self):
+        """
+        Multiple content codings are undone in reverse order, ``identity`` is
+        ignored.
+        """
+        self.assertResponse(
+            self.execute(
+                self.request(
+                    gzipped(deflated(b'{"a": 1}')),
+                    b'deflate, identity', b'GZIP')),
+            200, Equals(m(a=1)))
+
+    def test_identity(self):
+        """
+        Requests without a content coding are untouched.
+        """
+        request = self.request(b'{"a": 1}')
+        self.assertThat(
+            decompress_body().enter(empty_context.set(REQUEST, request)),
+            Equals(empty_context.set(REQUEST, request)))
+
+    def test_unsupported(self):
+        """
+        Unsupported content codings result in a 415 response.
+        """
+        self.assertResponse(
+            self.execute(self.request(b'{"a": 1}', b'br')), 415)
+
+    def test_limits(self):
+        """
+        Bodies decompressing to more than ``max_size``, or the ``max_bytes``
+        of `body_params`, result in a 413 response.
+        """
+        body = gzipped(b'[' + b' ' * 2 ** 12 + b']')
+        self.assertResponse(
+            self.execute(self.request(body, b'gzip'), max_size=2 ** 11), 413)
+        self.assertResponse(
+            self.execute(self.request(body, b'gzip')), 413)
+
+    def test_corrupt(self):
+        """
+        Bodies that cannot be decompressed result in a 400 response.
+        """
+        self.assertResponse(
+            self.execute(self.request(b'{"a": 1}', b'gzip')), 400)
+
+    def test_truncated(self):
+        """
+        Bodies that are truncated, even if what was received decompresses to
+        something parseable, result in a 400 response.
+        """
+        self.assertResponse(
+            self.execute(self.request(gzipped(b'{"a": 1}')[:-4], b'gzip')),
+            400)
+
+
+class NegotiateEncodingTests(TestCase):
+    """
+    Tests for `negotiate_encoding`.
+    """
+    def negotiate(self, *values):
+        return negotiate_encoding(m(**{b'Accept-Encoding': v(*values)}))
+
+    def test_preference(self):
+        """
+        The acceptable coding with the highest quality is chosen, ties are
+        broken by the server's preference.
+        """
+        self.assertThat(self.negotiate(b'deflate, gzip'), Equals(b'gzip'))
+        self.assertThat(
+            self.negotiate(b'gzip;q=0.5', b'deflate'),
+            Equals(b'deflate'))
+        self.assertThat(self.negotiate(b'x-gzip'), Equals(b'gzip'))
+        self.assertThat(self.negotiate(b'*'), Equals(b'gzip'))
+        self.assertThat(
+            self.negotiate(b'*, gzip;q=0'),
+            Equals(b'deflate'))
+
+    def test_unacceptable(self):
+        """
+        ``None`` is chosen if nothing is acceptable.
+        """
+        self.assertThat(self.negotiate(b'br'), Is(None))
+        self.assertThat(self.negotiate(b'gzip;q=0, deflate;q=0'), Is(None))
+        self.assertThat(self.negotiate(b'gzip;q=nope'), Is(None))
+        self.assertThat(negotiate_encoding(m()), Is(None))
+
+
+class CompressResponseTests(TestCase):
+    """
+    Tests for `compress_response`.
+    """
+    payload = b'{"a": "' + b'x' * 2 ** 11 + b'"}'
+
+    def execute(self, response, accept=b'gzip', method=b'GET', **kw):
+        request = m(
+            request_method=method,
+            headers=m(**{b'Accept-Encoding': v(accept)}))
+        interceptors = [
+            compress_response(**kw),
+            handler(lambda req: response)]
+        return execute(empty_context.set(REQUEST, request), interceptors)
+
+    def response(self, body=None, **headers):
+        headers.setdefault(b'Content-Type', b'application/json')
+        return m(
+            status=200,
+            headers=pmap(headers),
+            body=self.payload if body is None else body)
+
+    def assertResponse(self, d, matcher):
+        self.assertThat(
+            d, succeeded(ContainsDict({RESPONSE: matcher})))
+
+    def test_compress(self):
+        """
+        ``bytes`` bodies are compressed with the negotiated coding, the
+        ``Content-Length`` is updated, ``Vary`` is extended and strong entity
+        tags are weakened.
+        """
+        response = self.response(
+            **{b'Vary': b'Cookie',
+               b'Content-Length': bytes(len(self.payload)),
+               b'ETag': b'"abc"'})
+        self.assertResponse(
+            self.execute(response),
+            ContainsDict({
+                'body': After(gunzip, Equals(self.payload)),
+                'headers': MatchesDict({
+                    b'Content-Type': Equals(b'application/json'),
+                    b'Content-Encoding': Equals(b'gzip'),
+                    b'Content-Length': After(
+                        int, Not(Equals(len(self.payload)))),
+                    b'Vary': Equals(b'Cookie, Accept-Encoding'),
+                    b'ETag': Equals(b'W/"abc"')})}))
+        self.assertResponse(
+            self.execute(self.response(), accept=b'deflate'),
+            ContainsDict({
+                'body': After(zlib.decompress, Equals(self.payload))}))
+
+    def test_skip(self):
+        """
+        Small bodies, incompressible content types, bodies that are already
+        encoded and responses without a body are not compressed.
+        """
+        responses = [
+            self.response(b'{}'),
+            self.response(**{b'Content-Type': b'image/png'}),
+            self.response(**{b'Content-Encoding': b'br'}),
+            self.response(**{b'Cache-Control': b'no-transform'}),
+            self.response().set('status', 304),
+            self.response().discard('body')]
+        for response in responses:
+            self.assertResponse(
+                self.execute(response),
+                Equals(response))
+
+    def test_uncompressible_body(self):
+        """
+        `IBodyProducer` bodies, and bodies that are not iterable, are not
+        compressed.
+        """
+        producer = FileBodyProducer(BytesIO(self.payload))
+        for body in [producer, object()]:
+            response = self.response(body, **{b'Content-Type': b'text/plain'})
+            self.assertResponse(
+                self.execute(response),
+                Equals(response))
+
+    def test_unaccepted(self):
+        """
+        If the client does not accept any supported coding, the body is not
+        compressed but the response still varies by ``Accept-Encoding``.
+        """
+        self.assertResponse(
+            self.execute(self.response(), accept=b'identity'),
+            Equals(
+                self.response().transform(
+                    ['headers', b'Vary'], b'Accept-Encoding')))
+
+    def test_head(self):
+        """
+        Responses to ``HEAD`` requests are not compressed.
+        """
+        self.assertResponse(
+            self.execute(self.response(), method=b'HEAD'),
+            ContainsDict({'body': Equals(self.payload)}))
+
+    def test_streaming(self):
+        """
+        Iterable and file-like bodies are compressed incrementally, producing
+        output for each chunk, and lose their ``Content-Length``.
+        """
+        chunks = [b'{"a": [', b'1, ' * 1000, b'2]}']
+        results = []
+        for body in [iter(chunks), BytesIO(b''.join(chunks))]:
+            self.execute(
+                self.response(
+                    body, **{b'Content-Length': b'3006'}),
+            ).addCallback(lambda context: results.append(context[RESPONSE]))
+        [from_iterable, from_file] = results
+        for response in results:
+            self.assertThat(
+                response['headers'],
+                Not(Contains(b'Content-Length')))
+        compressed = list(from_iterable['body'])
+        self.assertThat(compressed, HasLength(4))
+        self.assertThat(
+            gunzip(b''.join(compressed)),
+            Equals(b''.join(chunks)))
+        self.assertThat(
+            gunzip(b''.join(from_file['body'])),
+            Equals(b''.join(chunks)))
+
+    def test_deferred_chunks(self):
+        """
+        Chunks of iterable bodies that are `Deferred`s are compressed once
+        they fire.
+        """
+        chunk = Deferred()
+        results = []
+        self.execute(
+            self.response(iter([b'{"a": [', chunk, b'2]}'])),
+        ).addCallback(lambda context: results.append(context[RESPONSE]))
+        [response] = results
+        body = iter(response['body'])
+        compressed = [next(body)]
+        self.assertThat(next(body), Is(chunk))
+        chunk.callback(b'1, ' * 1000)
+        compressed.append(chunk.result)
+        compressed.extend(body)
+        self.assertThat(compressed, HasLength(4))
+        self.assertThat(
+            gunzip(b''.join(compressed)),
+            Equals(b'{"a": [' + b'1, ' * 1000 + b'2]}'))
+
+    def test_deferred(self):
+        """
+        `Deferred` bodies are compressed once they fire.
+        """
+        d = Deferred()
+        result = self.execute(self.response(d))
+        self.assertThat(result, has_no_result())
+        d.callback(self.payload)
+        self.assertResponse(
+            result,
+            ContainsDict({'body': After(gunzip, Equals(self.payload))}))
+
+    def test_precompressed(self):
+        """
+        Precompressed variants are used for the negotiated coding, instead of
+        compressing the body again, and are not part of the final response.
+        """
+        precompressed = precompress(self.payload)
+        self.assertThat(
+            gunzip(precompressed[b'gzip']),
+            Equals(self.payload))
+        response = self.response().set(
+            'precompressed', precompressed.set(b'gzip', b'precompressed'))
+        self.assertResponse(
+            self.execute(response),
+            MatchesAll(
+                ContainsDict({'body': Equals(b'precompressed')}),
+                Not(Contains('precompressed'))))
+
+
+def gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
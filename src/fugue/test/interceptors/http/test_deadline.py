@@ -0,0 +1,111 @@
+from pyrsistent import m
+from testtools import TestCase
+from testtools.matchers import (
+    Contains, ContainsDict, Equals, HasLength, Is, MatchesStructure, Not)
+from testtools.twistedsupport import failed, has_no_result, succeeded
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+
+from fugue._keys import DEADLINE, REQUEST, RESPONSE
+from fugue.chain import Deadline, execute
+from fugue.interceptors import before
+from fugue.interceptors.http import deadline
+from fugue.interceptors.http.deadline import remaining
+from fugue.test.test_chain import empty_context
+
+
+def request(**headers):
+    return m(request_method=b'GET', headers=m(**headers))
+
+
+class DeadlineTests(TestCase):
+    """
+    Tests for `deadline`.
+    """
+    def setUp(self):
+        super(DeadlineTests, self).setUp()
+        self.clock = Clock()
+        self.clock.advance(100)
+        self.remaining = []
+
+    def execute(self, interceptors, req=None):
+        def _handler(context):
+            self.remaining.append(remaining(context))
+            return context.set(RESPONSE, m(status=200, body=b'ok'))
+        return execute(
+            empty_context.set(REQUEST, req or request()),
+            interceptors + [before(_handler)])
+
+    def test_timeout(self):
+        """
+        The deadline is ``timeout`` seconds from now, and the remaining time
+        is available to later interceptors.
+        """
+        self.assertThat(
+            self.execute([deadline(timeout=5, clock=self.clock)]),
+            succeeded(
+                ContainsDict({
+                    DEADLINE: Equals(
+                        Deadline(expires=105, clock=self.clock))})))
+        self.assertThat(self.remaining, Equals([5]))
+
+    def test_no_deadline(self):
+        """
+        Without a timeout there is no deadline.
+        """
+        self.assertThat(
+            self.execute([deadline(header=b'X-Timeout', clock=self.clock)]),
+            succeeded(Not(Contains(DEADLINE))))
+        self.assertThat(self.remaining, Equals([None]))
+
+    def test_header(self):
+        """
+        The request header can shorten the deadline, but not extend it, and
+        invalid values are ignored.
+        """
+        for value, expected in [(b'2.5', 2.5), (b'20', 5), (b'nope', 5),
+                                (b'-1', 5)]:
+            self.remaining = []
+            self.execute(
+                [deadline(timeout=5, header=b'X-Timeout', clock=self.clock)],
+                request(**{'x-timeout': value}))
+            self.assertThat(self.remaining, Equals([expected]))
+
+    def test_nested(self):
+        """
+        A later deadline interceptor can only bring the deadline forward.
+        """
+        self.execute([deadline(timeout=5, clock=self.clock),
+                      deadline(timeout=10, clock=self.clock),
+                      deadline(timeout=1, clock=self.clock)])
+        self.assertThat(self.remaining, Equals([1]))
+
+    def test_exceeded(self):
+        """
+        A stage that does not complete before the deadline is cancelled and
+        answered with an HTTP 504 response.
+        """
+        cancelled = []
+        d = self.execute([
+            deadline(timeout=5, clock=self.clock),
+            before(lambda context: Deferred(cancelled.append))])
+        self.assertThat(d, has_no_result())
+        self.clock.advance(5)
+        self.assertThat(cancelled, HasLength(1))
+        self.assertThat(
+            d,
+            succeeded(
+                ContainsDict({
+                    RESPONSE: ContainsDict({'status': Equals(504)})})))
+        self.assertThat(self.remaining, Equals([]))
+
+    def test_other_errors(self):
+        """
+        Errors other than an exceeded deadline are not handled.
+        """
+        def _fail(context):
+            raise RuntimeError('nope')
+        self.assertThat(
+            self.execute([deadline(timeout=5, clock=self.clock),
+                          before(_fail)]),
+            failed(MatchesStructure(type=Is(RuntimeError))))
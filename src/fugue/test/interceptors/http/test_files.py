@@ -0,0 +1,170 @@
+import os
+
+from fixtures import TempDir
+from pyrsistent import m
+from testtools import TestCase
+from testtools.matchers import ContainsDict, Equals, Is, IsInstance
+from testtools.twistedsupport import succeeded
+from twisted.web.http import datetimeToString
+
+from fugue.interceptors._producers import write_body
+from fugue.interceptors.http.files import (
+    _parse_range, _UNSATISFIABLE, file_response, FileBody)
+from fugue.test.interceptors.test_producers import FakeConsumer
+
+
+def request(method=b'GET', **headers):
+    return m(request_method=method, headers=m(**headers))
+
+
+class ParseRangeTests(TestCase):
+    """
+    Tests for `_parse_range`.
+    """
+    def test_ranges(self):
+        """
+        Single byte ranges, open ended and suffix ranges are clamped to the
+        size of the representation.
+        """
+        self.assertThat(_parse_range(b'bytes=0-9', 100), Equals((0, 9)))
+        self.assertThat(_parse_range(b'bytes=0-0', 100), Equals((0, 0)))
+        self.assertThat(_parse_range(b'bytes=90-', 100), Equals((90, 99)))
+        self.assertThat(_parse_range(b'bytes=90-200', 100), Equals((90, 99)))
+        self.assertThat(_parse_range(b'bytes=-10', 100), Equals((90, 99)))
+        self.assertThat(_parse_range(b'bytes=-200', 100), Equals((0, 99)))
+
+    def test_empty(self):
+        """
+        No range of an empty representation is satisfiable.
+        """
+        for value in [b'bytes=0-', b'bytes=0-0', b'bytes=-5']:
+            self.assertThat(_parse_range(value, 0), Is(_UNSATISFIABLE))
+
+    def test_ignored(self):
+        """
+        Invalid, and multiple, ranges are ignored.
+        """
+        for value in [b'bytes=', b'bytes=9-0', b'bytes=200-9', b'lines=0-1',
+                      b'bytes=0-1,3-4']:
+            self.assertThat(_parse_range(value, 100), Is(None))
+
+
+class FileResponseTests(TestCase):
+    """
+    Tests for `file_response`.
+    """
+    def setUp(self):
+        super(FileResponseTests, self).setUp()
+        self.path = os.path.join(
+            self.useFixture(TempDir()).path, 'file.txt')
+        with open(self.path, 'wb') as fd:
+            fd.write(b'0123456789')
+        self.last_modified = datetimeToString(
+            int(os.stat(self.path).st_mtime))
+
+    def body(self, response):
+        consumer = FakeConsumer()
+        d = write_body(consumer, response['body'])
+        while consumer.producer is not None and not consumer.unregistered:
+            consumer.producer.resumeProducing()
+        self.assertThat(d, succeeded(Is(None)))
+        return b''.join(consumer.written)
+
+    def test_file(self):
+        """
+        The whole file is the body, its headers are derived from the file.
+        """
+        response = file_response(request(), self.path)
+        self.assertThat(
+            response,
+            ContainsDict({
+                'status': Equals(200),
+                'body': IsInstance(FileBody),
+                'headers': Equals({
+                    b'Content-Type': [b'text/plain'],
+                    b'Content-Length': [b'10'],
+                    b'Accept-Ranges': [b'bytes'],
+                    b'Last-Modified': [self.last_modified]})}))
+        self.assertThat(self.body(response), Equals(b'0123456789'))
+        self.assertThat(
+            b''.join(response['body']), Equals(b'0123456789'))
+
+    def test_head(self):
+        """
+        ``HEAD`` requests have no body.
+        """
+        response = file_response(request(b'HEAD'), self.path)
+        self.assertThat(response['body'], Is(None))
+        self.assertThat(
+            response['headers'][b'Content-Length'], Equals([b'10']))
+
+    def test_range(self):
+        """
+        A satisfiable range is served as a partial response.
+        """
+        response = file_response(
+            request(Range=b'bytes=2-5'), self.path, content_type=b'a/b')
+        self.assertThat(
+            response,
+            ContainsDict({
+                'status': Equals(206),
+                'headers': ContainsDict({
+                    b'Content-Type': Equals([b'a/b']),
+                    b'Content-Length': Equals([b'4']),
+                    b'Content-Range': Equals([b'bytes 2-5/10'])})}))
+        self.assertThat(self.body(response), Equals(b'2345'))
+        self.assertThat(b''.join(response['body']), Equals(b'2345'))
+
+    def test_unsatisfiable(self):
+        """
+        An unsatisfiable range is answered with an HTTP 416 response.
+        """
+        response = file_response(request(Range=b'bytes=10-'), self.path)
+        self.assertThat(
+            response,
+            ContainsDict({
+                'status': Equals(416),
+                'headers': ContainsDict({
+                    b'Content-Range': Equals([b'bytes */10'])}),
+                'body': Equals(b'')}))
+
+    def test_unsatisfiable_empty(self):
+        """
+        Ranges of an empty file are answered with an HTTP 416 response.
+        """
+        open(self.path, 'wb').close()
+        response = file_response(request(Range=b'bytes=-5'), self.path)
+        self.assertThat(
+            response,
+            ContainsDict({
+                'status': Equals(416),
+                'headers': ContainsDict({
+                    b'Content-Range': Equals([b'bytes */0'])})}))
+
+    def test_if_range(self):
+        """
+        Ranges are only served if ``If-Range`` matches the modification date,
+        and only for ``GET`` requests.
+        """
+        def _status(req):
+            return file_response(req, self.path)['status']
+        self.assertThat(
+            _status(request(**{'Range': b'bytes=0-1',
+                               'If-Range': self.last_modified})),
+            Equals(206))
+        self.assertThat(
+            _status(request(**{'Range': b'bytes=0-1',
+                               'If-Range': b'"etag"'})),
+            Equals(200))
+        self.assertThat(
+            _status(request(b'POST', Range=b'bytes=0-1')),
+            Equals(200))
+
+    def test_not_regular(self):
+        """
+        Only regular files can be served.
+        """
+        self.assertRaises(
+            ValueError, file_response, request(), os.path.dirname(self.path))
+        self.assertRaises(
+            OSError, file_response, request(), self.path + '.nope')
@@ -0,0 +1,190 @@
+from pyrsistent import freeze, m, pmap, v
+from testtools import TestCase
+from testtools.matchers import Equals, Is, Not
+
+from fugue.interceptors.http.headers import (
+    discard_header, get_first_header, get_header, get_header_tokens,
+    Headers, set_header)
+
+
+class HeaderTests(TestCase):
+    """
+    Tests for the header map utilities.
+    """
+    headers = pmap({
+        b'Content-Type': b'text/plain',
+        b'Accept-Encoding': v(b'gzip, deflate', b' br ,,'),
+    })
+
+    def test_get_header(self):
+        """
+        Headers are looked up case-insensitively, single values are treated as
+        a sequence of one.
+        """
+        self.assertThat(
+            get_header(self.headers, b'content-type'),
+            Equals([b'text/plain']))
+        self.assertThat(
+            get_header(self.headers, b'Accept-Encoding'),
+            Equals([b'gzip, deflate', b' br ,,']))
+        self.assertThat(get_header(self.headers, b'nope'), Is(None))
+        self.assertThat(get_header(None, b'nope', []), Equals([]))
+
+    def test_get_first_header(self):
+        """
+        Only the first value is returned.
+        """
+        self.assertThat(
+            get_first_header(self.headers, b'ACCEPT-ENCODING'),
+            Equals(b'gzip, deflate'))
+        self.assertThat(
+            get_first_header(self.headers, b'nope', b'default'),
+            Equals(b'default'))
+
+    def test_get_header_tokens(self):
+        """
+        Comma-separated list headers are split and stripped, across values.
+        """
+        self.assertThat(
+            get_header_tokens(self.headers, b'accept-encoding'),
+            Equals([b'gzip', b'deflate', b'br']))
+        self.assertThat(
+            get_header_tokens(self.headers, b'nope'),
+            Equals([]))
+
+    def test_discard_header(self):
+        """
+        Headers are removed case-insensitively.
+        """
+        self.assertThat(
+            discard_header(self.headers, b'accept-encoding'),
+            Equals(m(**{b'Content-Type': b'text/plain'})))
+
+    def test_set_header(self):
+        """
+        Setting a header replaces any existing one, in any case.
+        """
+        self.assertThat(
+            set_header(self.headers, b'content-type', b'text/html'),
+            Equals(
+                self.headers
+                .discard(b'Content-Type')
+                .set(b'content-type', b'text/html')))
+
+
+class HeadersTests(TestCase):
+    """
+    Tests for `Headers`.
+    """
+    headers = Headers([
+        (b'Content-Type', b'text/plain'),
+        (b'Accept-Encoding', b'gzip, deflate'),
+        (b'accept-encoding', b' br ,,')])
+
+    def test_lookup(self):
+        """
+        Headers are looked up case-insensitively, and all values are returned
+        in order.
+        """
+        self.assertThat(
+            self.headers[b'ACCEPT-ENCODING'],
+            Equals([b'gzip, deflate', b' br ,,']))
+        self.assertThat(self.headers.get(b'nope'), Is(None))
+        self.assertThat(b'content-type' in self.headers, Equals(True))
+        self.assertThat(
+            self.headers.first(b'accept-encoding'),
+            Equals(b'gzip, deflate'))
+        self.assertThat(
+            sorted(self.headers),
+            Equals([b'Accept-Encoding', b'Content-Type']))
+        self.assertThat(len(self.headers), Equals(2))
+
+    def test_pairs(self):
+        """
+        All pairs are retained, in order.
+        """
+        self.assertThat(
+            list(self.headers.pairs()),
+            Equals([(b'Content-Type', b'text/plain'),
+                    (b'Accept-Encoding', b'gzip, deflate'),
+                    (b'accept-encoding', b' br ,,')]))
+
+    def test_from_map(self):
+        """
+        Headers can be created from header maps, or ``(name, values)`` pairs.
+        """
+        expected = Headers([(b'X-Foo', b'a'), (b'X-Foo', b'b'),
+                            (b'X-Bar', b'c')])
+        self.assertThat(
+            Headers.from_map(m(**{b'X-Foo': v(b'a', b'b'), b'X-Bar': b'c'})),
+            Equals(expected))
+        self.assertThat(
+            Headers.from_map(
+                iter([(b'X-Foo', [b'a', b'b']), (b'X-Bar', [b'c'])])),
+            Equals(expected))
+
+    def test_equality(self):
+        """
+        Headers are equal to other header maps with the same headers,
+        regardless of the case of their names.
+        """
+        self.assertThat(
+            self.headers,
+            Equals({b'content-type': [b'text/plain'],
+                    b'Accept-Encoding': [b'gzip, deflate', b' br ,,']}))
+        self.assertThat(
+            self.headers,
+            Not(Equals({b'Content-Type': b'text/plain'})))
+        self.assertThat(
+            hash(Headers([(b'A', b'1')])),
+            Equals(hash(Headers([(b'a', b'1')]))))
+
+    def test_hash(self):
+        """
+        Headers hash the same as the equivalent map of lowercase names to
+        vectors of values, other hashable header maps that cannot hash the
+        same are not equal.
+        """
+        frozen = freeze({b'a': [b'1', b'2'], b'b': [b'3']})
+        headers = Headers([(b'A', b'1'), (b'b', b'3'), (b'a', b'2')])
+        self.assertThat(headers, Equals(frozen))
+        self.assertThat(hash(headers), Equals(hash(frozen)))
+        self.assertThat({headers: True}.get(frozen), Is(True))
+        self.assertThat(Headers(), Equals(m()))
+        self.assertThat(
+            headers,
+            Not(Equals(freeze({b'A': [b'1', b'2'], b'b': b'3'}))))
+
+    def test_update(self):
+        """
+        Setting a header replaces all of its values, in any case, adding
+        appends values and discarding removes them; the original is unchanged.
+        """
+        headers = self.headers.set(b'ACCEPT-ENCODING', b'identity')
+        self.assertThat(
+            list(headers.pairs()),
+            Equals([(b'Content-Type', b'text/plain'),
+                    (b'ACCEPT-ENCODING', b'identity')]))
+        self.assertThat(
+            headers.add(b'Content-Type', [b'a', b'b'])[b'content-type'],
+            Equals([b'text/plain', b'a', b'b']))
+        self.assertThat(
+            self.headers.discard(b'content-type'),
+            Equals({b'Accept-Encoding': [b'gzip, deflate', b' br ,,']}))
+        self.assertThat(self.headers.discard(b'nope'), Is(self.headers))
+        self.assertThat(len(list(self.headers.pairs())), Equals(3))
+
+    def test_utilities(self):
+        """
+        The header map utilities work with `Headers`.
+        """
+        self.assertThat(
+            get_header_tokens(self.headers, b'accept-encoding'),
+            Equals([b'gzip', b'deflate', b'br']))
+        self.assertThat(
+            get_first_header(self.headers, b'nope', b'default'),
+            Equals(b'default'))
+        self.assertThat(
+            set_header(self.headers, b'accept-encoding', b'identity'),
+            Equals({b'Content-Type': b'text/plain',
+                    b'Accept-Encoding': b'identity'}))
@@ -0,0 +1,178 @@
+import json
+
+from pyrsistent import m, pmap, pset, thaw, v
+from testtools import TestCase
+from testtools.matchers import AfterPreprocessing as After
+from testtools.matchers import (
+    ContainsDict, Equals, GreaterThan, HasLength, IsInstance, MatchesAll,
+    MatchesDict, MatchesListwise, Not)
+from testtools.twistedsupport import failed, succeeded
+from twisted.internet.defer import succeed
+
+from fugue._keys import REQUEST, RESPONSE
+from fugue.chain import execute
+from fugue.interceptors import handler
+from fugue.interceptors.http import json_response
+from fugue.interceptors.http.json_response import json_array
+from fugue.json_backend import BACKENDS
+from fugue.lazy import lazy_freeze
+from fugue.test.test_chain import empty_context
+
+
+def decoded(body):
+    """
+    Decode a response body, that may be streamed.
+    """
+    if not isinstance(body, bytes):
+        body = b''.join(body)
+    return json.loads(body)
+
+
+class JSONResponseTests(TestCase):
+    """
+    Tests for `json_response`.
+    """
+    def execute(self, body, headers=m(), **kw):
+        interceptors = [
+            json_response(**kw),
+            handler(lambda req: m(status=200, headers=headers, body=body))]
+        return execute(empty_context.set(REQUEST, m()), interceptors)
+
+    def assertResponse(self, d, matcher):
+        self.assertThat(d, succeeded(ContainsDict({RESPONSE: matcher})))
+
+    def test_structures(self):
+        """
+        Plain, `pyrsistent` and lazily frozen structures are encoded, with a
+        ``Content-Type`` and ``Content-Length``.
+        """
+        data = {u'a': [1, {u'b': None}], u'c': u'\N{SNOWMAN}'}
+        bodies = [
+            data,
+            pmap({u'a': v(1, m(b=None)), u'c': u'\N{SNOWMAN}'}),
+            lazy_freeze(data),
+            succeed(data)]
+        for body in bodies:
+            self.assertResponse(
+                self.execute(body),
+                ContainsDict({
+                    'body': MatchesAll(
+                        IsInstance(bytes),
+                        After(json.loads, Equals(data))),
+                    'headers': MatchesDict({
+                        b'Content-Type': Equals(b'application/json'),
+                        b'Content-Length': After(int, GreaterThan(0))})}))
+        self.assertResponse(
+            self.execute(pset([1])),
+            ContainsDict({'body': After(json.loads, Equals([1]))}))
+
+    def test_backends(self):
+        """
+        Every available backend can encode `pyrsistent` structures.
+        """
+        for name, factory in BACKENDS.items():
+            try:
+                factory()
+            except ImportError:
+                continue
+            self.assertResponse(
+                self.execute(m(a=v(1, m(b=2))), backend=name),
+                ContainsDict({
+                    'body': After(
+                        json.loads, Equals({u'a': [1, {u'b': 2}]}))}))
+
+    def test_unencoded(self):
+        """
+        ``bytes`` and ``unicode`` bodies, and responses without a body, are
+        left alone.
+        """
+        for body in [b'hello', u'hello', None]:
+            self.assertResponse(
+                self.execute(body),
+                Equals(m(status=200, headers=m(), body=body)))
+
+    def test_content_type(self):
+        """
+        An existing ``Content-Type`` is kept.
+        """
+        self.assertResponse(
+            self.execute(
+                m(), m(**{b'content-type': b'application/vnd.api+json'})),
+            ContainsDict({
+                'headers': ContainsDict({
+                    b'content-type': Equals(b'application/vnd.api+json')})}))
+
+    def test_streaming(self):
+        """
+        Collections larger than ``stream_threshold`` are encoded as chunks,
+        without a ``Content-Length``.
+        """
+        items = [{u'id': i, u'name': u'item {}'.format(i)} for i in range(100)]
+        for body in [items, v(*map(pmap, items)),
+                     {unicode(i): i for i in range(100)}]:
+            self.assertResponse(
+                self.execute(
+                    body, stream_threshold=10, chunk_size=100,
+                    headers=m(**{b'Content-Length': b'1'})),
+                ContainsDict({
+                    'body': MatchesAll(
+                        Not(IsInstance(bytes)),
+                        After(list, MatchesAll(
+                            After(len, GreaterThan(5)),
+                            After(
+                                decoded,
+                                Equals(json.loads(json.dumps(thaw(body)))))))),
+                    'headers': MatchesDict({
+                        b'Content-Type': Equals(b'application/json')})}))
+
+    def test_streaming_keys(self):
+        """
+        Streamed objects convert non-string keys as encoding them in one go
+        does.
+        """
+        body = {1: u'int', 2.5: u'float', True: u'bool', None: u'null',
+                u'a': u'text'}
+        bodies = []
+        for stream_threshold in [None, 1]:
+            self.execute(body, stream_threshold=stream_threshold).addCallback(
+                lambda context: bodies.append(context[RESPONSE]['body']))
+        [whole, streamed] = bodies
+        self.assertThat(whole, IsInstance(bytes))
+        self.assertThat(b''.join(streamed), Equals(whole))
+
+    def test_json_array(self):
+        """
+        Iterables marked with `json_array` are consumed only as the body is
+        iterated.
+        """
+        consumed = []
+
+        def _items():
+            for i in range(3):
+                consumed.append(i)
+                yield m(id=i)
+        d = self.execute(json_array(_items()), chunk_size=1)
+        self.assertThat(consumed, Equals([]))
+        self.assertResponse(
+            d,
+            ContainsDict({
+                'body': After(
+                    list,
+                    MatchesAll(
+                        HasLength(7),
+                        After(
+                            lambda chunks: json.loads(b''.join(chunks)),
+                            Equals([{u'id': 0}, {u'id': 1}, {u'id': 2}]))))}))
+        self.assertThat(consumed, Equals([0, 1, 2]))
+        self.assertResponse(
+            self.execute(json_array([])),
+            ContainsDict({
+                'body': After(list, MatchesListwise([Equals(b'[]')]))}))
+
+    def test_unserializable(self):
+        """
+        Bodies that cannot be encoded are an error.
+        """
+        self.assertThat(
+            self.execute([object()]),
+            failed(After(lambda f: f.type, Equals(TypeError))))
@@ -0,0 +1,197 @@
+from testtools import TestCase
+from testtools.matchers import AfterPreprocessing as After
+from testtools.matchers import ContainsDict, Equals, HasLength, Is
+from testtools.twistedsupport import failed, has_no_result, succeeded
+from twisted.internet.defer import Deferred
+from twisted.internet.error import ConnectionLost
+from twisted.internet.task import Clock
+
+from fugue.interceptors._producers import write_body
+from fugue.interceptors.http.content_encoding import _encode_response
+from fugue.interceptors.http.sse import (
+    event_stream_response, EventStream, format_event, SlowConsumer)
+from fugue.test.interceptors.test_producers import FakeConsumer
+
+
+class FormatEventTests(TestCase):
+    """
+    Tests for `format_event`.
+    """
+    def test_data(self):
+        """
+        Each line of data is a field of its own.
+        """
+        self.assertThat(
+            format_event(u'one\ntw\xf6'),
+            Equals(b'data: one\ndata: tw\xc3\xb6\n\n'))
+        self.assertThat(format_event(b''), Equals(b'data: \n\n'))
+
+    def test_fields(self):
+        """
+        The event type, identifier and reconnection time precede the data.
+        """
+        self.assertThat(
+            format_event(b'x', event=u'update', id=3, retry=1000),
+            Equals(b'event: update\nid: 3\nretry: 1000\ndata: x\n\n'))
+
+
+class EventStreamTests(TestCase):
+    """
+    Tests for `EventStream`.
+    """
+    def setUp(self):
+        super(EventStreamTests, self).setUp()
+        self.clock = Clock()
+        self.consumer = FakeConsumer()
+
+    def stream(self, source=None, **kw):
+        kw.setdefault('clock', self.clock)
+        return EventStream(source, **kw)
+
+    def test_coalesce(self):
+        """
+        Events sent together are written together, in the next reactor
+        iteration.
+        """
+        stream = self.stream()
+        stream.send(b'a')
+        d = write_body(self.consumer, stream)
+        self.assertThat(self.consumer.written, Equals([b'data: a\n\n']))
+        stream.send(b'b')
+        stream.send(b'c', event=b'x')
+        self.assertThat(self.consumer.written, HasLength(1))
+        self.clock.advance(0)
+        self.assertThat(
+            self.consumer.written,
+            Equals([b'data: a\n\n', b'data: b\n\nevent: x\ndata: c\n\n']))
+        self.assertThat(d, has_no_result())
+
+    def test_close(self):
+        """
+        Closing the stream writes anything outstanding and completes the
+        body, discarding anything sent afterwards.
+        """
+        stream = self.stream()
+        closed = stream.when_closed()
+        d = write_body(self.consumer, stream)
+        stream.send(b'a')
+        stream.close()
+        stream.send(b'b')
+        self.assertThat(d, succeeded(Is(None)))
+        self.assertThat(closed, succeeded(Is(None)))
+        self.assertThat(self.consumer.written, Equals([b'data: a\n\n']))
+        self.assertThat(self.consumer.unregistered, Equals(True))
+        self.assertThat(self.clock.getDelayedCalls(), Equals([]))
+        self.assertThat(stream.when_closed(), succeeded(Is(None)))
+
+    def test_heartbeat(self):
+        """
+        A comment is written after ``heartbeat`` idle seconds.
+        """
+        stream = self.stream(heartbeat=10)
+        write_body(self.consumer, stream)
+        self.clock.advance(5)
+        stream.send(b'a')
+        self.clock.advance(0)
+        self.clock.advance(9)
+        self.assertThat(self.consumer.written, Equals([b'data: a\n\n']))
+        self.clock.advance(1)
+        self.assertThat(
+            self.consumer.written, Equals([b'data: a\n\n', b':\n\n']))
+
+    def test_paused(self):
+        """
+        Nothing is written while the stream is paused, and a client that
+        falls too far behind is given up on.
+        """
+        stream = self.stream(max_buffer=15)
+        d = write_body(self.consumer, stream)
+        stream.pauseProducing()
+        stream.send(b'a')
+        self.clock.advance(0)
+        self.assertThat(self.consumer.written, Equals([]))
+        stream.resumeProducing()
+        self.assertThat(self.consumer.written, Equals([b'data: a\n\n']))
+        stream.pauseProducing()
+        stream.send(b'b')
+        stream.send(b'c')
+        self.assertThat(
+            d, failed(After(lambda f: f.type, Is(SlowConsumer))))
+
+    def test_disconnect(self):
+        """
+        If the client goes away, the stream ends and the source is closed.
+        """
+        def _source():
+            try:
+                yield b'a'
+                yield Deferred()
+            finally:
+                closed.append(True)
+        closed = []
+        stream = self.stream(_source())
+        when_closed = stream.when_closed()
+        d = write_body(self.consumer, stream)
+        self.clock.advance(0)
+        stream.stopProducing()
+        self.assertThat(
+            d, failed(After(lambda f: f.type, Is(ConnectionLost))))
+        self.assertThat(when_closed, succeeded(Is(None)))
+        self.assertThat(closed, Equals([True]))
+        self.assertThat(self.clock.getDelayedCalls(), Equals([]))
+
+    def test_source(self):
+        """
+        Events are pulled from the source, waiting for those that are not yet
+        available, and the stream ends with the source.
+        """
+        pending = Deferred()
+        stream = self.stream(
+            iter([b'a', {'data': b'b', 'id': 1}, pending, b'd']))
+        d = write_body(self.consumer, stream)
+        self.clock.advance(0)
+        self.assertThat(
+            self.consumer.written,
+            Equals([b'data: a\n\nid: 1\ndata: b\n\n']))
+        pending.callback(b'c')
+        self.assertThat(d, succeeded(Is(None)))
+        self.assertThat(
+            b''.join(self.consumer.written),
+            Equals(b'data: a\n\nid: 1\ndata: b\n\ndata: c\n\ndata: d\n\n'))
+
+    def test_source_failure(self):
+        """
+        If the source fails the body fails.
+        """
+        pending = Deferred()
+        stream = self.stream(iter([pending]))
+        d = write_body(self.consumer, stream)
+        pending.errback(RuntimeError('nope'))
+        self.assertThat(d, failed(After(lambda f: f.type, Is(RuntimeError))))
+
+
+class EventStreamResponseTests(TestCase):
+    """
+    Tests for `event_stream_response`.
+    """
+    def test_response(self):
+        """
+        The response streams events, and is left alone by
+        `compress_response`.
+        """
+        stream = EventStream(clock=Clock())
+        response = event_stream_response(stream, [(b'X-Foo', b'bar')])
+        self.assertThat(
+            response,
+            ContainsDict({
+                'status': Equals(200),
+                'body': Is(stream),
+                'headers': ContainsDict({
+                    b'Content-Type': Equals(
+                        [b'text/event-stream; charset=utf-8']),
+                    b'X-Foo': Equals([b'bar'])})}))
+        self.assertThat(
+            _encode_response(
+                {'headers': {b'Accept-Encoding': b'gzip'}},
+                response, (b'gzip',), 0, 6, lambda _: True),
+            Equals(response))
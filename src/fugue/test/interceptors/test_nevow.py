@@ -1,10 +1,11 @@
 from hyperlink import URL
 from testtools import TestCase, try_import
 from testtools.matchers import AfterPreprocessing as After
-from testtools.matchers import ContainsDict, Equals, Is
+from testtools.matchers import ContainsDict, Equals, Is, IsInstance
 from twisted.web.test.requesthelper import DummyChannel
 
 from fugue.interceptors.nevow import _nevow_request_to_request_map
+from fugue.lazy import LazyMap
 from fugue.test.util import depends_on
 from fugue.util import url_path
 
@@ -138,3 +139,26 @@ class NevowRequestToRequestMapTests(TestCase):
                     lambda x: x.read(),
                     Equals(b'hello')),
                 'content_length': Equals(5)}))
+
+    @depends_on('nevow')
+    def test_lazy(self):
+        """
+        Values are only computed on first access, and only once, and the
+        request map can be updated like any other without computing them.
+        """
+        request = fake_nevow_request(uri=u'http://example.com:5144/one')
+        calls = []
+        get_client_ip = request.getClientIP
+        request.getClientIP = lambda: calls.append(1) or get_client_ip()
+        request_map = _nevow_request_to_request_map(request)
+        self.assertThat(request_map, IsInstance(LazyMap))
+        request_map = (
+            request_map
+            .set('path_params', {})
+            .transform(['server_port'], lambda port: port + 1))
+        self.assertThat(calls, Equals([]))
+        self.assertThat(request_map['server_port'], Equals(5145))
+        self.assertThat(request_map['path_info'], Equals(u'/one'))
+        for _ in range(2):
+            self.assertThat(request_map['remote_addr'], Equals(b'192.168.1.1'))
+        self.assertThat(calls, Equals([1]))
@@ -0,0 +1,223 @@
+from io import BytesIO
+
+from testtools import TestCase
+from testtools.matchers import AfterPreprocessing as After
+from testtools.matchers import Equals, HasLength, Is
+from testtools.twistedsupport import failed, has_no_result, succeeded
+from twisted.internet.defer import Deferred
+from twisted.internet.error import ConnectionLost
+from twisted.internet.task import Cooperator
+from twisted.web.client import FileBodyProducer
+
+from fugue.interceptors._producers import write_body
+
+
+class FakeConsumer(object):
+    """
+    Consumer that records writes and can pause its producer after a number of
+    writes.
+    """
+    def __init__(self, pause_after=None):
+        self.written = []
+        self.producer = None
+        self.unregistered = False
+        self.pause_after = pause_after
+
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+        self.streaming = streaming
+
+    def unregisterProducer(self):
+        self.unregistered = True
+
+    def write(self, data):
+        self.written.append(data)
+        if (self.pause_after is not None and
+                len(self.written) % self.pause_after == 0):
+            self.producer.pauseProducing()
+
+
+class _Closeable(object):
+    """
+    Iterable that records being closed.
+    """
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if not self.chunks:
+            raise StopIteration()
+        chunk = self.chunks.pop(0)
+        if isinstance(chunk, Exception):
+            raise chunk
+        return chunk
+
+    def close(self):
+        self.closed = True
+
+
+class WriteBodyTests(TestCase):
+    """
+    Tests for `write_body`.
+    """
+    def test_bytes(self):
+        """
+        `bytes` are written immediately, ``None`` writes nothing.
+        """
+        consumer = FakeConsumer()
+        self.assertThat(write_body(consumer, b'hello'), succeeded(Is(None)))
+        self.assertThat(write_body(consumer, None), succeeded(Is(None)))
+        self.assertThat(consumer.written, Equals([b'hello']))
+        self.assertThat(consumer.producer, Is(None))
+
+    def test_unsupported(self):
+        """
+        Bodies that cannot be written raise `TypeError`.
+        """
+        for body in [u'text', 42]:
+            self.assertRaises(TypeError, write_body, FakeConsumer(), body)
+
+    def test_iterable(self):
+        """
+        Iterables are written chunk by chunk, only while the consumer has not
+        paused the producer, and closed once exhausted.
+        """
+        consumer = FakeConsumer(pause_after=2)
+        body = _Closeable([b'a', b'', b'b', b'c', b'd'])
+        d = write_body(consumer, body)
+        self.assertThat(consumer.streaming, Equals(True))
+        self.assertThat(consumer.written, Equals([b'a', b'b']))
+        self.assertThat(d, has_no_result())
+        consumer.producer.resumeProducing()
+        self.assertThat(consumer.written, Equals([b'a', b'b', b'c', b'd']))
+        self.assertThat(d, has_no_result())
+        consumer.producer.resumeProducing()
+        self.assertThat(d, succeeded(Is(None)))
+        self.assertThat(body.closed, Equals(True))
+        self.assertThat(consumer.unregistered, Equals(True))
+
+    def test_iterable_failure(self):
+        """
+        If iterating fails, the result fails with the error.
+        """
+        body = _Closeable([b'a', RuntimeError('nope')])
+        self.assertThat(
+            write_body(FakeConsumer(), body),
+            failed(After(lambda f: f.type, Is(RuntimeError))))
+        self.assertThat(body.closed, Equals(True))
+
+    def test_stop_producing(self):
+        """
+        If the consumer stops the producer, iteration stops and the result
+        fails with `ConnectionLost`.
+        """
+        consumer = FakeConsumer(pause_after=1)
+        body = _Closeable([b'a', b'b'])
+        d = write_body(consumer, body)
+        consumer.producer.stopProducing()
+        self.assertThat(
+            d,
+            failed(After(lambda f: f.type, Is(ConnectionLost))))
+        self.assertThat(consumer.written, Equals([b'a']))
+        self.assertThat(body.closed, Equals(True))
+        self.assertThat(consumer.unregistered, Equals(False))
+
+    def test_deferred_chunks(self):
+        """
+        Chunks that are `Deferred`s are written once they fire, and the next
+        chunk is only pulled afterwards.
+        """
+        consumer = FakeConsumer()
+        first, second = Deferred(), Deferred()
+        body = _Closeable([b'a', first, second, b'd'])
+        d = write_body(consumer, body)
+        self.assertThat(consumer.written, Equals([b'a']))
+        self.assertThat(body.chunks, Equals([second, b'd']))
+        first.callback(b'b')
+        self.assertThat(consumer.written, Equals([b'a', b'b']))
+        consumer.producer.pauseProducing()
+        second.callback(b'c')
+        self.assertThat(consumer.written, Equals([b'a', b'b', b'c']))
+        self.assertThat(d, has_no_result())
+        consumer.producer.resumeProducing()
+        self.assertThat(d, succeeded(Is(None)))
+        self.assertThat(consumer.written, Equals([b'a', b'b', b'c', b'd']))
+        self.assertThat(body.closed, Equals(True))
+
+    def test_deferred_chunk_failure(self):
+        """
+        If a `Deferred` chunk fails, the result fails with its error.
+        """
+        chunk = Deferred()
+        body = _Closeable([chunk, b'b'])
+        d = write_body(FakeConsumer(), body)
+        chunk.errback(RuntimeError('nope'))
+        self.assertThat(d, failed(After(lambda f: f.type, Is(RuntimeError))))
+        self.assertThat(body.closed, Equals(True))
+
+    def test_stop_while_waiting(self):
+        """
+        Stopping the producer while waiting for a chunk cancels it.
+        """
+        consumer = FakeConsumer()
+        cancelled = []
+        d = write_body(
+            consumer, _Closeable([Deferred(cancelled.append), b'b']))
+        consumer.producer.stopProducing()
+        self.assertThat(
+            d, failed(After(lambda f: f.type, Is(ConnectionLost))))
+        self.assertThat(cancelled, HasLength(1))
+        self.assertThat(consumer.written, Equals([]))
+
+    def test_cancel(self):
+        """
+        Cancelling the result stops the producer.
+        """
+        cancelled = []
+        d = write_body(
+            FakeConsumer(), _Closeable([Deferred(cancelled.append)]))
+        d.cancel()
+        self.assertThat(
+            d, failed(After(lambda f: f.type, Is(ConnectionLost))))
+        self.assertThat(cancelled, HasLength(1))
+
+    def test_file(self):
+        """
+        File-like objects are written by a pull producer, and closed once
+        written.
+        """
+        consumer = FakeConsumer()
+        fileobj = BytesIO(b'x' * (2 ** 15))
+        d = write_body(consumer, fileobj)
+        self.assertThat(consumer.streaming, Equals(False))
+        while not consumer.unregistered:
+            consumer.producer.resumeProducing()
+        self.assertThat(d, succeeded(Is(None)))
+        self.assertThat(consumer.written, HasLength(2))
+        self.assertThat(b''.join(consumer.written), Equals(b'x' * (2 ** 15)))
+        self.assertThat(fileobj.closed, Equals(True))
+
+    def test_body_producer(self):
+        """
+        `IBodyProducer` providers are registered with, and write to, the
+        consumer.
+        """
+        work = []
+        cooperator = Cooperator(
+            scheduler=lambda f: work.append(f) or object(),
+            started=False)
+        cooperator.start()
+        consumer = FakeConsumer()
+        producer = FileBodyProducer(
+            BytesIO(b'hello'), cooperator=cooperator, readSize=2)
+        d = write_body(consumer, producer)
+        self.assertThat(consumer.producer, Is(producer))
+        while work:
+            work.pop()()
+        self.assertThat(d, succeeded(Is(None)))
+        self.assertThat(consumer.written, Equals([b'he', b'll', b'o']))
+        self.assertThat(consumer.unregistered, Equals(True))
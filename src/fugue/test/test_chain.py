@@ -2,13 +2,16 @@ from pyrsistent import dq, m, v
 from testtools import TestCase
 from testtools.matchers import AfterPreprocessing as After
 from testtools.matchers import (
-    AllMatch, Contains, ContainsDict, Equals, Is, MatchesStructure, Not)
+    AllMatch, Contains, ContainsDict, Equals, HasLength, Is, MatchesStructure,
+    Not)
 from testtools.twistedsupport import failed, has_no_result, succeeded
-from twisted.internet.defer import fail
+from twisted.internet.defer import Deferred, fail
 from twisted.internet.task import Clock, deferLater
 
+from fugue._keys import DEADLINE
 from fugue.chain import (
-    enqueue, execute, QUEUE, terminate, terminate_when, TERMINATORS)
+    Deadline, DeadlineExceeded, enqueue, execute, QUEUE, terminate,
+    terminate_when, TERMINATORS)
 from fugue.interceptors import around
 from fugue.util import constantly
 
@@ -335,3 +338,75 @@ class ExecuteTests(TestCase):
                                     ('enter', 'b'),
                                     ('leave', 'b'),
                                     ('leave', 'a')))})))
+
+    def test_deadline_passed(self):
+        """
+        "enter" stages that begin after the context's deadline fail with
+        `DeadlineExceeded`, without being called.
+        """
+        clock = Clock()
+        interceptors = [
+            tracer('a').set(
+                'error',
+                lambda context, error: trace(
+                    context, 'error', error.failure.type)),
+            around(lambda context: clock.advance(2) or context,
+                   lambda context: trace(context, 'leave', 'b')),
+            tracer('c')]
+        context = empty_context.set(
+            DEADLINE, Deadline(expires=2, clock=clock))
+        self.assertThat(
+            execute(context, interceptors),
+            succeeded(
+                Traced(
+                    Equals(v(('enter', 'a'),
+                             ('error', DeadlineExceeded))))))
+
+    def test_deadline_cancels(self):
+        """
+        An asynchronous "enter" stage that does not complete before the
+        context's deadline is cancelled, and fails with `DeadlineExceeded`.
+        """
+        clock = Clock()
+        cancelled = []
+        interceptors = [
+            tracer('a'),
+            around(lambda context: Deferred(cancelled.append), None),
+            tracer('c')]
+        context = empty_context.set(
+            DEADLINE, Deadline(expires=5, clock=clock))
+        d = execute(context, interceptors)
+        clock.advance(4)
+        self.assertThat(d, has_no_result())
+        clock.advance(1)
+        self.assertThat(cancelled, HasLength(1))
+        self.assertThat(
+            d,
+            failed(After(lambda f: f.type, Is(DeadlineExceeded))))
+        self.assertThat(clock.getDelayedCalls(), Equals([]))
+
+    def test_deadline_met(self):
+        """
+        An asynchronous "enter" stage that completes before the context's
+        deadline is not affected by it.
+        """
+        clock = Clock()
+        pending = Deferred()
+        interceptors = [
+            tracer('a'),
+            around(lambda context: pending.addCallback(lambda _: context),
+                   None),
+            tracer('c')]
+        context = empty_context.set(
+            DEADLINE, Deadline(expires=5, clock=clock))
+        d = execute(context, interceptors)
+        clock.advance(4)
+        pending.callback(None)
+        self.assertThat(clock.getDelayedCalls(), Equals([]))
+        clock.advance(1)
+        self.assertThat(
+            d,
+            succeeded(
+                ContainsDict({
+                    TRACE: Equals(v(('enter', 'a'), ('enter', 'c'),
+                                    ('leave', 'c'), ('leave', 'a')))})))
@@ -0,0 +1,121 @@
+import json
+
+from pyrsistent import m, pmap, v
+from testtools import TestCase
+from testtools.matchers import Equals, Is, IsInstance
+
+from fugue.json_backend import (
+    BACKENDS, DEFAULT_BACKEND, get_backend, JSONBackend, select_backend)
+
+
+class BackendTests(TestCase):
+    """
+    Tests for the individual `JSONBackend` implementations.
+    """
+    def backends(self):
+        """
+        Every backend available in this environment.
+        """
+        backends = []
+        for factory in BACKENDS.values():
+            try:
+                backends.append(factory())
+            except ImportError:
+                pass
+        return backends
+
+    def test_loads(self):
+        """
+        Backends decode ``bytes`` in the given encoding, or ``unicode``, into
+        the same values the standard library does.
+        """
+        data = u'{"a": [1, 2.5, null, true], "b": "\N{SNOWMAN}"}'
+        expected = {u'a': [1, 2.5, None, True], u'b': u'\N{SNOWMAN}'}
+        for backend in self.backends():
+            self.assertThat(
+                backend.loads(data.encode('utf-8')),
+                Equals(expected))
+            self.assertThat(
+                backend.loads(data.encode('utf-16'), 'utf-16'),
+                Equals(expected))
+            self.assertThat(
+                backend.loads(data),
+                Equals(expected))
+            self.assertThat(
+                type(backend.loads(b'"a"')),
+                Is(unicode))
+
+    def test_loads_invalid(self):
+        """
+        Backends raise `ValueError` for invalid documents.
+        """
+        for backend in self.backends():
+            self.assertRaises(ValueError, backend.loads, b'{')
+
+    def test_dumps(self):
+        """
+        Backends encode to ASCII ``bytes``, calling ``default`` for values
+        they cannot otherwise encode.
+        """
+        def _default(obj):
+            if isinstance(obj, type(m())):
+                return dict(obj)
+            elif isinstance(obj, type(v())):
+                return list(obj)
+            raise TypeError(obj)
+        for backend in self.backends():
+            result = backend.dumps(
+                pmap({u'a': v(1, u'\N{SNOWMAN}')}), default=_default)
+            self.assertThat(result, IsInstance(bytes))
+            self.assertThat(
+                json.loads(result),
+                Equals({u'a': [1, u'\N{SNOWMAN}']}))
+            self.assertRaises(TypeError, backend.dumps, object(), _default)
+
+
+class SelectBackendTests(TestCase):
+    """
+    Tests for `select_backend` and `get_backend`.
+    """
+    def test_fallback(self):
+        """
+        Unavailable backends are skipped, falling back to the standard
+        library.
+        """
+        def _unavailable():
+            raise ImportError('nope')
+        BACKENDS['unavailable'] = _unavailable
+        self.addCleanup(BACKENDS.pop, 'unavailable')
+        self.assertThat(
+            select_backend(['unavailable', 'json']).name,
+            Equals('json'))
+        self.assertThat(
+            select_backend(['unavailable']).name,
+            Equals('json'))
+
+    def test_default(self):
+        """
+        By default the standard library encodes, on CPython the fastest
+        available backend decodes.
+        """
+        simplejson = JSONBackend(
+            name='simplejson', loads=lambda *a: None, dumps=lambda *a: b'')
+        self.addCleanup(
+            BACKENDS.__setitem__, 'simplejson', BACKENDS['simplejson'])
+        BACKENDS['simplejson'] = lambda: simplejson
+        backend = select_backend()
+        self.assertThat(backend.name, Equals('simplejson+json'))
+        self.assertThat(backend.loads, Is(simplejson.loads))
+        self.assertThat(backend.dumps([1]), Equals(b'[1]'))
+
+    def test_get_backend(self):
+        """
+        Backends can be specified by name or value, ``None`` is the default
+        backend.
+        """
+        backend = JSONBackend(
+            name='test', loads=lambda *a: None, dumps=lambda *a: b'')
+        self.assertThat(get_backend(), Is(DEFAULT_BACKEND))
+        self.assertThat(get_backend(backend), Is(backend))
+        self.assertThat(get_backend('json').name, Equals('json'))
+        self.assertRaises(KeyError, get_backend, 'unknown')
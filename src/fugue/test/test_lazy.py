@@ -0,0 +1,229 @@
+from pyrsistent import discard, freeze, m, ny, pmap, pvector, v
+from testtools import ExpectedException, TestCase
+from testtools.matchers import Equals, Is, IsInstance, Not
+
+from fugue.lazy import (
+    delay, FrozenMapView, FrozenVectorView, lazy_freeze, lazy_thaw, LazyMap)
+
+
+class LazyFreezeTests(TestCase):
+    """
+    Tests for `lazy_freeze`.
+    """
+    def data(self):
+        return {
+            u'a': 1,
+            u'b': [2, {u'c': 3}],
+            u'd': {u'e': [4]}}
+
+    def test_wrap(self):
+        """
+        Dictionaries and lists are wrapped in views, anything else is frozen.
+        """
+        self.assertThat(
+            lazy_freeze({}),
+            IsInstance(FrozenMapView))
+        self.assertThat(
+            lazy_freeze([]),
+            IsInstance(FrozenVectorView))
+        self.assertThat(
+            lazy_freeze(42),
+            Equals(42))
+        self.assertThat(
+            lazy_freeze(set([1])),
+            Equals(freeze(set([1]))))
+
+    def test_nested(self):
+        """
+        Nested containers are wrapped on access, and the same view is returned
+        for subsequent access.
+        """
+        view = lazy_freeze(self.data())
+        self.assertThat(view[u'a'], Equals(1))
+        self.assertThat(view[u'b'], IsInstance(FrozenVectorView))
+        self.assertThat(view[u'b'][1], IsInstance(FrozenMapView))
+        self.assertThat(view[u'b'][-1], Is(view[u'b'][1]))
+        self.assertThat(view[u'd'], Is(view[u'd']))
+        self.assertThat(view.get(u'z'), Is(None))
+        self.assertThat(sorted(view), Equals([u'a', u'b', u'd']))
+        self.assertThat(len(view[u'b']), Equals(2))
+        self.assertThat(list(view[u'b'][:1]), Equals([2]))
+
+    def test_equality(self):
+        """
+        Views compare, and hash, equal to their frozen equivalents.
+        """
+        data = self.data()
+        view = lazy_freeze(data)
+        self.assertThat(view, Equals(freeze(data)))
+        self.assertThat(freeze(data), Equals(view))
+        self.assertThat(view, Equals(lazy_freeze(self.data())))
+        self.assertThat(view, Not(Equals(freeze({}))))
+        self.assertThat(lazy_freeze([1, 2]), Equals(v(1, 2)))
+        self.assertThat(lazy_freeze([1, 2]), Not(Equals(v(1))))
+        self.assertThat(hash(view), Equals(hash(freeze(data))))
+
+    def test_freeze(self):
+        """
+        Views can be fully frozen, operations that produce a new structure
+        produce a frozen one.
+        """
+        view = lazy_freeze(self.data())
+        self.assertThat(view.freeze(), IsInstance(type(pmap())))
+        self.assertThat(
+            view.set(u'a', 5),
+            Equals(freeze(self.data()).set(u'a', 5)))
+        self.assertThat(
+            view.transform([u'd', u'e', 0], 5)[u'd'],
+            Equals(pmap({u'e': v(5)})))
+        self.assertThat(
+            lazy_freeze([1]).append(2),
+            Equals(pvector([1, 2])))
+
+
+class LazyThawTests(TestCase):
+    """
+    Tests for `lazy_thaw`.
+    """
+    def test_thaw(self):
+        """
+        Views are unwrapped into their underlying structure, anything else is
+        returned as it is.
+        """
+        data = {u'a': [1, 2]}
+        view = lazy_freeze(data)
+        self.assertThat(lazy_thaw(view), Is(data))
+        self.assertThat(lazy_thaw(view[u'a']), Is(data[u'a']))
+        frozen = freeze(data)
+        self.assertThat(lazy_thaw(frozen), Is(frozen))
+
+
+class DelayTests(TestCase):
+    """
+    Tests for `delay`.
+    """
+    def test_memoize(self):
+        """
+        The function is only called once, and only when the result is needed.
+        """
+        calls = []
+        d = delay(lambda: calls.append(1) or len(calls))
+        self.assertThat(calls, Equals([]))
+        self.assertThat(d(), Equals(1))
+        self.assertThat(d(), Equals(1))
+        self.assertThat(delay(d), Is(d))
+
+    def test_exception(self):
+        """
+        Exceptions are remembered too.
+        """
+        calls = []
+
+        def _f():
+            calls.append(1)
+            raise ValueError('Nope')
+        d = delay(_f)
+        for _ in range(2):
+            with ExpectedException(ValueError, 'Nope'):
+                d()
+        self.assertThat(calls, Equals([1]))
+
+
+class LazyMapTests(TestCase):
+    """
+    Tests for `LazyMap`.
+    """
+    def lazy_map(self, calls):
+        def _thunk(key, value):
+            def _thunk_inner():
+                calls.append(key)
+                if value is None:
+                    raise KeyError(key)
+                return value
+            return _thunk_inner
+        return LazyMap(
+            m(a=1),
+            {'b': _thunk('b', 2), 'c': _thunk('c', None)})
+
+    def test_access(self):
+        """
+        Lazy values are computed on first access, and only once.
+        """
+        calls = []
+        lazy_map = self.lazy_map(calls)
+        self.assertThat(lazy_map['a'], Equals(1))
+        self.assertThat(lazy_map.a, Equals(1))
+        self.assertThat(calls, Equals([]))
+        self.assertThat(lazy_map['b'], Equals(2))
+        self.assertThat(lazy_map.get('b'), Equals(2))
+        self.assertThat(calls, Equals(['b']))
+
+    def test_absent(self):
+        """
+        Lazy values that raise `KeyError` are absent from the map.
+        """
+        lazy_map = self.lazy_map([])
+        self.assertThat(lazy_map.get('c'), Is(None))
+        self.assertThat('c' in lazy_map, Equals(False))
+        self.assertThat('b' in lazy_map, Equals(True))
+        self.assertThat(len(lazy_map), Equals(2))
+        self.assertThat(sorted(lazy_map), Equals(['a', 'b']))
+        self.assertThat(lazy_map, Equals(m(a=1, b=2)))
+        self.assertThat(m(a=1, b=2), Equals(lazy_map))
+        self.assertThat(hash(lazy_map), Equals(hash(m(a=1, b=2))))
+        with ExpectedException(AttributeError):
+            lazy_map.c
+
+    def test_update(self):
+        """
+        Updating the map does not compute lazy values unnecessarily, and
+        derived maps share computed values.
+        """
+        calls = []
+        lazy_map = self.lazy_map(calls)
+        lazy_map2 = lazy_map.set('a', 3).set('d', 4).discard('c')
+        self.assertThat(calls, Equals([]))
+        self.assertThat(lazy_map2, Equals(m(a=3, b=2, d=4)))
+        self.assertThat(lazy_map['b'], Equals(2))
+        self.assertThat(calls, Equals(['b']))
+        self.assertThat(
+            lazy_map.set('b', 5).update(m(e=6)),
+            Equals(m(a=1, b=5, e=6)))
+        self.assertThat(
+            lazy_map.set_lazy('a', lambda: 7)['a'],
+            Equals(7))
+        with ExpectedException(KeyError):
+            lazy_map.remove('c')
+
+    def test_transform(self):
+        """
+        Transformations only compute the lazy values along their paths.
+        """
+        calls = []
+        lazy_map = self.lazy_map(calls).set('d', m(e=1))
+        result = lazy_map.transform(
+            ['d', 'e'], lambda x: x + 1,
+            ['f'], 5)
+        self.assertThat(result, IsInstance(LazyMap))
+        self.assertThat(calls, Equals([]))
+        self.assertThat(result['d'], Equals(m(e=2)))
+        self.assertThat(result['f'], Equals(5))
+        self.assertThat(
+            lazy_map.transform(['b'], lambda x: x * 10)['b'],
+            Equals(20))
+        self.assertThat(calls, Equals(['b']))
+
+    def test_transform_matchers(self):
+        """
+        Transformations can discard keys, and use matchers, which compute
+        every lazy value.
+        """
+        calls = []
+        lazy_map = self.lazy_map(calls)
+        result = lazy_map.transform(['b'], discard)
+        self.assertThat(calls, Equals(['b']))
+        self.assertThat(result, Equals(m(a=1)))
+        self.assertThat(
+            lazy_map.transform([ny], lambda x: x * 10),
+            Equals(m(a=10, b=20)))
+        self.assertThat(calls, Equals(['b', 'c']))